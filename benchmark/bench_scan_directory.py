@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Benchmark stat cost of building directory records.
+#
+# Compare the old per-path stat series (isfile/isdir/islink/getsize/getmtime/getctime/getatime)
+# with get_path_stat, which reuses the stat cached on os.DirEntry.
+#
+# Run it from the file-manager directory:
+#
+#     python3 benchmark/bench_scan_directory.py --entries 10000
+#
+# Syscall numbers are collected with strace when it is installed.
+
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+def legacy_stat(file_path):
+    # Same stat series as the old get_file_info.
+    if os.path.isfile(file_path):
+        file_bytes = os.path.getsize(file_path)
+    elif os.path.isdir(file_path):
+        file_bytes = 0
+    elif os.path.islink(file_path):
+        file_bytes = 1
+
+    times = []
+    for getter in (os.path.getmtime, os.path.getctime, os.path.getatime):
+        try:
+            times.append(getter(file_path))
+        except OSError:
+            times.append(0)
+
+    return times
+
+def scan_legacy(path):
+    with os.scandir(path) as entries:
+        for entry in entries:
+            legacy_stat(entry.path)
+
+def scan_single_stat(path):
+    from eaf_file_manager_listing import get_path_stat
+
+    with os.scandir(path) as entries:
+        for entry in entries:
+            get_path_stat(entry.path, entry)
+
+SCANNERS = {
+    "legacy": scan_legacy,
+    "scanner": scan_single_stat,
+}
+
+def create_tree(root, entries):
+    for i in range(entries):
+        kind = i % 10
+        path = os.path.join(root, "entry-{:07d}".format(i))
+        if kind == 0:
+            os.mkdir(path)
+        elif kind == 1:
+            os.symlink(os.path.join(root, "entry-{:07d}".format(i - 1)), path)
+        elif kind == 2:
+            os.symlink(os.path.join(root, "missing-{}".format(i)), path)
+        else:
+            with open(path, "w") as f:
+                f.write("x" * (i % 512))
+
+def count_syscalls(scanner, path):
+    strace = shutil.which("strace")
+    if strace is None:
+        return None
+
+    with tempfile.NamedTemporaryFile("r", suffix=".strace") as output:
+        subprocess.run([strace, "-f", "-c", "-o", output.name,
+                        sys.executable, os.path.abspath(__file__), "--run", scanner, "--dir", path],
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        summary = output.read()
+
+    match = re.search(r"^\s*100\.00\s+\S+\s+\S+\s+(\d+)", summary, re.MULTILINE)
+    return int(match.group(1)) if match else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark stat cost of directory scanning.")
+    parser.add_argument("--entries", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--run", choices=SCANNERS.keys())
+    parser.add_argument("--dir")
+    args = parser.parse_args()
+
+    if args.run:
+        # Child mode, used under strace.
+        SCANNERS[args.run](args.dir)
+        return
+
+    with tempfile.TemporaryDirectory() as root:
+        empty_dir = os.path.join(root, "empty")
+        tree_dir = os.path.join(root, "tree")
+        os.mkdir(empty_dir)
+        os.mkdir(tree_dir)
+        create_tree(tree_dir, args.entries)
+
+        per_10k = 10000 / max(args.entries, 1)
+
+        print("{} entries, per 10k entries:".format(args.entries))
+        for name, scanner in SCANNERS.items():
+            scanner(tree_dir)    # warm up dentry cache
+
+            start = time.perf_counter()
+            for _ in range(args.rounds):
+                scanner(tree_dir)
+            wall = (time.perf_counter() - start) / args.rounds
+
+            syscalls = count_syscalls(name, tree_dir)
+            baseline = count_syscalls(name, empty_dir)
+            if syscalls is None or baseline is None:
+                syscall_text = "n/a (strace not found)"
+            else:
+                syscall_text = "{:.0f}".format((syscalls - baseline) * per_10k)
+
+            print("  {:8} wall {:8.2f} ms    syscalls {}".format(name, wall * 1000 * per_10k, syscall_text))
+
+if __name__ == "__main__":
+    main()
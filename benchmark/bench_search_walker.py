@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Benchmark file search without fd on a generated tree.
+#
+# Compare the old single thread os.walk search (fnmatch and time.time for every name)
+# with ParallelWalker at different numbers of workers.
+#
+# Run it from the file-manager directory:
+#
+#     python3 benchmark/bench_search_walker.py --files 200000 --workers 1 2 4 8
+#
+# Results of a warm page cache mostly show Python overhead, run with --dir on a network file system
+# or after dropping caches (echo 3 > /proc/sys/vm/drop_caches) to see the effect of parallel directory reads.
+
+import argparse
+import fnmatch
+import os
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+def search_legacy(root, pattern):
+    # Same walk as the old PythonSearchThread.run.
+    filter_file = lambda name: not name.startswith(".")
+    file_paths = []
+    start_time = time.time()
+
+    for (dir, dirs, files) in os.walk(root):
+        for name in files + dirs:
+            if fnmatch.fnmatch(name, pattern) and filter_file(name):
+                file_paths.append(os.path.join(dir, name))
+
+                if (time.time() - start_time) > 0.3:
+                    start_time = time.time()
+
+        dirs[:] = [name for name in dirs if filter_file(name)]
+
+    return len(file_paths)
+
+def search_parallel(root, pattern, workers):
+    from eaf_file_manager_search import ParallelWalker
+
+    walker = ParallelWalker(root, pattern, show_hidden_file=False, workers=workers)
+    return sum(len(file_paths) for file_paths in walker.walk())
+
+def create_tree(root, files, fanout):
+    # Directories of fanout children, each leaf directory holds fanout files.
+    leaves = [root]
+    while len(leaves) * fanout < files:
+        next_leaves = []
+        for leaf in leaves:
+            for i in range(fanout):
+                path = os.path.join(leaf, "dir{:02d}".format(i))
+                os.mkdir(path)
+                next_leaves.append(path)
+        leaves = next_leaves
+
+    extensions = [".py", ".c", ".h", ".txt", ".md"]
+    number = 0
+    for leaf in leaves:
+        for i in range(fanout):
+            if number >= files:
+                return
+            with open(os.path.join(leaf, "file{:06d}{}".format(number, extensions[number % len(extensions)])), "w"):
+                pass
+            number += 1
+
+def measure(callback, rounds):
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = callback()
+        times.append(time.perf_counter() - start)
+
+    return (min(times), result)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark file search walker.")
+    parser.add_argument("--files", type=int, default=200000)
+    parser.add_argument("--fanout", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--pattern", default="*.py")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--dir", help="search existing directory instead of generated tree")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if args.dir:
+            root = args.dir
+        else:
+            root = temp_dir
+            create_tree(root, args.files, args.fanout)
+
+        (wall, matches) = measure(lambda: search_legacy(root, args.pattern), args.rounds)
+        print("{} matches of '{}' in {}".format(matches, args.pattern, root))
+        print("  {:12} {:8.1f} ms".format("os.walk", wall * 1000))
+
+        for workers in args.workers:
+            (wall, parallel_matches) = measure(lambda: search_parallel(root, args.pattern, workers), args.rounds)
+            print("  {:12} {:8.1f} ms{}".format("{} workers".format(workers), wall * 1000,
+                                                "" if parallel_matches == matches else "  ({} matches)".format(parallel_matches)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Benchmark payload size and encode/decode time of file infos sent to the web page.
+#
+# Compare the old list of dicts with the compact payload of encode_file_infos.
+# JavaScript decode time is measured with node (src/fileInfos.js) when node is installed.
+#
+# Run it from the file-manager directory:
+#
+#     python3 benchmark/bench_wire_format.py --entries 10000 100000 500000
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+NODE_DECODE_SCRIPT = """
+import fs from "fs";
+import { decodeFiles } from "%s";
+
+const [legacyPath, compactPath] = process.argv.slice(1);
+
+function measure(callback) {
+  const start = process.hrtime.bigint();
+  const result = callback();
+  return [Number(process.hrtime.bigint() - start) / 1e6, result];
+}
+
+const legacyText = fs.readFileSync(legacyPath, "utf8");
+const compactText = fs.readFileSync(compactPath, "utf8");
+
+const [legacyTime] = measure(() => JSON.parse(legacyText));
+const [compactTime, files] = measure(() => decodeFiles(JSON.parse(compactText)));
+/* Rows are decoded lazily, also measure reading a screen of rows. */
+const [screenTime] = measure(() => files.slice(0, 100).map(file => [file.path, file.name, file.icon, file.info]));
+
+console.log(JSON.stringify([legacyTime, compactTime, screenTime]));
+"""
+
+def create_file_infos(directory, entries):
+    extensions = [".py", ".js", ".txt", ".png", ".json", ".md", ""]
+    file_infos = []
+
+    for i in range(entries):
+        is_dir = i % 10 == 0
+        extension = "" if is_dir else extensions[i % len(extensions)]
+        name = "build-artifact-{:07d}{}".format(i, extension)
+
+        file_infos.append({
+            "path": os.path.join(directory, name),
+            "name": name,
+            "extension": extension,
+            "type": "directory" if is_dir else "file",
+            "bytes": i * 37 % 100000,
+            "info": "{:.1f}KB".format(i * 37 % 100000 / 1024),
+            "mark": "",
+            "changed": "",
+            "match": "",
+            "icon": "directory.png" if is_dir else "text-{}.png".format(extension[1:] or "plain"),
+            "mtime": 1700000000.123456 + i,
+            "ctime": 1700000000.654321 + i,
+            "atime": 1700000000.111111 + i
+        })
+
+    return file_infos
+
+def measure(callback):
+    start = time.perf_counter()
+    result = callback()
+    return ((time.perf_counter() - start) * 1000, result)
+
+def node_decode_times(legacy_text, compact_text):
+    node = shutil.which("node")
+    if node is None:
+        return None
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        legacy_path = os.path.join(temp_dir, "legacy.json")
+        compact_path = os.path.join(temp_dir, "compact.json")
+        with open(legacy_path, "w") as f:
+            f.write(legacy_text)
+        with open(compact_path, "w") as f:
+            f.write(compact_text)
+
+        script = NODE_DECODE_SCRIPT % os.path.join(APP_DIR, "src", "fileInfos.js")
+        output = subprocess.run([node, "--input-type=module", "-e", script, legacy_path, compact_path],
+                                check=True, capture_output=True, text=True).stdout
+
+    return json.loads(output)
+
+def main():
+    from eaf_file_manager_listing import encode_file_infos
+
+    parser = argparse.ArgumentParser(description="Benchmark file infos wire format.")
+    parser.add_argument("--entries", type=int, nargs="+", default=[10000, 100000, 500000])
+    args = parser.parse_args()
+
+    directory = "/home/user/project/build/artifacts"
+
+    for entries in args.entries:
+        file_infos = create_file_infos(directory, entries)
+
+        (legacy_encode, legacy_text) = measure(lambda: json.dumps(file_infos))
+        (compact_encode, compact_text) = measure(lambda: json.dumps(encode_file_infos(file_infos, directory)))
+        (legacy_decode, _) = measure(lambda: json.loads(legacy_text))
+        (compact_decode, _) = measure(lambda: json.loads(compact_text))
+
+        print("{} entries:".format(entries))
+        print("  legacy   {:12,} bytes  encode {:8.1f} ms  python decode {:8.1f} ms".format(
+            len(legacy_text.encode()), legacy_encode, legacy_decode))
+        print("  compact  {:12,} bytes  encode {:8.1f} ms  python decode {:8.1f} ms".format(
+            len(compact_text.encode()), compact_encode, compact_decode))
+
+        node_times = node_decode_times(legacy_text, compact_text)
+        if node_times is None:
+            print("  js decode: n/a (node not found)")
+        else:
+            print("  js decode: legacy {:.1f} ms, compact {:.1f} ms (+{:.2f} ms to read first screen)".format(*node_times))
+
+if __name__ == "__main__":
+    main()
@@ -19,24 +19,43 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import copy
+import collections
+import functools
+import itertools
 import json
 import os
 import re
+import selectors
 import shutil
 import subprocess
+import sys
 import tarfile
 import time
 from pathlib import Path
 
 from core.utils import *
 from core.webengine import BrowserBuffer
-from pygments import highlight
-from pygments.formatters import HtmlFormatter
-from pygments.lexers import PythonLexer, get_lexer_for_filename, html
 from PyQt6 import QtCore
-from PyQt6.QtCore import QFileSystemWatcher, QMimeDatabase, QThread, QTimer
-from PyQt6.QtGui import QColor, QIcon
+from PyQt6.QtCore import QFileSystemWatcher, QThread, QTimer
+from PyQt6.QtGui import QColor
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from eaf_file_manager_archive import ARCHIVE_INDEX, ARCHIVE_PREVIEW_PAGE_SIZE
+from eaf_file_manager_icons import ICON_SERVICE, MIME_RESOLVER, THUMBNAIL_BATCH_SIZE, THUMBNAIL_EXECUTOR, THUMBNAIL_SERVICE
+from eaf_file_manager_index import FilenameIndexService
+from eaf_file_manager_listing import (DIRECTORY_LISTING_CACHE, FILE_SORT_KEYS, FILE_TYPE_INDEXES, FILE_TYPES,
+                                      FileInfoSorter, FileListState, count_dir_files, diff_file_infos,
+                                      encode_file_infos, get_cached_dir_file_number, get_dir_mtime,
+                                      get_natural_sort_key, get_path_stat, set_cached_dir_file_number,
+                                      sort_dir_entries)
+from eaf_file_manager_preview import (DIRECTORY_PREVIEW_MAX_ENTRIES, EXIF_READER, PREFETCH_EXECUTOR, PREVIEW_CACHE,
+                                      PREVIEW_EXECUTOR, PreviewCancelled, PreviewDelay, PreviewPrefetcher,
+                                      get_code_lexer, get_code_style_defs, get_code_style_name,
+                                      highlight_file_head, scan_directory_preview)
+from eaf_file_manager_search import (GREP_CHUNK_SIZE, GREP_EXECUTOR, GREP_MAX_FILE_SIZE, GREP_PREVIEW_LENGTH,
+                                     GREP_WORKERS, SEARCH_BATCH_SIZE, SEARCH_BATCH_TIME, SEARCH_MAX_RESULTS,
+                                     ParallelWalker, compile_grep_regex, format_grep_preview, grep_entries)
 
 FILE_MIME_DICT = {
     "mdx": ["eaf-mime-type-code-html", "text-markdown"],
@@ -55,11 +74,23 @@ FILE_MIME_DICT = {
     "docx": ["eaf-mime-type-office-word", "application-vnd.oasis.opendocument.text"],
     "xmind": ["eaf-mime-type-not-support", "application-xmind"],
     "emm": ["eaf-mime-type-not-support", "application-xmind"],
-    "zst": ["eaf-mime-type-not-support", "application-x-compressed-tar"]
+    "zst": ["eaf-mime-type-archive", "application-x-compressed-tar"]
 }
 
 FILE_CODE_HTML_MIMES = ["application-json", "application-x-yaml", "application-x-shellscript", "application-toml"]
 
+# Archives listed by ARCHIVE_INDEX in preview.
+FILE_ARCHIVE_MIMES = ["application-zip", "application-x-java-archive", "application-x-tar", "application-x-compressed-tar",
+                      "application-x-bzip-compressed-tar", "application-x-bzip2-compressed-tar",
+                      "application-x-xz-compressed-tar", "application-x-zstd-compressed-tar"]
+
+# Listings longer than threshold are sent to web page in chunks, first chunk only fill the screen.
+PROGRESSIVE_LISTING_FIRST_SIZE = 200
+PROGRESSIVE_LISTING_CHUNK_SIZE = 5000
+
+# Shown in the info column until the background thread has counted the directory.
+DIR_FILE_NUMBER_PLACEHOLDER = "..."
+
 def get_fd_command():
     if shutil.which("fd"):
         return "fd"
@@ -68,16 +99,219 @@ def get_fd_command():
     else:
         return ""
 
+def get_rg_command():
+    if shutil.which("rg"):
+        return "rg"
+    else:
+        return ""
+
+
+# Icons rendered when the first buffer starts, before any listing needs them.
+ICON_PRELOAD_MIMES = [
+    "directory", "text-plain", "text-markdown", "text-html", "text-css", "text-x-python", "text-x-csrc",
+    "text-x-c++src", "text-x-chdr", "text-x-java", "text-x-go", "text-rust", "text-x-emacs-lisp",
+    "application-javascript", "application-json", "application-xml", "application-x-yaml", "application-toml",
+    "application-x-shellscript", "application-pdf", "application-zip", "application-gzip", "application-x-tar",
+    "application-x-7z-compressed", "application-x-executable", "application-x-sharedlib", "application-octet-stream",
+    "image-png", "image-jpeg", "image-gif", "image-svg+xml", "image-webp",
+    "video-mp4", "video-webm", "video-x-matroska", "audio-mpeg", "audio-flac", "audio-x-wav"
+] + [mimes[1] for mimes in FILE_MIME_DICT.values()]
+
+
+def format_file_size(num, suffix='B'):
+    for unit in ['','K','M','G','T','P','E','Z']:
+        if abs(num) < 1024.0:
+            return "%3.1f%s%s" % (num, unit, suffix)
+        num /= 1024.0
+    return "%.1f%s%s" % (num, 'Yi', suffix)
+
+def resolve_file_mime(file_path, use_preview=True, file_type=None, file_stat=None, mime_content_sniff=False):
+    if file_type is None:
+        file_type = "directory" if os.path.isdir(file_path) else "file"
+
+    if file_type == "directory":
+        return "directory"
+    else:
+        file_info = QtCore.QFileInfo(file_path)
+        file_suffix = file_info.suffix()
+
+        if file_suffix in FILE_MIME_DICT:
+            return FILE_MIME_DICT[file_suffix][0] if use_preview else FILE_MIME_DICT[file_suffix][1]
+        else:
+            # Preview needs exact type of one file, listing only sniffs content if user enable it.
+            mime = MIME_RESOLVER.resolve(file_path, use_preview or mime_content_sniff, file_stat).replace("/", "-")
+
+            if use_preview:
+                if (mime.startswith("text-") or mime in FILE_CODE_HTML_MIMES):
+                    mime = "eaf-mime-type-code-html"
+                elif mime in FILE_ARCHIVE_MIMES:
+                    mime = "eaf-mime-type-archive"
+                elif mime == "application-x-sharedlib":
+                    mime = "eaf-mime-type-not-support"
+
+            return mime
+
+def build_file_info(file_path, current_dir=None, entry=None, show_hidden_file=False, mime_content_sniff=False):
+    # Only depends on arguments and thread-safe caches, search threads call it too.
+    file_size = ""
+    file_bytes = 0
+
+    (file_type, file_stat) = get_path_stat(file_path, entry)
+
+    if file_type == "file":
+        file_bytes = file_stat.st_size
+        file_size = format_file_size(file_bytes)
+    elif file_type == "directory":
+        # Counting children needs a directory read, leave it to fetch_dir_file_numbers if it's not cached.
+        file_bytes = get_cached_dir_file_number(file_path, file_stat.st_mtime, show_hidden_file)
+        if file_bytes is None:
+            file_bytes = 0
+            file_size = DIR_FILE_NUMBER_PLACEHOLDER
+        else:
+            file_size = str(file_bytes)
+    elif file_type == "symlink":
+        file_size = "1"
+
+    if current_dir is not None:
+        current_dir = os.path.abspath(current_dir)
+        name = os.path.abspath(file_path).replace(current_dir, "", 1)[1:]
+    else:
+        name = os.path.basename(file_path)
+
+    # Icon is rendered by ICON_SERVICE later if it's missing, web page shows fallback icon until then.
+    icon = ICON_SERVICE.get_icon_name(resolve_file_mime(file_path, False, file_type, file_stat, mime_content_sniff))
+
+    file_info = {
+        "path": file_path,
+        "name": name,
+        "extension": os.path.splitext(name)[1],
+        "type": file_type,
+        "bytes": file_bytes,
+        "info": file_size,
+        "mark": "",
+        "changed": "",
+        "match": "",
+        "line": "",
+        "icon": icon,
+        "mtime": file_stat.st_mtime if file_stat else 0,
+        "ctime": file_stat.st_ctime if file_stat else 0,
+        "atime": file_stat.st_atime if file_stat else 0
+    }
+
+    return file_info
+
+
+# Coalesce directory change events into refreshes, a refresh runs when events stop for coalesce_window,
+# but no later than max_delay after first event of burst, and at most max_rate times per second.
+class DirectoryChangePipeline:
+
+    def __init__(self, refresh_callback, changing_callback):
+        self.refresh_callback = refresh_callback
+        self.changing_callback = changing_callback
+
+        self.coalesce_window = 0.2
+        self.max_delay = 1.0
+        self.min_interval = 0.5
+
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.flush)
+
+        self.events_received = 0
+        self.refreshes_performed = 0
+
+        self.burst_start_time = None
+        self.burst_events = 0
+        self.last_event_time = 0
+        self.last_refresh_time = float("-inf")
+        self.changing = False
+
+    def configure(self, coalesce_window_ms, max_delay_ms, max_rate):
+        self.coalesce_window = coalesce_window_ms / 1000
+        self.max_delay = max(max_delay_ms / 1000, self.coalesce_window)
+        self.min_interval = 1 / max_rate if max_rate > 0 else 0
+
+    def add_event(self):
+        now = time.monotonic()
+
+        self.events_received += 1
+        self.burst_events += 1
+        self.last_event_time = now
+        if self.burst_start_time is None:
+            self.burst_start_time = now
+
+        refresh_time = min(now + self.coalesce_window, self.burst_start_time + self.max_delay)
+        refresh_time = max(refresh_time, self.last_refresh_time + self.min_interval)
+        self.timer.start(max(int((refresh_time - now) * 1000), 0))
+
+        if self.burst_events > 1 and not self.changing:
+            self.set_changing(True)
+
+    def flush(self):
+        now = time.monotonic()
+
+        if self.burst_events > 0:
+            self.refreshes_performed += 1
+            self.last_refresh_time = now
+            self.burst_start_time = None
+            self.burst_events = 0
+
+            self.refresh_callback()
+
+        if self.changing:
+            if now - self.last_event_time >= self.coalesce_window:
+                self.set_changing(False)
+            else:
+                # Refresh forced by max_delay happens in middle of burst, check again once burst is quiet.
+                self.timer.start(int((self.last_event_time + self.coalesce_window - now) * 1000) + 1)
+
+    def reset(self):
+        self.timer.stop()
+        self.burst_start_time = None
+        self.burst_events = 0
+
+        if self.changing:
+            self.set_changing(False)
+
+    def stop(self):
+        # Buffer is destroyed, drop pending refresh without calling back into it.
+        self.timer.stop()
+        self.burst_start_time = None
+        self.burst_events = 0
+        self.changing = False
+
+    def set_changing(self, changing):
+        self.changing = changing
+        self.changing_callback(changing)
+
+    def get_stats_message(self):
+        return "Directory change events: {} received, {} refreshes performed.".format(self.events_received, self.refreshes_performed)
+
 class AppBuffer(BrowserBuffer):
     def __init__(self, buffer_id, url, arguments):
         BrowserBuffer.__init__(self, buffer_id, url, arguments, False)
 
         self.arguments = arguments
 
-        self.vue_files = []
-        self.vue_current_index = 0
+        # What web page shows now, web page reports marks and selection by index.
+        self.file_list_state = FileListState()
+        self.vue_scroll_top = 0
+
+        self.file_infos = []
+        # Directory mtime of self.file_infos, None if the listing is not a plain directory listing.
+        self.file_infos_mtime = None
+
+        # Increase when a new listing is sent, chunks of previous listing will be dropped.
+        self.listing_generation = 0
+        self.listing_streaming = False
+        # Scanned entries of listing whose file infos are still being built, None once self.file_infos is complete.
+        self.listing_entries = None
+        self.progressive_listing_threshold = 5000
 
         self.search_regex = ""
+        self.search_thread = None
+        # Shown after search keyword, when results come from filename index or index is still building.
+        self.search_note = ""
         self.search_start_index = 0
 
         self.load_index_html(__file__)
@@ -85,6 +319,7 @@ class AppBuffer(BrowserBuffer):
         self.show_hidden_file = None
         self.show_preview = None
         self.show_icon = None
+        self.mime_content_sniff = False
 
         self.hide_preview_by_width = False
 
@@ -94,15 +329,13 @@ class AppBuffer(BrowserBuffer):
         self.search_files = []
         self.search_files_index = 0
 
+        self.directory_change_pipeline = DirectoryChangePipeline(self.update_directory, self.update_directory_changing)
+
         self.file_changed_wacher = QFileSystemWatcher()
-        self.file_changed_wacher.directoryChanged.connect(lambda path: self.update_directory())
+        self.file_changed_wacher.directoryChanged.connect(lambda path: self.directory_change_pipeline.add_event())
 
-        self.mime_db = QMimeDatabase()
-        self.icon_cache_dir = os.path.join(os.path.dirname(__file__,), "src", "assets", "icon_cache")
-        if not os.path.exists(self.icon_cache_dir):
-            os.makedirs(self.icon_cache_dir)
-        # Add memory cache for icons
-        self.icon_memory_cache = {}
+        self.icon_cache_dir = ICON_SERVICE.icon_cache_dir
+        ICON_SERVICE.add_listener(self.send_icon_table)
 
         self.preview_file = None
         self.thread_queue = []
@@ -111,11 +344,37 @@ class AppBuffer(BrowserBuffer):
         self.preview_timer.setSingleShot(True)
         self.preview_timer.timeout.connect(self.process_delayed_preview)
         self.pending_preview_file = None
-
-        self.sort_key = "name"
+        self.preview_delay = PreviewDelay()
+        # Increase for every preview request, results of older requests are dropped.
+        self.preview_generation = 0
+
+        self.preview_prefetcher = PreviewPrefetcher()
+
+        self.thumbnail_grid = False
+        # Increase for every thumbnail request of grid, thumbnails that scrolled out of view are skipped.
+        self.thumbnail_generation = 0
+        # Files that prefetch worker should still compute, and files already submitted to it.
+        self.prefetch_window = frozenset()
+        self.prefetch_pending = set()
+        self.prefetch_last_index = 0
+        # File whose preview is shown when its pending prefetch finishes.
+        self.prefetch_waiting_file = None
+
+        self.sort_key = ("name",)
+        self.sort_info_key = "bytes"
         self.sort_reverse = False
+        # Sort of current listing, refresh keep it when patching listing.
+        self.listing_sort = (("name",), "bytes", False)
+        self.natural_sort = False
+        # Sort keys and permutations of current listing.
+        self.file_infos_sorter = None
+
+        self.dir_file_number_threads = []
 
     def monitor_current_dir(self):
+        # Pending events belong to previous directory.
+        self.directory_change_pipeline.reset()
+
         if len(self.file_changed_wacher.directories()) > 0:
             self.file_changed_wacher.removePaths(self.file_changed_wacher.directories())
         self.file_changed_wacher.addPath(self.url)
@@ -128,6 +387,9 @@ class AppBuffer(BrowserBuffer):
             import traceback
             message_to_emacs(traceback.print_exc())
 
+    def update_directory_changing(self, changing):
+        self.buffer_widget.eval_js_function('''setDirectoryChanging''', "true" if changing else "false")
+
     def init_app(self):
         self.init_vars()
 
@@ -138,6 +400,12 @@ class AppBuffer(BrowserBuffer):
                     self.search_directory(self.url, self.search_regex)
                 else:
                     self.change_directory(self.url)
+            elif self.arguments.startswith("grep:"):
+                self.search_regex = self.arguments.split("grep:", 1)[1]
+                if self.search_regex != "":
+                    self.grep_directory(self.url, self.search_regex)
+                else:
+                    self.change_directory(self.url)
             elif self.arguments.startswith("jump:"):
                 jump_file = self.arguments.split("jump:")[1]
                 self.change_directory(self.url, jump_file)
@@ -160,10 +428,38 @@ class AppBuffer(BrowserBuffer):
              "font-lock-string-face",
              "warning"])
 
-        (self.show_hidden_file, self.show_preview, self.show_icon) = get_emacs_vars([
+        (self.show_hidden_file, self.show_preview, self.show_icon, self.natural_sort, self.mime_content_sniff,
+         listing_cache_size, listing_cache_memory,
+         refresh_coalesce_window, refresh_max_delay, refresh_max_rate,
+         self.progressive_listing_threshold, preview_cache_size,
+         self.preview_prefetch_count, preview_prefetch_max_size, self.search_ignore_rules,
+         search_index_directories) = get_emacs_vars([
             "eaf-file-manager-show-hidden-file",
             "eaf-file-manager-show-preview",
-            "eaf-file-manager-show-icon"])
+            "eaf-file-manager-show-icon",
+            "eaf-file-manager-natural-sort",
+            "eaf-file-manager-mime-content-sniff",
+            "eaf-file-manager-listing-cache-size",
+            "eaf-file-manager-listing-cache-memory",
+            "eaf-file-manager-refresh-coalesce-window",
+            "eaf-file-manager-refresh-max-delay",
+            "eaf-file-manager-refresh-max-rate",
+            "eaf-file-manager-progressive-listing-threshold",
+            "eaf-file-manager-preview-cache-size",
+            "eaf-file-manager-preview-prefetch-count",
+            "eaf-file-manager-preview-prefetch-max-size",
+            "eaf-file-manager-search-ignore-rules",
+            "eaf-file-manager-search-index-directories"])
+
+        DIRECTORY_LISTING_CACHE.configure(int(listing_cache_size), int(listing_cache_memory) * 1024 * 1024)
+        self.directory_change_pipeline.configure(float(refresh_coalesce_window), float(refresh_max_delay), float(refresh_max_rate))
+        PREVIEW_CACHE.configure(int(preview_cache_size) * 1024 * 1024)
+        self.preview_prefetch_count = int(self.preview_prefetch_count)
+        self.preview_prefetch_max_size = int(preview_prefetch_max_size) * 1024
+
+        # Start building indexes in background, before the first search needs them.
+        for root in FILENAME_INDEXES.configure(search_index_directories if isinstance(search_index_directories, list) else []):
+            self.get_search_index(root)
 
         if self.theme_mode == "dark":
             if self.theme_background_color == "#000000":
@@ -186,6 +482,12 @@ class AppBuffer(BrowserBuffer):
             "true" if self.show_icon else "false",
             self.theme_mode)
 
+        # Code previews only carry HTML, stylesheet of theme is sent once.
+        self.buffer_widget.eval_js_function('''setCodeStyle''', get_code_style_defs(get_code_style_name(self.theme_mode)))
+
+        self.send_icon_table(ICON_SERVICE.icons)
+        ICON_SERVICE.request_icons(ICON_PRELOAD_MIMES)
+
     def create_and_start_thread(self, thread_class_name, thread_args, *signal_callbacks):
         """
         Create and start a new thread with automatic cleanup.
@@ -223,6 +525,8 @@ class AppBuffer(BrowserBuffer):
         self.thread_queue.append(thread)
         thread.start()
 
+        return thread
+
     def clean_finished_threads(self):
         """Remove finished threads from the thread queue to prevent memory leaks."""
         self.thread_queue = [t for t in self.thread_queue if t.isRunning()]
@@ -237,201 +541,194 @@ class AppBuffer(BrowserBuffer):
         return self.buffer_widget.width() > int(frame_width) * 2 / 3
 
     @PostGui()
-    def handle_append_search(self, file_paths, first_search):
-        self.buffer_widget.eval_js_function('''appendSearch''', list(map(lambda file_path: self.get_file_info(file_path, self.url), file_paths)))
+    def handle_append_search(self, file_infos, payload, first_search):
+        # File infos and payload are built by search thread.
+        self.file_list_state.append(file_infos)
+        self.buffer_widget.eval_js_function('''appendSearch''', payload)
+        self.fetch_dir_file_numbers(file_infos)
 
         if first_search:
-            self.update_preview(file_paths[0])
+            self.update_preview(file_infos[0]["path"])
 
     @PostGui()
-    def handle_finish_search(self, search_dir, search_regex, match_number):
-        self.buffer_widget.eval_js_function('''finishSearch''')
+    def handle_finish_search(self, search_dir, search_regex, match_number, truncated, error):
+        self.buffer_widget.eval_js_function('''finishSearch''', "true" if truncated else "false")
 
-        if match_number > 0:
-            message_to_emacs("Find {} files that matched '{}'".format(match_number, search_regex))
+        note = " ({})".format(self.search_note) if self.search_note != "" else ""
+
+        if error != "":
+            if match_number > 0:
+                message_to_emacs("Find {} files that matched '{}'{}, but {}".format(match_number, search_regex, note, error))
+            else:
+                message_to_emacs(error)
+        elif truncated:
+            message_to_emacs("Stop at first {} files that matched '{}', more files are not shown{}".format(match_number, search_regex, note))
+        elif match_number > 0:
+            message_to_emacs("Find {} files that matched '{}'{}".format(match_number, search_regex, note))
         else:
-            message_to_emacs("No file matched '{}'".format(search_regex))
+            message_to_emacs("No file matched '{}'{}".format(search_regex, note))
+
+    def get_search_index(self, dir):
+        # fd never lists hidden files, index answering fd queries is built without them too.
+        show_hidden_file = self.show_hidden_file if get_fd_command() == "" else False
+        return FILENAME_INDEXES.get(dir, show_hidden_file, self.search_ignore_rules)
+
+    def stop_search(self):
+        if self.search_thread is not None:
+            self.search_thread.stop()
+            self.search_thread = None
 
     def search_directory(self, dir, search_regex):
         self.url = dir
 
         fd_command = get_fd_command()
 
-        if fd_command != "":
-            self.buffer_widget.eval_js_function('''initSearch''', dir, "{} {}".format(fd_command, search_regex))
-            self.create_and_start_thread("FdSearchThread", 
-                                       [os.path.expanduser(dir), search_regex, self.filter_file],
+        self.stop_search()
+        self.file_list_state.reset([])
+
+        index = self.get_search_index(dir)
+        if index is None:
+            self.search_note = ""
+        elif not index.is_ready():
+            self.search_note = "index is building"
+        else:
+            staleness = index.get_staleness()
+            self.search_note = "index" if staleness is None else "stale index: {}".format(staleness)
+
+        if index is not None and index.is_ready():
+            self.buffer_widget.eval_js_function('''initSearch''', dir, search_regex, self.search_note)
+            self.search_thread = self.create_and_start_thread("IndexSearchThread",
+                                       [os.path.abspath(os.path.expanduser(dir)), search_regex, self.show_hidden_file, self.search_ignore_rules,
+                                        self.mime_content_sniff, index, fd_command != ""],
                                        "append_search", self.handle_append_search,
                                        "finish_search", self.handle_finish_search)
-        else:
-            self.buffer_widget.eval_js_function('''initSearch''', dir, search_regex)
-            self.create_and_start_thread("PythonSearchThread", 
-                                       [os.path.expanduser(dir), search_regex, self.filter_file],
+        elif fd_command != "":
+            self.buffer_widget.eval_js_function('''initSearch''', dir, "{} {}".format(fd_command, search_regex), self.search_note)
+            self.search_thread = self.create_and_start_thread("FdSearchThread", 
+                                       [os.path.expanduser(dir), search_regex, self.show_hidden_file, self.search_ignore_rules, self.mime_content_sniff],
                                        "append_search", self.handle_append_search,
                                        "finish_search", self.handle_finish_search)
-
-    def get_file_mime(self, file_path, use_preview=True):
-        if os.path.isdir(file_path):
-            return "directory"
         else:
-            file_info = QtCore.QFileInfo(file_path)
-            file_suffix = file_info.suffix()
-
-            if file_suffix in FILE_MIME_DICT:
-                return FILE_MIME_DICT[file_suffix][0] if use_preview else FILE_MIME_DICT[file_suffix][1]
-            else:
-                mime = self.mime_db.mimeTypeForFile(file_info).name().replace("/", "-")
-
-                if use_preview:
-                    if (mime.startswith("text-") or mime in FILE_CODE_HTML_MIMES):
-                        mime = "eaf-mime-type-code-html"
-                    elif mime == "application-x-sharedlib":
-                        mime = "eaf-mime-type-not-support"
-
-                return mime
-
-    def generate_file_icon(self, file_path):
-        file_mime = self.get_file_mime(file_path, False)
-        icon_name = "{}.{}".format(file_mime, "png")
-        
-        # Check if icon is in memory cache first
-        if file_mime in self.icon_memory_cache:
-            return self.icon_memory_cache[file_mime]
-        
-        icon_path = os.path.join(self.icon_cache_dir, icon_name)
-
-        if not os.path.exists(icon_path):
-            if file_mime == "directory":
-                icon = QIcon.fromTheme("folder")
-            else:
-                icon = QIcon.fromTheme(file_mime, QIcon("text-plain"))
-
-                # If nothing match, icon size is empty.
-                # Then we use fallback icon.
-                if icon.availableSizes() == []:
-                    icon = QIcon.fromTheme("text-plain")
-
-            icon.pixmap(64, 64).save(icon_path)
+            self.buffer_widget.eval_js_function('''initSearch''', dir, search_regex, self.search_note)
+            self.search_thread = self.create_and_start_thread("PythonSearchThread", 
+                                       [os.path.expanduser(dir), search_regex, self.show_hidden_file, self.search_ignore_rules, self.mime_content_sniff],
+                                       "append_search", self.handle_append_search,
+                                       "finish_search", self.handle_finish_search)
 
-        # Store in memory cache
-        self.icon_memory_cache[file_mime] = icon_name
-        
-        return icon_name
+    def grep_directory(self, dir, search_regex):
+        self.url = dir
 
-    def get_file_info(self, file_path, current_dir = None):
-        file_type = ""
-        file_size = ""
-        file_bytes = 0
+        rg_command = get_rg_command()
 
-        if os.path.isfile(file_path):
-            file_type = "file"
-            file_bytes = os.path.getsize(file_path)
-            file_size = self.file_size_format(file_bytes)
-        elif os.path.isdir(file_path):
-            file_type = "directory"
-            file_bytes = self.get_dir_file_number(file_path)
-            file_size = str(file_bytes)
-        elif os.path.islink(file_path):
-            file_type = "symlink"
-            file_size = "1"
+        self.stop_search()
+        self.file_list_state.reset([])
+        # Filename index has no file contents.
+        self.search_note = ""
 
-        if current_dir is not None:
-            current_dir = os.path.abspath(current_dir)
-            name = os.path.abspath(file_path).replace(current_dir, "", 1)[1:]
+        if rg_command != "":
+            self.buffer_widget.eval_js_function('''initSearch''', dir, "{} {}".format(rg_command, search_regex), self.search_note)
+            self.search_thread = self.create_and_start_thread("RgSearchThread",
+                                       [os.path.expanduser(dir), search_regex, self.show_hidden_file, self.search_ignore_rules, self.mime_content_sniff],
+                                       "append_search", self.handle_append_search,
+                                       "finish_search", self.handle_finish_search)
         else:
-            name = os.path.basename(file_path)
-
-        file_info = {
-            "path": file_path,
-            "name": name,
-            "extension": os.path.splitext(name)[1],
-            "type": file_type,
-            "bytes": file_bytes,
-            "info": file_size,
-            "mark": "",
-            "changed": "",
-            "match": "",
-            "icon": self.generate_file_icon(file_path),
-            "mtime": self.get_file_mtime(file_path),
-            "ctime": self.get_file_ctime(file_path),
-            "atime": self.get_file_atime(file_path)
-        }
-
-        return file_info
-
-    def get_file_mtime(self, file_path):
-        try:
-            return os.path.getmtime(file_path)
-        except:
-            return 0
+            self.buffer_widget.eval_js_function('''initSearch''', dir, "grep {}".format(search_regex), self.search_note)
+            self.search_thread = self.create_and_start_thread("GrepSearchThread",
+                                       [os.path.expanduser(dir), search_regex, self.show_hidden_file, self.search_ignore_rules, self.mime_content_sniff],
+                                       "append_search", self.handle_append_search,
+                                       "finish_search", self.handle_finish_search)
 
-    def get_file_ctime(self, file_path):
-        try:
-            return os.path.getctime(file_path)
-        except:
-            return 0
+    def get_file_mime(self, file_path, use_preview=True, file_type=None, file_stat=None):
+        return resolve_file_mime(file_path, use_preview, file_type, file_stat, self.mime_content_sniff)
 
-    def get_file_atime(self, file_path):
-        try:
-            return os.path.getatime(file_path)
-        except:
-            return 0
+    def send_icon_table(self, icons):
+        self.buffer_widget.eval_js_function('''setIconTable''', icons)
+
+    def get_file_info(self, file_path, current_dir = None, entry = None):
+        return build_file_info(file_path, current_dir, entry, self.show_hidden_file, self.mime_content_sniff)
 
     def get_file_infos(self, path):
-        file_infos = []
+        return self.get_entry_infos(self.get_file_entries(path))
+
+    def get_file_entries(self, path):
+        entries = []
         path = os.path.expanduser(path)
-        
+
         try:
-            for entry in os.scandir(path):
-                if self.filter_file(entry.name):
-                    file_infos.append(self.get_file_info(entry.path))
+            with os.scandir(path) as dir_entries:
+                entries = [entry for entry in dir_entries if self.filter_file(entry.name)]
         except PermissionError:
             message_to_emacs(f"Cannot access directory {path}: Permission denied")
         except FileNotFoundError:
             message_to_emacs(f"Directory does not exist: {path}")
-        
-        from functools import cmp_to_key
-        file_infos.sort(key=cmp_to_key(lambda a, b: self.sort_file_by_key(a, b, "name")))
 
-        return file_infos
+        return sort_dir_entries(entries, self.natural_sort)
+
+    def get_entry_infos(self, entries):
+        # Reuse the stat cached on each DirEntry, instead of stat the same path again and again.
+        return [self.get_file_info(entry.path, entry=entry) for entry in entries]
 
     def filter_file(self, file_name):
         return self.show_hidden_file or (not file_name.startswith("."))
 
     def file_size_format(self, num, suffix='B'):
-        for unit in ['','K','M','G','T','P','E','Z']:
-            if abs(num) < 1024.0:
-                return "%3.1f%s%s" % (num, unit, suffix)
-            num /= 1024.0
-        return "%.1f%s%s" % (num, 'Yi', suffix)
+        return format_file_size(num, suffix)
 
     def get_dir_file_number(self, dir):
-        try:
-            return len(list(filter(lambda f: self.filter_file(f), (os.listdir(dir)))))
-        except PermissionError:
-            return 0
+        return count_dir_files(dir, self.show_hidden_file)
 
-    def sort_file_by_key(self, a, b, key):
-        type_sort_weights = ["directory", "file", "symlink", ""]
+    def fetch_dir_file_numbers(self, file_infos):
+        pending_dirs = [[file_info["path"], file_info["mtime"]] for file_info in file_infos
+                        if file_info["type"] == "directory" and file_info["info"] == DIR_FILE_NUMBER_PLACEHOLDER]
 
-        a_type_weights = type_sort_weights.index(a["type"])
-        b_type_weights = type_sort_weights.index(b["type"])
+        if len(pending_dirs) > 0:
+            thread = self.create_and_start_thread("DirFileNumberThread",
+                                                  [self.url, pending_dirs, self.show_hidden_file],
+                                                  "update_numbers", self.handle_dir_file_numbers)
+            if thread is not None:
+                self.dir_file_number_threads.append(thread)
 
-        if a_type_weights == b_type_weights:
-            if a[key] < b[key]:
-                return -1
-            elif a[key] > b[key]:
-                return 1
-            else:
-                return 0
-        else:
-            return a_type_weights - b_type_weights
+    def stop_dir_file_number_threads(self):
+        for thread in self.dir_file_number_threads:
+            thread.stop()
+
+        self.dir_file_number_threads = []
+
+    @PostGui()
+    def handle_dir_file_numbers(self, directory, dir_numbers):
+        if directory != self.url:
+            return
+
+        update_info = self.sort_info_key == "bytes"
+
+        dir_number_dict = dict(dir_numbers)
+        for file_info in itertools.chain(self.file_infos, self.file_list_state.files):
+            if file_info["path"] in dir_number_dict:
+                file_info["bytes"] = dir_number_dict[file_info["path"]]
+                if update_info:
+                    file_info["info"] = str(file_info["bytes"])
+
+        if self.file_infos_sorter is not None:
+            self.file_infos_sorter.invalidate("bytes")
+
+        self.buffer_widget.eval_js_function('''updateDirFileNumbers''', dir_numbers, "true" if update_info else "false")
+
+        if "bytes" in self.listing_sort[0] and self.file_infos_mtime is not None and not self.listing_streaming:
+            # Directories were sorted as empty while they were counted, move them to their place.
+            current_file = self.vue_get_select_file()
+            old_infos = self.file_list_state.files
+            self.file_infos = self.sort_file_infos(self.file_infos, *self.listing_sort)
+            self.send_file_delta(old_infos, current_file["path"] if current_file is not None else "", False)
 
     @PostGui()
     def open_select_files(self):
-        mark_files = list(filter(lambda f: f["mark"] == "mark", self.vue_get_all_files()))
+        mark_files = self.vue_get_mark_files()
         if len(mark_files) == 0:
-            current_select_file = self.vue_files[self.vue_current_index]["path"]
+            current_file = self.vue_get_select_file()
+            if current_file is None:
+                return
+
+            current_select_file = current_file["path"]
             if os.path.isdir(current_select_file):
                 self.change_directory(current_select_file)
             else:
@@ -449,87 +746,239 @@ class AppBuffer(BrowserBuffer):
         self.change_directory(dir, current_dir)
 
     @PostGui()
-    def change_directory(self, dir, current_dir=""):
+    def change_directory(self, dir, current_dir="", use_cache=True):
+        self.remember_listing_position()
+
         self.url = dir
 
+        self.stop_dir_file_number_threads()
+        self.stop_search()
+
         self.monitor_current_dir()
 
         eval_in_emacs('eaf--change-default-directory', [self.buffer_id, dir])
         self.change_title("Dir [{}]".format(os.path.sep.join(list(filter(lambda x: x != '', dir.split(os.path.sep)))[-2:])))
 
-        self.file_infos = self.get_file_infos(dir)
+        listing = DIRECTORY_LISTING_CACHE.get(dir, self.show_hidden_file) if use_cache else None
+        scroll_top = -1
+
+        self.listing_sort = (("name",), "bytes", False)
+
+        entries = None
+
+        if listing is None:
+            # Take mtime before scanning, changes happen during scan will be picked up by next validation.
+            self.file_infos_mtime = get_dir_mtime(dir)
+            entries = self.get_file_entries(dir)
+
+            if self.progressive_listing_threshold <= 0 or len(entries) <= self.progressive_listing_threshold:
+                self.file_infos = self.get_entry_infos(entries)
+                entries = None
+
+                DIRECTORY_LISTING_CACHE.put(dir, self.show_hidden_file, self.file_infos_mtime, self.file_infos)
+        else:
+            self.file_infos_mtime = listing["mtime"]
+            self.file_infos = listing["file_infos"]
+            self.fill_cached_dir_file_numbers(self.file_infos)
+
+            if current_dir == "" and listing["select_path"] != "":
+                current_dir = listing["select_path"]
+                scroll_top = listing["scroll_top"]
 
         self.select_index = 0
 
         if current_dir != "":
-            files = list(map(lambda file: file["path"], self.file_infos))
-            self.select_index = files.index(current_dir) if current_dir in files else 0
+            if entries is None:
+                files = list(map(lambda file: file["path"], self.file_infos))
+            else:
+                files = list(map(lambda entry: entry.path, entries))
+
+            if current_dir in files:
+                self.select_index = files.index(current_dir)
+            else:
+                scroll_top = -1
 
-        self.buffer_widget.eval_js_function('''changePath''', self.url, self.file_infos, self.select_index)
+        self.send_file_infos(self.select_index, scroll_top, entries)
 
         if len(self.file_infos) > 0:
             self.init_first_file_preview()
 
+        self.fetch_dir_file_numbers(self.file_infos)
+
         self.fetch_git_log()
 
+        if listing is not None:
+            # Paint cached listing first, then check whether directory has changed since it was cached.
+            QTimer.singleShot(0, lambda: self.validate_cached_listing(dir, listing["mtime"]))
+
+    def send_file_infos(self, select_index, scroll_top=-1, entries=None):
+        # Huge listing is sent in chunks, file infos of entries are built chunk by chunk if entries is given.
+        self.listing_generation += 1
+        self.listing_entries = entries
+
+        if entries is not None:
+            # Selected file must be in state before first chunk, web page selects it when its chunk arrives.
+            self.file_infos = self.get_entry_infos(entries[:max(PROGRESSIVE_LISTING_FIRST_SIZE, select_index + 1)])
+            file_number = len(entries)
+        else:
+            file_number = len(self.file_infos)
+
+        # State holds every file built so far, web page only has the chunks it received.
+        self.file_list_state.reset(self.file_infos)
+        self.file_list_state.set_current_index(select_index)
+
+        if self.progressive_listing_threshold <= 0 or file_number <= self.progressive_listing_threshold:
+            self.listing_streaming = False
+            self.buffer_widget.eval_js_function('''changePath''', self.url, encode_file_infos(self.file_infos, self.url),
+                                                select_index, scroll_top)
+        else:
+            # Paint first screen at once, web page select file when chunk of select_index arrives.
+            self.listing_streaming = True
+            self.buffer_widget.eval_js_function('''changePath''', self.url,
+                                                encode_file_infos(self.file_infos[:PROGRESSIVE_LISTING_FIRST_SIZE], self.url),
+                                                select_index, scroll_top, file_number)
+            QTimer.singleShot(0, functools.partial(self.send_file_infos_chunk, self.listing_generation, PROGRESSIVE_LISTING_FIRST_SIZE))
+
+    def send_file_infos_chunk(self, generation, offset):
+        if generation != self.listing_generation:
+            return
+
+        chunk_end = offset + PROGRESSIVE_LISTING_CHUNK_SIZE
+
+        if self.listing_entries is not None:
+            if chunk_end > len(self.file_infos):
+                chunk_infos = self.get_entry_infos(self.listing_entries[len(self.file_infos):chunk_end])
+                self.file_infos.extend(chunk_infos)
+                self.file_list_state.append(chunk_infos)
+                self.fetch_dir_file_numbers(chunk_infos)
+
+            finish = chunk_end >= len(self.listing_entries)
+        else:
+            finish = chunk_end >= len(self.file_infos)
+
+        payload = encode_file_infos(self.file_infos[offset:chunk_end], self.url)
+        # Files marked before web page received them, like mark by extension while listing is streaming.
+        payload["marks"] = [index - offset for index in self.file_list_state.get_mark_indexes(offset, chunk_end)]
+
+        self.buffer_widget.eval_js_function('''appendFiles''', payload, "true" if finish else "false")
+
+        if finish:
+            self.listing_streaming = False
+
+            if self.listing_entries is not None:
+                self.listing_entries = None
+                DIRECTORY_LISTING_CACHE.put(self.url, self.show_hidden_file, self.file_infos_mtime, self.file_infos)
+        else:
+            # Return to event loop between chunks, keep key handling responsive.
+            QTimer.singleShot(0, functools.partial(self.send_file_infos_chunk, generation, chunk_end))
+
+    def validate_cached_listing(self, dir, mtime):
+        if dir == self.url and self.file_infos_mtime == mtime and get_dir_mtime(dir) != mtime:
+            if self.listing_streaming:
+                current_file = self.vue_get_select_file()
+                self.change_directory(dir, current_file["path"] if current_file is not None else "", use_cache=False)
+            else:
+                # Only send changed files, cursor and marks of cached listing stay.
+                self.refresh_delta()
+
+    def remember_listing_position(self):
+        if self.file_infos_mtime is not None:
+            current_file = self.vue_get_select_file()
+            if current_file is not None:
+                DIRECTORY_LISTING_CACHE.remember_position(self.url, self.show_hidden_file, current_file["path"], self.vue_scroll_top)
+
+    def fill_cached_dir_file_numbers(self, file_infos):
+        for file_info in file_infos:
+            if file_info["type"] == "directory" and file_info["info"] == DIR_FILE_NUMBER_PLACEHOLDER:
+                number = get_cached_dir_file_number(file_info["path"], file_info["mtime"], self.show_hidden_file)
+                if number is not None:
+                    file_info["bytes"] = number
+                    file_info["info"] = str(number)
+
     @interactive
     def sort_by_created_time(self):
-        self.sort_by_file_key("ctime", "ctime")
+        self.sort_by_file_key(("ctime",), "ctime")
         message_to_emacs("Sort file by created time.")
 
     @interactive
     def sort_by_modified_time(self):
-        self.sort_by_file_key("mtime", "mtime")
+        self.sort_by_file_key(("mtime",), "mtime")
         message_to_emacs("Sort file by modified time.")
 
     @interactive
     def sort_by_access_time(self):
-        self.sort_by_file_key("atime", "atime")
+        self.sort_by_file_key(("atime",), "atime")
         message_to_emacs("Sort file by access time.")
 
     @interactive
     def sort_by_size(self):
-        self.sort_by_file_key("bytes", "bytes")
+        self.sort_by_file_key(("bytes",), "bytes")
         message_to_emacs("Sort file by size.")
 
     @interactive
     def sort_by_name(self):
-        self.sort_by_file_key("name", "bytes")
+        self.sort_by_file_key(("name",), "bytes")
         message_to_emacs("Sort file by name.")
 
     @interactive
     def sort_by_type(self):
-        self.sort_by_file_key("extension", "bytes")
+        self.sort_by_file_key(("extension",), "bytes")
         message_to_emacs("Sort file by type.")
 
-    def sort_by_file_key(self, key, info_key):
-        if key == self.sort_key:
+    @interactive
+    def sort_by_keys(self):
+        self.send_input_message("Sort file by keys ({}): ".format(" ".join(FILE_SORT_KEYS)), "sort_by_keys", "string")
+
+    def handle_sort_by_keys(self, keys_string):
+        keys = tuple(keys_string.replace(",", " ").split())
+        unknown_keys = [key for key in keys if key not in FILE_SORT_KEYS]
+
+        if len(keys) == 0 or len(unknown_keys) > 0:
+            message_to_emacs("Unknown sort keys: '{}', choose from: {}".format(keys_string, " ".join(FILE_SORT_KEYS)))
+        else:
+            # Show time column if sorted by time first.
+            info_key = keys[0] if keys[0] in ["mtime", "ctime", "atime"] else "bytes"
+
+            self.sort_by_file_key(keys, info_key)
+            message_to_emacs("Sort file by {}.".format(", ".join(keys)))
+
+    def sort_by_file_key(self, keys, info_key):
+        if keys == self.sort_key:
             # If the sorting type is the same as the last time, then the order is reversed.
             self.sort_reverse = not self.sort_reverse
         else:
             # Keep sort order as default value if sorting type is not same as the last time.
             self.sort_reverse = False
 
-        self.sort_key = key
+        self.sort_key = keys
+        self.sort_info_key = info_key
+        self.listing_sort = (keys, info_key, self.sort_reverse)
+
+        current_file = self.vue_get_select_file()
 
-        select_path = self.file_infos[self.select_index]["path"]
+        self.file_infos = self.sort_file_infos(self.file_infos, keys, info_key, self.sort_reverse)
+        self.select_index = max(self.file_infos_sorter.get_sorted_index(current_file["path"] if current_file is not None else ""), 0)
 
-        for file_info in self.file_infos:
+        self.send_file_infos(self.select_index)
+
+    def sort_file_infos(self, file_infos, keys, info_key, reverse):
+        for file_info in file_infos:
             file_info["info"] = self.get_file_sort_info(file_info, info_key)
 
-        from functools import cmp_to_key
-        self.file_infos.sort(key=cmp_to_key(lambda a, b: self.sort_file_by_key(a, b, key)), reverse=self.sort_reverse)
-        files = list(map(lambda file: file["path"], self.file_infos))
-        self.select_index = files.index(select_path)
+        if self.file_infos_sorter is None or not self.file_infos_sorter.owns(file_infos):
+            self.file_infos_sorter = FileInfoSorter(file_infos, self.natural_sort)
 
-        self.buffer_widget.eval_js_function('''changePath''', self.url, self.file_infos, self.select_index)
+        return self.file_infos_sorter.sort(keys, reverse)
 
     def get_file_sort_info(self, file_info, info_key):
         if info_key == "bytes":
             if file_info["type"] == "file":
                 return self.file_size_format(file_info["bytes"])
             elif file_info["type"] == "directory":
-                return str(self.get_dir_file_number(file_info["path"]))
+                if file_info["info"] == DIR_FILE_NUMBER_PLACEHOLDER:
+                    return DIR_FILE_NUMBER_PLACEHOLDER
+                else:
+                    return str(file_info["bytes"])
             elif file_info["type"] == "symlink":
                 return "1"
         else:
@@ -573,9 +1022,31 @@ class AppBuffer(BrowserBuffer):
         
         # Store the file to preview
         self.pending_preview_file = file
-        
-        # Start timer for delayed preview (150ms is usually a good balance)
-        self.preview_timer.start(150)
+
+        # Preview running for previous file is useless now.
+        self.preview_generation += 1
+        self.prefetch_waiting_file = None
+
+        self.preview_delay.record_request()
+
+        preview = self.preview_prefetcher.get(file)
+        if preview is not None:
+            self.show_prefetched_preview(file, preview)
+            return
+
+        if file in self.prefetch_pending:
+            # Don't compute same preview again, show it when prefetch finishes.
+            self.prefetch_waiting_file = file
+            return
+
+        self.preview_timer.start(self.preview_delay.get_delay_ms())
+
+    def show_prefetched_preview(self, file, preview):
+        self.preview_file = file
+        self.buffer_widget.eval_js_function('''setPreview''', *preview)
+
+        if preview[1] == "directory" and preview[2] < 0:
+            PREVIEW_EXECUTOR.submit(self.count_preview_directory, file, self.preview_generation)
 
     def process_delayed_preview(self):
         """Process the queued preview request after the debounce delay."""
@@ -587,84 +1058,322 @@ class AppBuffer(BrowserBuffer):
         """Actual preview update implementation."""
         if not self.show_preview or self.hide_preview_by_width:
             return
-        
+
         self.preview_file = file
-        
+
+        self.preview_generation += 1
+        PREVIEW_EXECUTOR.submit(self.compute_preview, file, self.preview_generation)
+
+    def compute_preview(self, file, generation):
+        start_time = time.perf_counter()
+
+        try:
+            preview = self.get_preview(file, lambda: generation != self.preview_generation)
+        except PreviewCancelled:
+            return
+        except Exception:
+            import traceback
+            traceback.print_exc()
+            return
+
+        self.handle_preview_result(generation, preview, time.perf_counter() - start_time)
+
+        if preview[1] == "directory" and preview[2] < 0:
+            self.count_preview_directory(file, generation)
+
+    def get_directory_preview(self, dir, cancelled):
+        # Number of children is -1 if it's not counted yet.
+        try:
+            (entries, complete) = scan_directory_preview(dir, self.show_hidden_file, cancelled)
+            mtime = os.stat(dir).st_mtime
+        except OSError:
+            return ([], 0)
+
+        if complete:
+            number = len(entries)
+            set_cached_dir_file_number(dir, mtime, self.show_hidden_file, number)
+        else:
+            number = get_cached_dir_file_number(dir, mtime, self.show_hidden_file)
+            if number is None:
+                number = -1
+
+        if self.natural_sort:
+            get_name_key = get_natural_sort_key
+        else:
+            get_name_key = lambda name: name
+
+        entries.sort(key=lambda entry: (FILE_TYPE_INDEXES.get(entry[1], len(FILE_TYPES)), get_name_key(entry[0]), entry[0]))
+
+        file_infos = []
+        for (name, file_type) in entries[:DIRECTORY_PREVIEW_MAX_ENTRIES]:
+            path = os.path.join(dir, name)
+
+            if file_type == "directory":
+                icon = ICON_SERVICE.get_icon_name("directory")
+            else:
+                # Only match by name, preview of directory never reads children.
+                icon = ICON_SERVICE.get_icon_name(MIME_RESOLVER.resolve(path).replace("/", "-"))
+
+            file_infos.append({
+                "path": path,
+                "name": name,
+                "type": file_type,
+                "icon": icon
+            })
+
+        return (file_infos, number)
+
+    def get_archive_entries(self, file, offset, cancelled=None):
+        index = ARCHIVE_INDEX.get_index(file, cancelled)
+        if index is None:
+            return None
+
+        (entries, number) = index
+        file_infos = []
+
+        for (name, file_type, size) in entries[offset:offset + ARCHIVE_PREVIEW_PAGE_SIZE]:
+            if file_type == "directory":
+                icon = ICON_SERVICE.get_icon_name("directory")
+            else:
+                icon = ICON_SERVICE.get_icon_name(MIME_RESOLVER.resolve(name).replace("/", "-"))
+
+            file_infos.append({
+                "path": os.path.join(file, name),
+                "name": name,
+                "type": file_type,
+                "info": self.file_size_format(size) if file_type == "file" else "",
+                "icon": icon
+            })
+
+        return (file_infos, number)
+
+    @QtCore.pyqtSlot(str, int)
+    def vue_load_archive_entries(self, file, offset):
+        PREVIEW_EXECUTOR.submit(self.compute_archive_entries, file, offset, self.preview_generation)
+
+    def compute_archive_entries(self, file, offset, generation):
+        try:
+            archive_preview = self.get_archive_entries(file, offset, lambda: generation != self.preview_generation)
+        except PreviewCancelled:
+            return
+
+        # Empty page tells web page to stop loading.
+        self.handle_archive_entries(generation, file, offset, archive_preview[0] if archive_preview is not None else [])
+
+    @PostGui()
+    def handle_archive_entries(self, generation, file, offset, file_infos):
+        if generation == self.preview_generation:
+            self.buffer_widget.eval_js_function('''appendPreviewEntries''', file, offset, file_infos)
+
+    def count_preview_directory(self, dir, generation):
+        number = 0
+        report_time = time.monotonic()
+
+        try:
+            mtime = os.stat(dir).st_mtime
+
+            with os.scandir(dir) as entries:
+                for entry in entries:
+                    if self.show_hidden_file or not entry.name.startswith("."):
+                        number += 1
+
+                        if number % 1024 == 0:
+                            if generation != self.preview_generation:
+                                return
+
+                            if time.monotonic() - report_time > 0.2:
+                                report_time = time.monotonic()
+                                self.handle_preview_directory_number(generation, dir, number, False)
+        except OSError:
+            pass
+        else:
+            set_cached_dir_file_number(dir, mtime, self.show_hidden_file, number)
+
+        self.handle_preview_directory_number(generation, dir, number, True)
+
+    @PostGui()
+    def handle_preview_directory_number(self, generation, dir, number, finished):
+        if generation == self.preview_generation:
+            self.buffer_widget.eval_js_function('''setPreviewDirectoryNumber''', dir, number, finished)
+
+    def get_preview(self, file, cancelled):
         file_html_content = ""
-        
+
         if os.path.isdir(file):
             file_type = "directory"
-            file_infos = self.get_file_infos(file)
+            # Size of directory is number of children, -1 until count_preview_directory finishes.
+            (file_infos, file_size) = self.get_directory_preview(file, cancelled)
             file_mime = ""
-            file_size = 0
         else:
             file_type = "file"
             file_size = os.path.getsize(file)
             file_mime = self.get_file_mime(file)
             file_infos = []
-            
+
+            if cancelled():
+                raise PreviewCancelled()
+
             # Get HTML content for code files if needed
             if file_mime == "eaf-mime-type-code-html":
-                file_html_content = self.get_file_html_content(file)
-        
-        # Use the existing setPreview JS function
-        self.buffer_widget.eval_js_function(
-            '''setPreview''',
-            file,
-            file_type,
-            file_size,
-            file_mime,
-            {"content": file_html_content},
-            file_infos,
-            self.get_file_exif(file) or {}
-        )
+                file_html_content = self.get_file_html_content(file, cancelled)
+            elif file_mime == "eaf-mime-type-archive":
+                # Size of archive preview is number of entries, like directory preview.
+                archive_preview = self.get_archive_entries(file, 0, cancelled)
+                if archive_preview is None:
+                    file_mime = "eaf-mime-type-not-support"
+                else:
+                    (file_infos, file_size) = archive_preview
+
+        if cancelled():
+            raise PreviewCancelled()
+
+        file_exif = self.get_file_exif(file, file_mime) if file_type == "file" else None
+
+        # Image is shown from its thumbnail, large photos are decoded once for all later previews.
+        file_image_url = ""
+        if file_mime.startswith("image-"):
+            file_image_url = THUMBNAIL_SERVICE.get_thumbnail_url(file, "x-large") or file
+
+            if cancelled():
+                raise PreviewCancelled()
+
+        return [file, file_type, file_size, file_mime, {"content": file_html_content}, file_infos, file_exif or {}, file_image_url]
+
+    @PostGui()
+    def handle_preview_result(self, generation, preview, cost):
+        self.preview_delay.record_cost(cost)
+
+        # Drop result of file that cursor has left.
+        if generation != self.preview_generation or not self.show_preview or self.hide_preview_by_width:
+            return
+
+        self.buffer_widget.eval_js_function('''setPreview''', *preview)
+
+    def prefetch_previews(self, index):
+        # Prefetch next files in direction of cursor travel.
+        direction = -1 if index < self.prefetch_last_index else 1
+        self.prefetch_last_index = index
+
+        if self.preview_prefetch_count <= 0 or not self.show_preview or self.hide_preview_by_width:
+            return
+
+        files = self.file_list_state.files
+        window = []
+
+        for offset in range(1, self.preview_prefetch_count + 1):
+            next_index = index + offset * direction
+            if next_index < 0 or next_index >= len(files):
+                break
+
+            file_info = files[next_index]
+            if file_info["type"] == "file" and file_info["bytes"] > self.preview_prefetch_max_size:
+                continue
+            if file_info["type"] not in ["file", "directory"]:
+                continue
+
+            window.append(file_info["path"])
+
+        # Queued prefetches that cursor has passed are skipped by worker,
+        # prefetch of file under cursor keeps running, update_preview waits for it.
+        if index < len(files):
+            self.prefetch_window = frozenset(window + [files[index]["path"]])
+        else:
+            self.prefetch_window = frozenset(window)
+
+        for path in window:
+            if path not in self.preview_prefetcher and path not in self.prefetch_pending:
+                self.prefetch_pending.add(path)
+                PREFETCH_EXECUTOR.submit(self.compute_prefetch, path)
+
+    def compute_prefetch(self, path):
+        cancelled = lambda: path not in self.prefetch_window
+        file_key = self.preview_prefetcher.get_file_key(path)
+        preview = None
+
+        if not cancelled():
+            try:
+                preview = self.get_preview(path, cancelled)
+            except PreviewCancelled:
+                pass
+            except Exception:
+                import traceback
+                traceback.print_exc()
+
+        self.handle_prefetch_result(path, file_key, preview)
+
+    @PostGui()
+    def handle_prefetch_result(self, path, file_key, preview):
+        self.prefetch_pending.discard(path)
+
+        if preview is not None:
+            self.preview_prefetcher.put(path, file_key, preview)
+
+        if path == self.prefetch_waiting_file:
+            self.prefetch_waiting_file = None
+
+            if preview is not None:
+                # Get it from prefetcher again, so it counts as a hit.
+                self.show_prefetched_preview(path, self.preview_prefetcher.get(path) or preview)
+            else:
+                self._update_preview(path)
 
     def get_preview_file(self):
         return self.preview_file
 
+    @QtCore.pyqtSlot(list)
+    def vue_request_thumbnails(self, paths):
+        self.thumbnail_generation += 1
+
+        for index in range(0, len(paths), THUMBNAIL_BATCH_SIZE):
+            THUMBNAIL_EXECUTOR.submit(self.compute_thumbnails, paths[index:index + THUMBNAIL_BATCH_SIZE], self.thumbnail_generation)
+
+    def compute_thumbnails(self, paths, generation):
+        thumbnails = {}
+
+        try:
+            for path in paths:
+                if generation != self.thumbnail_generation:
+                    break
+
+                thumbnails[path] = THUMBNAIL_SERVICE.get_thumbnail_url(path, "normal")
+        except Exception:
+            import traceback
+            traceback.print_exc()
+
+        if len(thumbnails) > 0:
+            self.handle_thumbnails(thumbnails)
+
+    @PostGui()
+    def handle_thumbnails(self, thumbnails):
+        self.buffer_widget.eval_js_function('''setThumbnails''', thumbnails)
+
     def get_file_size(self, file_path):
         """Get the size of the given file in bytes."""
         return os.path.getsize(file_path)
 
-    def get_file_html_content(self, file_path):
+    def get_file_html_content(self, file_path, cancelled=None):
         """Return the HTML content of the specified file."""
-        def limit_html_content(html_content):
-            """限制HTML内容大小并添加警告信息"""
-            if len(html_content) > 100000:
-                # 查找HTML体的结束位置
-                body_end_index = html_content.rfind('</body>')
-                if body_end_index > 0:
-                    # 在</body>前插入警告信息
-                    warning_message = '<div style="color:red;margin-top:20px;font-weight:bold;"><!-- 文件过大，仅显示部分内容 --></div>'
-                    return html_content[:100000] + warning_message + html_content[body_end_index:]
-                else:
-                    # 如果找不到</body>标签，直接截取
-                    return html_content[:100000] + '<!-- 文件过大，仅显示前 100000 字节内容 -->'
-            return html_content
-        
-        with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-            content = f.read()
+        style_name = get_code_style_name(self.theme_mode)
+        lexer = get_code_lexer(file_path)
 
-            try:
-                # All styles please look: https://pygments.org/styles/
-                style_name = "monokai" if self.theme_mode == "dark" else "stata-light"
+        try:
+            key = PREVIEW_CACHE.get_key(file_path, os.stat(file_path), lexer.name if lexer is not None else "",
+                                        self.theme_mode, style_name)
+        except OSError:
+            key = None
 
-                if file_path.endswith(".vue"):
-                    html_content = highlight(content,
-                                             html.HtmlLexer(),
-                                             HtmlFormatter(full=True, style=style_name))
-                else:
-                    html_content = highlight(content,
-                                             get_lexer_for_filename(file_path),
-                                             HtmlFormatter(full=True, style=style_name))
-            except:
-                html_content = highlight(content, PythonLexer(), HtmlFormatter())
+        html_content = PREVIEW_CACHE.get(key) if key is not None else None
+        if html_content is None:
+            html_content = highlight_file_head(file_path, style_name, cancelled)
+
+            if key is not None:
+                PREVIEW_CACHE.put(key, html_content)
 
-            return limit_html_content(html_content)
+        return html_content
 
     @interactive
     def search_file(self):
-        self.search_start_index = self.vue_current_index
+        self.search_start_index = self.file_list_state.current_index
         self.send_input_message("Search: ", "search_file", "search")
 
     @interactive
@@ -781,7 +1490,7 @@ class AppBuffer(BrowserBuffer):
         all_files = []
         marked_files = []
 
-        for id, f in enumerate(self.vue_get_all_files()):
+        for id, f in enumerate(self.file_list_state.get_files()):
             f["id"] = id
             all_files.append(f)
             if f["mark"] == "mark":
@@ -804,10 +1513,11 @@ class AppBuffer(BrowserBuffer):
 
     def handle_filter_file_with_regex(self, regex):
         import re
-        filter_files = list(filter(lambda f: re.search(regex, f["name"]), self.vue_get_all_files()))
+        filter_files = list(filter(lambda f: re.search(regex, f["name"]), self.file_list_state.get_files()))
 
         self.select_index = 0
-        self.buffer_widget.eval_js_function('''changePath''', self.url, filter_files, self.select_index)
+        self.file_list_state.reset(filter_files)
+        self.buffer_widget.eval_js_function('''changePath''', self.url, encode_file_infos(filter_files, self.url), self.select_index)
 
     @interactive
     def toggle_hidden_file(self):
@@ -819,6 +1529,9 @@ class AppBuffer(BrowserBuffer):
 
         self.show_hidden_file = not self.show_hidden_file
 
+        # Prefetched directory previews were listed with old setting.
+        self.preview_prefetcher.clear()
+
         self.refresh()
 
     @interactive
@@ -837,6 +1550,17 @@ class AppBuffer(BrowserBuffer):
             if current_file is not None:
                 self.update_preview(current_file["path"])
 
+    @interactive
+    def toggle_thumbnail_grid(self):
+        if self.thumbnail_grid:
+            message_to_emacs("Show file list.")
+        else:
+            message_to_emacs("Show thumbnail grid.")
+
+        self.thumbnail_grid = not self.thumbnail_grid
+
+        self.buffer_widget.eval_js_function('''setThumbnailGrid''', "true" if self.thumbnail_grid else "false")
+
     @interactive
     def find_files(self):
         fd_command = get_fd_command()
@@ -845,11 +1569,47 @@ class AppBuffer(BrowserBuffer):
         else:
             self.send_input_message("Find file with '*?[]' glob pattern: ", "find_files", "string")
 
+    @interactive
+    def grep_files(self):
+        rg_command = get_rg_command()
+        if rg_command != "":
+            self.send_input_message("Grep file content with '{}': ".format(rg_command), "grep_files", "string")
+        else:
+            self.send_input_message("Grep file content with Python regex: ", "grep_files", "string")
+
     @interactive
     def refresh_dir(self):
         self.refresh()
         message_to_emacs("Refresh current directory done.")
 
+    @interactive
+    def show_refresh_stats(self):
+        message_to_emacs(self.directory_change_pipeline.get_stats_message())
+
+    @interactive
+    def show_mime_stats(self):
+        message_to_emacs(MIME_RESOLVER.get_stats_message())
+
+    @interactive
+    def show_prefetch_stats(self):
+        message_to_emacs(self.preview_prefetcher.get_stats_message())
+
+    @interactive
+    def show_search_stats(self):
+        if self.search_thread is not None:
+            message_to_emacs(self.search_thread.get_stats_message())
+        else:
+            message_to_emacs("No search in current buffer.")
+
+    @interactive
+    def rebuild_search_index(self):
+        index = self.get_search_index(self.url)
+        if index is not None:
+            index.rescan()
+            message_to_emacs("Rescanning index of {}".format(index.root))
+        else:
+            message_to_emacs("{} is not under eaf-file-manager-search-index-directories".format(self.url))
+
     @interactive
     def open_current_file_in_new_tab(self):
         current_file = self.vue_get_select_file()
@@ -893,6 +1653,69 @@ class AppBuffer(BrowserBuffer):
 
     @PostGui()
     def refresh(self):
+        if self.file_infos_mtime is None or self.listing_streaming:
+            # Search result, narrowed listing or listing still being sent, rebuild whole directory listing.
+            self.refresh_full()
+        else:
+            self.refresh_delta()
+
+    def refresh_delta(self):
+        # Only send added, removed and updated files to web page.
+        # File list state is what web page shows now, including renames and removals done in page.
+        old_infos = self.file_list_state.files
+
+        if self.new_select_file is not None:
+            select_path = self.new_select_file
+            self.new_select_file = None
+        else:
+            current_file = self.vue_get_select_file()
+            select_path = current_file["path"] if current_file is not None else ""
+
+        self.file_infos_mtime = get_dir_mtime(self.url)
+        self.file_infos = self.get_file_infos(self.url)
+        DIRECTORY_LISTING_CACHE.put(self.url, self.show_hidden_file, self.file_infos_mtime, self.file_infos)
+
+        self.fill_cached_dir_file_numbers(self.file_infos)
+        if self.listing_sort != (("name",), "bytes", False):
+            self.file_infos = self.sort_file_infos(self.file_infos, *self.listing_sort)
+
+        mark_changed = not self.inhibit_mark_change_file
+        self.inhibit_mark_change_file = False
+
+        updated_infos = self.send_file_delta(old_infos, select_path, mark_changed)
+
+        if len(self.file_infos) > 0:
+            new_select_path = self.file_infos[self.select_index]["path"]
+            if new_select_path != select_path or new_select_path in set(file_info["path"] for file_info in updated_infos):
+                self.update_preview(new_select_path)
+
+        self.fetch_dir_file_numbers(self.file_infos)
+
+        self.fetch_git_log()
+
+    def send_file_delta(self, old_infos, select_path, mark_changed):
+        (removed_paths, updated_infos, inserted_infos) = diff_file_infos(old_infos, self.file_infos)
+
+        files = list(map(lambda file: file["path"], self.file_infos))
+        if select_path in files:
+            self.select_index = files.index(select_path)
+        else:
+            # Selected file is gone, select the file at same position.
+            self.select_index = max(min(self.file_list_state.current_index, len(files) - 1), 0)
+
+        self.file_list_state.apply_delta(removed_paths, updated_infos, inserted_infos)
+        self.file_list_state.set_current_index(self.select_index)
+
+        self.buffer_widget.eval_js_function('''applyFileDelta''',
+                                            removed_paths,
+                                            encode_file_infos(updated_infos, self.url),
+                                            [index for (index, _) in inserted_infos],
+                                            encode_file_infos([file_info for (_, file_info) in inserted_infos], self.url),
+                                            self.select_index, "true" if mark_changed else "false")
+
+        return updated_infos
+
+    def refresh_full(self):
         old_file_info_dict = {}
 
         if not self.inhibit_mark_change_file:
@@ -901,17 +1724,17 @@ class AppBuffer(BrowserBuffer):
 
         if self.new_select_file is not None:
             # Select new file if self.new_select_file is not None.
-            self.change_directory(self.url, self.new_select_file)
+            self.change_directory(self.url, self.new_select_file, use_cache=False)
             self.new_select_file = None
         else:
             current_file = self.vue_get_select_file()
             if current_file is not None:
-                self.change_directory(self.url, current_file["path"])
+                self.change_directory(self.url, current_file["path"], use_cache=False)
             else:
-                self.change_directory(self.url)
+                self.change_directory(self.url, use_cache=False)
 
         if self.inhibit_mark_change_file:
-            self.inherit_mark_change_file = False
+            self.inhibit_mark_change_file = False
         else:
             change_file_indexes = []
             for index, new_file in enumerate(self.file_infos):
@@ -946,7 +1769,11 @@ class AppBuffer(BrowserBuffer):
                     self.batch_rename_files[i]["path"] = new_file_path
                     break
 
-        self.buffer_widget.eval_js_function('''renameFiles''', self.batch_rename_files)
+        # Web page keeps selection when renamed files are sent back.
+        current_index = self.file_list_state.current_index
+        self.file_list_state.reset(self.batch_rename_files)
+        self.file_list_state.set_current_index(current_index)
+        self.buffer_widget.eval_js_function('''renameFiles''', encode_file_infos(self.batch_rename_files, self.url))
 
     @PostGui()
     def handle_input_response(self, callback_tag, result_content):
@@ -1013,10 +1840,10 @@ class AppBuffer(BrowserBuffer):
             message_to_emacs(traceback.print_exc())
 
     def vue_get_mark_files(self):
-        return list(filter(lambda file: file["mark"] == "mark", self.vue_files)).copy()
+        return self.file_list_state.get_mark_files()
 
     def get_file_names(self):
-        return list(map(lambda file: file["path"], self.vue_files))
+        return list(map(lambda file: file["path"], self.file_list_state.files))
 
     def get_mark_file_names(self):
         return list(map(lambda file: file["path"], self.vue_get_mark_files()))
@@ -1029,41 +1856,39 @@ class AppBuffer(BrowserBuffer):
             return ""
 
     def vue_get_file_next_to_last_mark(self):
-        mark_indexes = []
-        for id, f in enumerate(self.vue_files):
-            if f["mark"] == "mark":
-                mark_indexes.append(id)
-
-        reverse_mark_indexes = copy.deepcopy(mark_indexes)
-        reverse_mark_indexes.reverse()
-        for i, mark_id in enumerate(reverse_mark_indexes):
-            if i < len(reverse_mark_indexes) - 1:
-                if reverse_mark_indexes[i] - reverse_mark_indexes[i + 1] > 1:
-                    return self.vue_files[reverse_mark_indexes[i] - 1]
-
-        if mark_indexes[0] > 0:
-            return self.vue_files[mark_indexes[0] - 1]
-        elif mark_indexes[-1] < len(self.vue_files) - 1:
-            return self.vue_files[mark_indexes[-1] + 1]
-        else:
-            return None
+        return self.file_list_state.get_file_next_to_last_mark()
 
     def vue_get_all_files(self):
-        return self.vue_files.copy()
+        return self.file_list_state.get_files()
 
     def vue_get_select_file(self):
-        try:
-            return copy.deepcopy(self.vue_files[self.vue_current_index])
-        except:
-            return None
+        return self.file_list_state.get_select_file()
+
+    @QtCore.pyqtSlot(list)
+    def vue_mark_files(self, indexes):
+        self.file_list_state.set_marks(indexes, True)
 
     @QtCore.pyqtSlot(list)
-    def vue_update_files(self, vue_files):
-        self.vue_files = vue_files
+    def vue_unmark_files(self, indexes):
+        self.file_list_state.set_marks(indexes, False)
 
     @QtCore.pyqtSlot(int)
-    def vue_update_current_index(self, inex):
-        self.vue_current_index = inex
+    def vue_unmark_all_files(self, file_number):
+        # Web page only changes files it has, later chunks of streaming listing bring their own marks.
+        self.file_list_state.unmark_all(file_number)
+
+    @QtCore.pyqtSlot(int)
+    def vue_toggle_mark_files(self, file_number):
+        self.file_list_state.toggle_marks(file_number)
+
+    @QtCore.pyqtSlot(int)
+    def vue_update_current_index(self, index):
+        self.file_list_state.set_current_index(index)
+        self.prefetch_previews(index)
+
+    @QtCore.pyqtSlot(int)
+    def vue_update_scroll_top(self, scroll_top):
+        self.vue_scroll_top = scroll_top
 
     @QtCore.pyqtSlot(str)
     def rename_file(self, file_path):
@@ -1077,6 +1902,7 @@ class AppBuffer(BrowserBuffer):
             self.new_select_file = next_to_file["path"]
 
         self.delete_files(self.vue_get_mark_files())
+        self.file_list_state.remove_marked_files()
         self.buffer_widget.eval_js_function("removeMarkFiles")
 
         message_to_emacs("Delete selected files success.")
@@ -1084,10 +1910,12 @@ class AppBuffer(BrowserBuffer):
     def handle_delete_current_file(self):
         file_info = self.vue_get_select_file()
         if file_info is not None:
-            if self.vue_current_index > 0:
-                self.new_select_file = self.vue_files[self.vue_current_index - 1]["path"]
+            current_index = self.file_list_state.current_index
+            if current_index > 0:
+                self.new_select_file = self.file_list_state.files[current_index - 1]["path"]
 
             self.delete_file(file_info)
+            self.file_list_state.remove_select_file()
             self.buffer_widget.eval_js_function("removeSelectFile")
 
             message_to_emacs("Delete file {} success.".format(file_info["path"]))
@@ -1104,6 +1932,7 @@ class AppBuffer(BrowserBuffer):
 
                 os.rename(self.rename_file_path, new_file_path)
 
+                self.file_list_state.rename(self.rename_file_path, new_file_path, new_file_name)
                 self.buffer_widget.eval_js_function("rename", self.rename_file_path, new_file_path, new_file_name)
 
                 message_to_emacs("Rename to '{}'".format(new_file_name))
@@ -1123,7 +1952,10 @@ class AppBuffer(BrowserBuffer):
             with open(new_file_path, "a"):
                 os.utime(new_file_path)
 
-            self.buffer_widget.eval_js_function('''addNewFile''', self.get_file_info(new_file_path))
+            new_file_info = self.get_file_info(new_file_path)
+            self.file_list_state.append([new_file_info])
+            self.file_list_state.set_current_index(len(self.file_list_state.files) - 1)
+            self.buffer_widget.eval_js_function('''addNewFile''', encode_file_infos([new_file_info], self.url))
 
     def handle_create_directory(self, new_directory):
         if new_directory in os.listdir(self.url):
@@ -1136,7 +1968,12 @@ class AppBuffer(BrowserBuffer):
 
             try:
                 os.makedirs(new_directory_path)
-                self.buffer_widget.eval_js_function('''addNewDirectory''', self.get_file_info(new_directory_path))
+
+                new_directory_info = self.get_file_info(new_directory_path)
+                insert_index = len([file_info for file_info in self.file_list_state.files if file_info["type"] == "directory"])
+                self.file_list_state.insert(insert_index, new_directory_info)
+                self.file_list_state.set_current_index(insert_index)
+                self.buffer_widget.eval_js_function('''addNewDirectory''', encode_file_infos([new_directory_info], self.url))
             except PermissionError:
                 message_to_emacs("Insufficient permissions to create directory: {}".format(new_directory))
 
@@ -1146,8 +1983,9 @@ class AppBuffer(BrowserBuffer):
                 message_to_emacs("The directory has not changed, file '{}' not moved.".format(self.move_file["name"]))
             else:
                 try:
-                    if self.vue_current_index > 0:
-                        self.new_select_file = self.vue_files[self.vue_current_index - 1]["path"]
+                    current_index = self.file_list_state.current_index
+                    if current_index > 0:
+                        self.new_select_file = self.file_list_state.files[current_index - 1]["path"]
 
                     new_path = new_file
                     if os.path.isdir(new_file):
@@ -1161,6 +1999,7 @@ class AppBuffer(BrowserBuffer):
                         self.send_input_message("Destination path {} already exists, need to cover the it?".format(new_file), "move_cover_file", "yes-or-no")
                     else:
                         shutil.move(self.move_file["path"], new_file)
+                        self.file_list_state.remove_select_file()
                         self.buffer_widget.eval_js_function("removeSelectFile")
 
                         message_to_emacs("Move '{}' to '{}'".format(self.move_file["name"], new_file))
@@ -1171,6 +2010,7 @@ class AppBuffer(BrowserBuffer):
     def handle_move_cover_file(self):
         os.remove(self.move_destination_path)
         shutil.move(self.move_original_path, self.move_destination_path)
+        self.file_list_state.remove_select_file()
         self.buffer_widget.eval_js_function("removeSelectFile")
         message_to_emacs("Move '{}' to '{}'".format(self.move_original_filename, os.path.dirname(self.move_destination_path)))
 
@@ -1186,6 +2026,7 @@ class AppBuffer(BrowserBuffer):
                 for move_file in self.move_files:
                     shutil.move(move_file["path"], new_dir)
 
+                self.file_list_state.remove_marked_files()
                 self.buffer_widget.eval_js_function("removeMarkFiles")
 
                 message_to_emacs("Move mark files to '{}'".format(new_dir))
@@ -1255,12 +2096,15 @@ class AppBuffer(BrowserBuffer):
     def handle_find_files(self, regex):
         eval_in_emacs("eaf-open", [self.url, "file-manager", "search:{}".format(regex), "always-new"])
 
+    def handle_grep_files(self, regex):
+        eval_in_emacs("eaf-open", [self.url, "file-manager", "grep:{}".format(regex), "always-new"])
+
     @PostGui()
     def handle_search_file(self, search_string):
         in_minibuffer = get_emacs_func_result("minibufferp", [])
 
         if in_minibuffer:
-            all_files = list(map(self.pick_search_string, self.vue_get_all_files()))
+            all_files = list(map(self.pick_search_string, self.file_list_state.files))
             self.search_files = list(filter(
                 lambda args: False not in list(map(lambda str: self.is_file_match(args[1], str), search_string.split())),
                 enumerate(all_files)
@@ -1276,17 +2120,25 @@ class AppBuffer(BrowserBuffer):
             # Notify user if no match file found.
             eval_in_emacs("message", ["Did not find a matching file"])
         else:
-            message_to_emacs("Select file: {}".format(self.vue_files[self.vue_current_index]['name']))
+            current_file = self.vue_get_select_file()
+            if current_file is not None:
+                message_to_emacs("Select file: {}".format(current_file["name"]))
             self.buffer_widget.eval_js_function('''setSearchMatchFiles''', [])
 
     def handle_mark_file_by_extension(self, extension):
-        self.buffer_widget.eval_js_function('''markFileByExtension''', extension.split(".")[-1])
+        extension = extension.split(".")[-1].lower()
+        mark_indexes = [index for (index, file_info) in enumerate(self.file_list_state.files)
+                        if file_info["path"].split(".")[-1].lower() == extension]
+
+        self.file_list_state.set_marks(mark_indexes, True)
+        self.buffer_widget.eval_js_function('''markFiles''', mark_indexes)
 
     def handle_narrow_file(self, rule):
         self.file_infos = list(filter(lambda f: re.search(rule, f["name"], re.IGNORECASE), self.get_file_infos(self.url)))
+        self.file_infos_mtime = None
         self.select_index = 0
 
-        self.buffer_widget.eval_js_function('''changePath''', self.url, self.file_infos, self.select_index)
+        self.send_file_infos(self.select_index)
 
         if len(self.file_infos) > 0:
             self.init_first_file_preview()
@@ -1324,6 +2176,21 @@ class AppBuffer(BrowserBuffer):
 
     def destroy_buffer(self):
         ''' Destroy buffer.'''
+        ICON_SERVICE.remove_listener(self.send_icon_table)
+        # Drop preview and thumbnails still running in worker.
+        self.preview_generation += 1
+        self.thumbnail_generation += 1
+
+        # Thread waiting below never returns while fd is still walking or directories are still counted.
+        self.stop_search()
+        self.stop_dir_file_number_threads()
+        self.prefetch_window = frozenset()
+
+        # Pending refresh must not fire after web page is deleted.
+        self.directory_change_pipeline.stop()
+        self.file_changed_wacher.directoryChanged.disconnect()
+        self.file_changed_wacher.deleteLater()
+
         for thread in self.thread_queue:
             if thread.isRunning():
                 thread.quit()
@@ -1343,32 +2210,18 @@ class AppBuffer(BrowserBuffer):
                 self.buffer_widget.eval_js_function('''setPreviewOption''', "false")
                 self.hide_preview_by_width = True
 
-    def get_file_exif(self, file_path):
+    def get_file_exif(self, file_path, file_mime=None):
         """Get EXIF information from an image file."""
         if not os.path.isfile(file_path):
             return None
-        
-        file_mime = self.get_file_mime(file_path)
-        
+
+        if file_mime is None:
+            file_mime = self.get_file_mime(file_path)
+
         # Only process EXIF for image files
         if file_mime.startswith("image-"):
-            try:
-                from exif import Image
-                
-                exif_info = {}
-                
-                with open(file_path, "rb") as f:
-                    img = Image(f)
-                    keys = dir(img)
-                    for k in keys:
-                        v = img.get(k, None)
-                        if v:
-                            exif_info[k] = str(img.get(k))
-                
-                return exif_info
-            except:
-                pass
-        
+            return EXIF_READER.read(file_path)
+
         return None
 
 class GitCommitThread(QThread):
@@ -1396,107 +2249,460 @@ class GitCommitThread(QThread):
 
         self.fetch_command_result.emit(git_log)
 
+class DirFileNumberThread(QThread):
+
+    update_numbers = QtCore.pyqtSignal(str, list)
+
+    def __init__(self, current_dir, pending_dirs, show_hidden_file):
+        QThread.__init__(self)
+
+        self.current_dir = current_dir
+        self.pending_dirs = pending_dirs
+        self.show_hidden_file = show_hidden_file
+
+        self.send_size = 200
+        self.send_duration = 0.1
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+    def run(self):
+        dir_numbers = []
+        start_time = time.time()
+
+        for (dir, mtime) in self.pending_dirs:
+            if self.stopped:
+                return
+
+            number = count_dir_files(dir, self.show_hidden_file)
+            set_cached_dir_file_number(dir, mtime, self.show_hidden_file, number)
+            dir_numbers.append([dir, number])
+
+            if len(dir_numbers) >= self.send_size or (time.time() - start_time) > self.send_duration:
+                self.update_numbers.emit(self.current_dir, dir_numbers)
+                dir_numbers = []
+                start_time = time.time()
+
+        if len(dir_numbers) > 0 and not self.stopped:
+            self.update_numbers.emit(self.current_dir, dir_numbers)
+
+# Without inotify, roots with more directories than this are not watched with QFileSystemWatcher.
+INDEX_QT_WATCH_MAX_DIRS = 1000
+
+class QtDirectoryWatcher:
+    """Watch directories with QFileSystemWatcher when inotify is not available, watcher lives in GUI thread."""
+
+    def __init__(self, root, callback):
+        self.root = root
+        self.callback = callback
+        self.watcher = None
+        # Rescans add same directories again, only distinct paths count against INDEX_QT_WATCH_MAX_DIRS.
+        self.paths = set()
+
+        self.create_watcher()
+
+    @PostGui()
+    def create_watcher(self):
+        self.watcher = QFileSystemWatcher()
+        self.watcher.directoryChanged.connect(self.handle_directory_changed)
+
+    def add(self, path, rel):
+        """Watch directory path, return False if root has too many directories to watch."""
+        if path in self.paths:
+            return True
+
+        if len(self.paths) >= INDEX_QT_WATCH_MAX_DIRS:
+            return False
+
+        self.paths.add(path)
+        self.add_path(path)
+        return True
+
+    @PostGui()
+    def add_path(self, path):
+        if self.watcher is not None:
+            self.watcher.addPath(path)
+
+    def handle_directory_changed(self, path):
+        # QFileSystemWatcher stops watching removed directories by itself.
+        if not os.path.isdir(path):
+            self.paths.discard(path)
+
+        rel = os.path.relpath(path, self.root).replace(os.sep, "/")
+        self.callback("" if rel == "." else rel)
+
+    @PostGui()
+    def close(self):
+        if self.watcher is not None:
+            self.watcher.deleteLater()
+            self.watcher = None
+
+# Directories are watched with QFileSystemWatcher when inotify is not available.
+FILENAME_INDEXES = FilenameIndexService(QtDirectoryWatcher)
+
 class FileSearchThread(QThread):
 
-    append_search = QtCore.pyqtSignal(list, bool)
-    finish_search = QtCore.pyqtSignal(str, str, int)
+    # File infos, payload of encode_file_infos and whether it's the first batch.
+    append_search = QtCore.pyqtSignal(list, object, bool)
+    # Search directory, search command, match number, whether it's truncated and error message.
+    finish_search = QtCore.pyqtSignal(str, str, int, bool, str)
 
-    def __init__(self, search_dir, search_regex, filter_file_callback):
+    def __init__(self, search_dir, search_regex, show_hidden_file, ignore_rules, mime_content_sniff):
         QThread.__init__(self)
 
         self.search_dir = search_dir
         self.search_regex = search_regex
-        self.filter_file_callback = filter_file_callback
+        self.show_hidden_file = show_hidden_file
+        self.ignore_rules = ignore_rules
+        # Stat, MIME and icon of found files are resolved here with options captured when search starts,
+        # GUI thread only renders ready batches.
+        self.mime_content_sniff = mime_content_sniff
 
-        self.start_time = time.time()
-        self.search_send_duration = 0.3
         self.first_search = True
-        self.file_paths = []
         self.match_number = 0
+        # Set when search stops at SEARCH_MAX_RESULTS while more files match.
+        self.truncated = False
+        self.stopped = False
+
+        self.start_time = time.monotonic()
+        self.finish_time = None
+        self.enrich_time = 0
+
+    def stop(self):
+        self.stopped = True
 
     def run(self):
         pass
 
-    def send_files(self):
-        if len(self.file_paths) > 0:
-            self.append_search.emit(self.file_paths, self.first_search)
+    def send_files(self, file_paths, entries=None, lines=None):
+        # Return False once SEARCH_MAX_RESULTS is reached.
+        # entries are os.DirEntry of file_paths, lines are matched lines of content search.
+        if self.stopped:
+            return False
+
+        room = SEARCH_MAX_RESULTS - self.match_number
+        if len(file_paths) > room:
+            file_paths = file_paths[:room]
+            self.truncated = True
+
+        if len(file_paths) > 0:
+            enrich_start = time.perf_counter()
+
+            if entries is None:
+                file_infos = [self.build_file_info(file_path) for file_path in file_paths]
+            else:
+                file_infos = [self.build_file_info(file_path, entry) for (file_path, entry) in zip(file_paths, entries)]
+            if lines is not None:
+                for (file_info, line) in zip(file_infos, lines):
+                    file_info["line"] = line
+            payload = encode_file_infos(file_infos, self.search_dir)
+
+            self.enrich_time += time.perf_counter() - enrich_start
+
+            if self.stopped:
+                return False
+
+            self.append_search.emit(file_infos, payload, self.first_search)
             self.first_search = False
+            self.match_number += len(file_paths)
+
+        return not self.truncated
+
+    def build_file_info(self, file_path, entry=None):
+        return build_file_info(file_path, self.search_dir, entry, self.show_hidden_file, self.mime_content_sniff)
 
-            self.file_paths = []
+    def send_finish(self, search_regex, error=""):
+        self.finish_time = time.monotonic()
+
+        # Stopped search was replaced by new search or its buffer is destroyed.
+        if not self.stopped:
+            self.finish_search.emit(self.search_dir, search_regex, self.match_number, self.truncated, error)
+
+    def get_stats_message(self):
+        search_time = (self.finish_time or time.monotonic()) - self.start_time
+
+        return "Search: {} files in {:.0f}ms{}, enriched in search thread in {:.0f}ms ({:.1f}us per file).".format(
+            self.match_number, search_time * 1000, "" if self.finish_time else " (running)",
+            self.enrich_time * 1000, self.enrich_time * 1000000 / self.match_number if self.match_number > 0 else 0)
 
 class PythonSearchThread(FileSearchThread):
 
-    def __init__(self, search_dir, search_regex, filter_file_callback):
-        FileSearchThread.__init__(self, search_dir, search_regex, filter_file_callback)
+    def __init__(self, search_dir, search_regex, show_hidden_file, ignore_rules, mime_content_sniff):
+        FileSearchThread.__init__(self, search_dir, search_regex, show_hidden_file, ignore_rules, mime_content_sniff)
+
+        self.walker = ParallelWalker(self.search_dir, self.search_regex, self.show_hidden_file, self.ignore_rules)
+
+    def stop(self):
+        FileSearchThread.stop(self)
+        self.walker.stop()
 
     def run(self):
-        import fnmatch
-        
-        # Convert wildcard expression to pattern for matching
-        pattern = self.search_regex
-        
-        # Use os.walk for more efficient directory traversal
-        for root, dirs, files in os.walk(self.search_dir):
-            # Process files first
-            for filename in files:
-                if fnmatch.fnmatch(filename, pattern) and self.filter_file_callback(filename):
-                    full_path = os.path.join(root, filename)
-                    self.file_paths.append(full_path)
-                    self.match_number += 1
-                    
-                    # Periodically send found files to update UI
-                    if (time.time() - self.start_time) > self.search_send_duration:
-                        self.send_files()
-                        self.start_time = time.time()
-            
-            # Then process directory name matches
-            for dirname in dirs:
-                if fnmatch.fnmatch(dirname, pattern) and self.filter_file_callback(dirname):
-                    full_path = os.path.join(root, dirname)
-                    self.file_paths.append(full_path)
-                    self.match_number += 1
-                    
-                    if (time.time() - self.start_time) > self.search_send_duration:
-                        self.send_files()
-                        self.start_time = time.time()
-                    
-            # Filter out directories that don't need to be traversed
-            dirs[:] = [d for d in dirs if self.filter_file_callback(d)]
+        # Walker already batches entries by number and time.
+        for entries in self.walker.walk():
+            if not self.send_files([entry.path for entry in entries], entries):
+                break
 
-        # Send any remaining files
-        self.send_files()
-        
-        self.finish_search.emit(self.search_dir, self.search_regex, self.match_number)
+        self.send_finish(self.search_regex)
+
+class ProcessSearchThread(FileSearchThread):
+
+    # Size of one read from output pipe.
+    READ_SIZE = 65536
+    # Only start of error output is kept for error message.
+    ERROR_OUTPUT_SIZE = 4096
+    ERROR_MESSAGE_LENGTH = 200
 
-class FdSearchThread(FileSearchThread):
+    def __init__(self, search_dir, search_regex, show_hidden_file, ignore_rules, mime_content_sniff):
+        FileSearchThread.__init__(self, search_dir, search_regex, show_hidden_file, ignore_rules, mime_content_sniff)
 
-    def __init__(self, search_dir, search_regex, filter_file_callback):
-        FileSearchThread.__init__(self, search_dir, search_regex, filter_file_callback)
+        self.process = None
+        # Set by read_records when command fails, like bad regex or unreadable search directory.
+        self.process_error = ""
+
+    def stop(self):
+        FileSearchThread.stop(self)
+
+        # Killing command closes the pipe, which wakes up reader in read_records.
+        process = self.process
+        if process is not None and process.poll() is None:
+            process.kill()
+
+    def read_records(self, command, separator, error_status=1):
+        # Yield batches of output records, error output of failed command is kept in self.process_error.
+        try:
+            self.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except OSError as e:
+            self.process_error = "Cannot run {}: {}".format(command[0], e.strerror)
+            return
+
+        if self.stopped:
+            self.process.kill()
+
+        output_fd = self.process.stdout.fileno()    # type: ignore
+        error_fd = self.process.stderr.fileno()    # type: ignore
+        selector = selectors.DefaultSelector()
+        selector.register(output_fd, selectors.EVENT_READ)
+        # Error output is read while command runs, otherwise command blocks when it fills the pipe.
+        selector.register(error_fd, selectors.EVENT_READ)
+
+        pending = b""
+        records = []
+        error_output = b""
+        send_time = time.monotonic()
+
+        try:
+            while not self.stopped:
+                # Wake up when batch is due even if command prints nothing.
+                timeout = max(send_time + SEARCH_BATCH_TIME - time.monotonic(), 0) if len(records) > 0 else SEARCH_BATCH_TIME
+
+                ready_fds = [key.fd for (key, _) in selector.select(timeout)]
+
+                if error_fd in ready_fds:
+                    data = os.read(error_fd, self.READ_SIZE)
+                    if data == b"":
+                        selector.unregister(error_fd)
+                    elif len(error_output) < self.ERROR_OUTPUT_SIZE:
+                        error_output += data
+
+                if output_fd in ready_fds:
+                    data = os.read(output_fd, self.READ_SIZE)
+                    if data == b"":
+                        # Command exited and all its output has been read.
+                        if pending != b"":
+                            records.append(pending)
+                        if len(records) > 0:
+                            yield records
+                        break
+
+                    lines = (pending + data).split(separator)
+                    pending = lines.pop()
+                    records.extend(lines)
+
+                now = time.monotonic()
+                if len(records) >= SEARCH_BATCH_SIZE or (len(records) > 0 and now - send_time >= SEARCH_BATCH_TIME):
+                    yield records
+
+                    records = []
+                    send_time = now
+        finally:
+            selector.close()
+
+            if self.process.poll() is None:
+                self.process.kill()
+            error_output += self.process.stderr.read()    # type: ignore
+            self.process.wait()
+            self.process.stdout.close()    # type: ignore
+            self.process.stderr.close()    # type: ignore
+
+            # Commands killed by stop or result limit are not failed.
+            returncode = self.process.returncode
+            if not self.stopped and not self.truncated and not 0 <= returncode < error_status:
+                self.process_error = self.format_process_error(command, returncode, error_output)
+
+    def format_process_error(self, command, returncode, error_output):
+        # Messages like regex parse error take several lines, show them in one line.
+        text = " ".join(error_output[:self.ERROR_OUTPUT_SIZE].decode("utf-8", "replace").split())
+        if len(text) > self.ERROR_MESSAGE_LENGTH:
+            text = text[:self.ERROR_MESSAGE_LENGTH - 1] + "…"
+
+        if text == "":
+            return "{} exited with status {}".format(command[0], returncode)
+        else:
+            return "{} failed: {}".format(command[0], text)
+
+class FdSearchThread(ProcessSearchThread):
 
     def run(self):
         fd_command = get_fd_command()
 
-        process = subprocess.Popen("{} -c never -t f -I --search-path '{}' {}".format(fd_command, self.search_dir, self.search_regex),
-                                   shell=True,
-                                   stderr=subprocess.PIPE,
-                                   stdout=subprocess.PIPE)
-        while True:
-            status = process.poll()
-            if status is not None:
+        # Paths are separated by NUL, newline is a valid file name character.
+        command = [fd_command, "--color", "never", "--type", "f", "--print0"]
+        if not self.ignore_rules:
+            # fd reads .gitignore, .ignore and .fdignore itself.
+            command.append("--no-ignore")
+        command += ["--search-path", self.search_dir, "--", self.search_regex]
+
+        for records in self.read_records(command, b"\0"):
+            if not self.send_files(list(map(os.fsdecode, records))):
+                break
+
+        self.send_finish("{} {}".format(fd_command, self.search_regex), self.process_error)
+
+class RgSearchThread(ProcessSearchThread):
+
+    def run(self):
+        rg_command = get_rg_command()
+
+        # One line per file: path, NUL, line number and first matched line.
+        command = [rg_command, "--no-config", "--color", "never", "--no-messages", "--smart-case",
+                   "--max-count", "1", "--with-filename", "--line-number", "--no-heading", "--null",
+                   "--max-filesize", str(GREP_MAX_FILE_SIZE),
+                   "--max-columns", str(GREP_PREVIEW_LENGTH * 4), "--max-columns-preview"]
+        if self.show_hidden_file:
+            command.append("--hidden")
+        if not self.ignore_rules:
+            command.append("--no-ignore")
+        command += ["--regexp", self.search_regex, "--", self.search_dir]
+
+        # rg exits with 1 when nothing matched, 2 on errors.
+        for records in self.read_records(command, b"\n", 2):
+            file_paths = []
+            previews = []
+
+            for record in records:
+                (file_path, _, line) = record.partition(b"\0")
+                (line_number, _, text) = line.partition(b":")
+
+                file_paths.append(os.fsdecode(file_path))
+                previews.append(format_grep_preview(line_number.decode("ascii", "replace"), text))
+
+            if not self.send_files(file_paths, lines=previews):
+                break
+
+        self.send_finish("{} {}".format(rg_command, self.search_regex), self.process_error)
+
+class GrepSearchThread(FileSearchThread):
+
+    def __init__(self, search_dir, search_regex, show_hidden_file, ignore_rules, mime_content_sniff):
+        FileSearchThread.__init__(self, search_dir, search_regex, show_hidden_file, ignore_rules, mime_content_sniff)
+
+        self.walker = ParallelWalker(self.search_dir, "*", self.show_hidden_file, self.ignore_rules)
+        # Matches not sent yet, (entry, preview) tuples.
+        self.matches = []
+        self.send_time = time.monotonic()
+
+    def stop(self):
+        FileSearchThread.stop(self)
+        self.walker.stop()
+
+    def run(self):
+        try:
+            regex = compile_grep_regex(self.search_regex)
+        except re.error as e:
+            # Don't walk directory for a pattern that can never match, tell user what is wrong instead.
+            self.send_finish(self.search_regex, "Invalid regex '{}': {}".format(self.search_regex, e))
+            return
+
+        # Chunks of files being searched by GREP_EXECUTOR, results are sent in walk order.
+        pending = collections.deque()
+        cancelled = lambda: self.stopped
+
+        for entries in self.walker.walk():
+            files = [entry for entry in entries if self.is_file(entry)]
+            for start in range(0, len(files), GREP_CHUNK_SIZE):
+                pending.append(GREP_EXECUTOR.submit(grep_entries, files[start:start + GREP_CHUNK_SIZE], regex, cancelled))
+
+            # Wait for oldest chunks when too many are queued, walker is faster than content search.
+            if not self.send_chunks(pending, GREP_WORKERS * 4):
                 break
+        else:
+            if self.send_chunks(pending, 0):
+                self.send_matches(True)
+
+        for future in pending:
+            future.cancel()
+
+        self.send_finish(self.search_regex)
+
+    def is_file(self, entry):
+        try:
+            return entry.is_file(follow_symlinks=False)
+        except OSError:
+            return False
 
-            output = process.stdout.readline()    # type: ignore
-            if output:
-                self.file_paths.append(output.strip().decode("utf-8"))
-                self.match_number += 1
+    def send_chunks(self, pending, max_pending):
+        # Collect finished chunks in order until at most max_pending are left.
+        while len(pending) > 0 and (len(pending) > max_pending or pending[0].done()):
+            self.matches.extend(pending.popleft().result())
 
-                if (time.time() - self.start_time) > self.search_send_duration:
-                    self.send_files()
-                    self.start_time = time.time()
+            if not self.send_matches(False):
+                return False
+
+        return not self.stopped
+
+    def send_matches(self, finish):
+        now = time.monotonic()
+
+        if len(self.matches) >= SEARCH_BATCH_SIZE or (len(self.matches) > 0 and (finish or now - self.send_time >= SEARCH_BATCH_TIME)):
+            (matches, self.matches) = (self.matches, [])
+            self.send_time = now
+
+            return self.send_files([entry.path for (entry, _) in matches],
+                                   [entry for (entry, _) in matches],
+                                   [preview for (_, preview) in matches])
+
+        return not self.stopped
+
+class IndexSearchThread(FileSearchThread):
+
+    def __init__(self, search_dir, search_regex, show_hidden_file, ignore_rules, mime_content_sniff, index, use_regex):
+        FileSearchThread.__init__(self, search_dir, search_regex, show_hidden_file, ignore_rules, mime_content_sniff)
+
+        self.index = index
+        # Pattern is fd regex when fd is installed, so index answers same query as fd would.
+        self.use_regex = use_regex
+        self.lookup_time = 0
+
+    def run(self):
+        lookup_start = time.perf_counter()
+        try:
+            # One more than limit, so send_files knows search is truncated.
+            file_paths = self.index.search(self.search_dir, self.search_regex, self.use_regex, SEARCH_MAX_RESULTS + 1)
+        except re.error as e:
+            self.send_finish(self.search_regex, "Invalid regex '{}': {}".format(self.search_regex, e))
+            return
+        self.lookup_time = time.perf_counter() - lookup_start
+
+        for start in range(0, len(file_paths), SEARCH_BATCH_SIZE):
+            if not self.send_files(file_paths[start:start + SEARCH_BATCH_SIZE]):
+                break
 
-        self.send_files()
+        self.send_finish(self.search_regex)
 
-        self.finish_search.emit(self.search_dir, "{} {}".format(get_fd_command(), self.search_regex), self.match_number)
+    def get_stats_message(self):
+        return "{} Index lookup took {:.1f}ms. {}".format(
+            FileSearchThread.get_stats_message(self), self.lookup_time * 1000, self.index.get_stats_message())
 
 
 class Cr2ConvertThread(QThread):
@@ -101,11 +101,13 @@
     ("X" . "delete_current_file")
     ("o" . "toggle_hidden_file")
     ("O" . "toggle_preview")
+    ("i" . "toggle_thumbnail_grid")
     ("a" . "filter_file_with_regex")
     ("q" . "bury-buffer")
     ("Q" . "close_buffer")
     ("g" . "refresh_dir")
     ("G" . "find_files")
+    ("s" . "grep_files")
     ("*" . "mark_file_by_extension")
     (";" . "convert_cr2_files")
     ("&" . "narrow_file")
@@ -120,6 +122,7 @@
     ("4" . "sort_by_modified_time")
     ("5" . "sort_by_created_time")
     ("6" . "sort_by_access_time")
+    ("7" . "sort_by_keys")
     ("!" . "eaf-file-manager-run-command-for-mark-files")
     ("B" . "eaf-file-manager-byte-compile-file")
     ("z" . "compressed_file")
@@ -152,6 +155,75 @@
   "If non-nil, opening the EAF File Manager will default to display file icon."
   :type 'boolean)
 
+(defcustom eaf-file-manager-natural-sort nil
+  "If non-nil, sort file names in natural order, for example file2 before file10."
+  :type 'boolean)
+
+(defcustom eaf-file-manager-mime-content-sniff nil
+  "If non-nil, read file content to find icon of files whose type can't be told by file name.
+
+File preview always reads content of the previewed file."
+  :type 'boolean)
+
+(defcustom eaf-file-manager-listing-cache-size 32
+  "The number of directory listings cached for instant back and up navigation.
+
+Set to 0 to disable the directory listing cache."
+  :type 'integer)
+
+(defcustom eaf-file-manager-listing-cache-memory 256
+  "The memory limit of the directory listing cache, in megabytes."
+  :type 'integer)
+
+(defcustom eaf-file-manager-refresh-coalesce-window 200
+  "Milliseconds without change events before refreshing a changed directory."
+  :type 'integer)
+
+(defcustom eaf-file-manager-refresh-max-delay 1000
+  "Maximum milliseconds a refresh waits while a directory keeps changing."
+  :type 'integer)
+
+(defcustom eaf-file-manager-refresh-max-rate 2
+  "Maximum number of refreshes per second of a changing directory."
+  :type 'number)
+
+(defcustom eaf-file-manager-progressive-listing-threshold 5000
+  "Directories with more files than this are painted progressively.
+
+Files are listed and sorted by name first, the first screen is shown
+once its details are read, details of the rest are read and appended in chunks.
+Set to 0 to always send the whole listing at once."
+  :type 'integer)
+
+(defcustom eaf-file-manager-preview-cache-size 128
+  "The size in megabytes of highlighted code previews cached on disk.
+
+Set to 0 to only cache previews in memory."
+  :type 'integer)
+
+(defcustom eaf-file-manager-preview-prefetch-count 3
+  "The number of files ahead of cursor to compute previews for in background.
+
+Set to 0 to disable preview prefetch."
+  :type 'integer)
+
+(defcustom eaf-file-manager-preview-prefetch-max-size 1024
+  "Files larger than this size in kilobytes are not prefetched."
+  :type 'integer)
+
+(defcustom eaf-file-manager-search-ignore-rules nil
+  "If non-nil, file search skips files ignored by .gitignore and .ignore files,
+and version control directories."
+  :type 'boolean)
+
+(defcustom eaf-file-manager-search-index-directories nil
+  "Directories whose file names are indexed for file search.
+
+Indexes are built in background, kept current with inotify and saved under
+the cache directory.  Searches in these directories and their subdirectories
+are answered from the index instead of walking the file system."
+  :type '(repeat directory))
+
 (defvar eaf-file-manager-rename-edit-mode-map
   (let ((map (make-sparse-keymap)))
     (define-key map (kbd "C-c C-k") #'eaf-file-manager-rename-edit-buffer-cancel)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2018 Andy Stewart
+#
+# Author:     Andy Stewart <lazycat.manatee@gmail.com>
+# Maintainer: Andy Stewart <lazycat.manatee@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Entry lists of zip and tar archives for preview, member data is never loaded.
+
+import os
+import shutil
+import stat
+import struct
+import subprocess
+import tarfile
+import zipfile
+
+from eaf_file_manager_lru import LruCache
+from eaf_file_manager_preview import PreviewCancelled
+
+# Archive preview shows at most MAX_ENTRIES entries, sent to web page in pages.
+ARCHIVE_PREVIEW_MAX_ENTRIES = 5000
+ARCHIVE_PREVIEW_PAGE_SIZE = 500
+# End of central directory record is in this many bytes at end of zip file.
+ZIP_END_SEARCH_SIZE = 65536 + 22
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+def read_zip_entries(file_path, max_entries, cancelled=None):
+    """Return (name, type, size) of first max_entries members of zip file and number of all members."""
+    # Only end record and first records of central directory are read, size of archive doesn't matter.
+    with open(file_path, "rb") as f:
+        file_size = f.seek(0, os.SEEK_END)
+        f.seek(max(file_size - ZIP_END_SEARCH_SIZE, 0))
+        tail = f.read()
+
+        end_offset = tail.rfind(b"PK\x05\x06")
+        if end_offset < 0 or len(tail) < end_offset + 22:
+            raise zipfile.BadZipFile("End of central directory not found")
+        end_position = file_size - len(tail) + end_offset
+
+        (_, _, _, _, number, directory_size, directory_offset, _) = struct.unpack("<4s4H2LH", tail[end_offset:end_offset + 22])
+
+        locator_offset = end_offset - 20
+        if locator_offset >= 0 and tail[locator_offset:locator_offset + 4] == b"PK\x06\x07":
+            # Zip64, real numbers are in zip64 end record.
+            zip64_end_position = struct.unpack("<Q", tail[locator_offset + 8:locator_offset + 16])[0]
+            f.seek(zip64_end_position)
+            zip64_end = f.read(56)
+            if zip64_end[:4] == b"PK\x06\x06":
+                (number, directory_size, directory_offset) = struct.unpack("<3Q", zip64_end[32:56])
+                end_position = zip64_end_position
+
+        # Archives with data prepended, such as self-extracting archives, have shifted offsets.
+        directory_start = end_position - directory_size
+
+        entries = []
+        f.seek(directory_start)
+
+        for index in range(min(number, max_entries)):
+            if cancelled is not None and index % 256 == 0 and cancelled():
+                raise PreviewCancelled()
+
+            record = f.read(46)
+            if len(record) < 46 or record[:4] != b"PK\x01\x02":
+                break
+
+            # Same layout as structCentralDir of zipfile.
+            fields = struct.unpack("<4s4B4HL2L5H2L", record)
+            (create_system, flags, size) = (fields[2], fields[5], fields[11])
+            (name_length, extra_length, comment_length, external_attr) = (fields[12], fields[13], fields[14], fields[17])
+
+            name = f.read(name_length).decode("utf-8" if flags & 0x800 else "cp437", "replace")
+            extra = f.read(extra_length)
+            f.seek(comment_length, os.SEEK_CUR)
+
+            if size == 0xFFFFFFFF:
+                # Uncompressed size is first field of zip64 extra field.
+                extra_offset = 0
+                while extra_offset + 4 <= len(extra):
+                    (tag, length) = struct.unpack("<2H", extra[extra_offset:extra_offset + 4])
+                    if tag == 0x0001 and length >= 8:
+                        size = struct.unpack("<Q", extra[extra_offset + 4:extra_offset + 12])[0]
+                        break
+                    extra_offset += 4 + length
+
+            if name.endswith("/"):
+                entries.append((name, "directory", 0))
+            elif create_system == 3 and stat.S_ISLNK(external_attr >> 16):
+                entries.append((name, "symlink", size))
+            else:
+                entries.append((name, "file", size))
+
+    return (entries, number)
+
+def read_tar_entries(file_path, max_entries, cancelled=None):
+    """Return (name, type, size) of first max_entries members of tar file and number of all members."""
+    # Tar has no index, headers are streamed through the whole archive.
+    # gzip, bzip2 and xz are decompressed by tarfile, zstd needs Python 3.14 or zstd command.
+    with open(file_path, "rb") as f:
+        magic = f.read(4)
+        f.seek(0)
+
+        process = None
+
+        if magic == ZSTD_MAGIC:
+            try:
+                from compression import zstd
+                fileobj = zstd.ZstdFile(f)
+            except ImportError:
+                zstd_command = shutil.which("zstd")
+                if zstd_command is None:
+                    raise tarfile.ReadError("zstd is not installed")
+
+                process = subprocess.Popen([zstd_command, "-dc", "--", file_path], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+                fileobj = process.stdout
+            mode = "r|"
+        else:
+            fileobj = f
+            mode = "r|*"
+
+        entries = []
+        number = 0
+
+        try:
+            with tarfile.open(fileobj=fileobj, mode=mode) as tar:
+                while True:
+                    # Compressed member data is decompressed to skip it, one member may take long.
+                    if cancelled is not None and cancelled():
+                        raise PreviewCancelled()
+
+                    member = tar.next()
+                    if member is None:
+                        break
+
+                    # Stream mode keeps every member, drop them since only first entries are kept.
+                    tar.members = []
+
+                    number += 1
+                    if len(entries) < max_entries:
+                        if member.isdir():
+                            entries.append((member.name + "/", "directory", 0))
+                        elif member.issym() or member.islnk():
+                            entries.append((member.name, "symlink", 0))
+                        else:
+                            entries.append((member.name, "file", member.size))
+        finally:
+            if process is not None:
+                process.kill()
+                process.wait()
+
+    return (entries, number)
+
+class ArchiveIndex:
+    """Entry lists of archives cached by (path, size, mtime), shared by all buffers."""
+
+    def __init__(self, max_size=32):
+        self.indexes = LruCache(max_size)
+
+    def get_index(self, file_path, cancelled=None):
+        """Return (entries, number) of archive, or None if it isn't a readable zip or tar archive."""
+        try:
+            file_stat = os.stat(file_path)
+        except OSError:
+            return None
+
+        key = (file_path, file_stat.st_size, file_stat.st_mtime_ns)
+
+        # Unreadable archives are cached as None.
+        index = self.indexes.get(key, False)
+        if index is not False:
+            return index
+
+        try:
+            if zipfile.is_zipfile(file_path):
+                index = read_zip_entries(file_path, ARCHIVE_PREVIEW_MAX_ENTRIES, cancelled)
+            else:
+                index = read_tar_entries(file_path, ARCHIVE_PREVIEW_MAX_ENTRIES, cancelled)
+        except (OSError, EOFError, struct.error, tarfile.TarError, zipfile.BadZipFile):
+            index = None
+
+        self.indexes.put(key, index)
+
+        return index
+
+ARCHIVE_INDEX = ArchiveIndex()
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2018 Andy Stewart
+#
+# Author:     Andy Stewart <lazycat.manatee@gmail.com>
+# Maintainer: Andy Stewart <lazycat.manatee@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Qt services shared by all buffers: MIME types, icons of MIME types and thumbnails of images.
+
+import base64
+import collections
+import concurrent.futures
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+
+from core.utils import PostGui
+from PyQt6.QtCore import QMimeDatabase, Qt, QTimer
+from PyQt6.QtGui import QIcon, QImage, QImageReader
+
+from eaf_file_manager_lru import LruCache
+
+class MimeResolver:
+    """MIME names of files by file name, content is only sniffed if name can't tell and caller allows it."""
+
+    DEFAULT_MIME = "application/octet-stream"
+
+    def __init__(self, max_size=100000):
+        self.mime_db = None
+
+        # Sniffed MIME names by (device, inode, size, mtime).
+        self.cache = LruCache(max_size)
+        self.lock = threading.Lock()
+
+        self.extension_matches = 0
+
+    def get_mime_db(self):
+        # Create QMimeDatabase lazily, it's thread-safe and can be shared.
+        if self.mime_db is None:
+            self.mime_db = QMimeDatabase()
+
+        return self.mime_db
+
+    def resolve(self, file_path, sniff=False, file_stat=None):
+        """Return MIME name of file_path, such as "text/plain"."""
+        mime = self.get_mime_db().mimeTypeForFile(file_path, QMimeDatabase.MatchMode.MatchExtension).name()
+
+        if mime != self.DEFAULT_MIME or not sniff:
+            with self.lock:
+                self.extension_matches += 1
+            return mime
+
+        try:
+            if file_stat is None:
+                file_stat = os.stat(file_path)
+            key = (file_stat.st_dev, file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns)
+        except OSError:
+            key = None
+
+        mime = self.cache.get(key)
+        if mime is not None:
+            return mime
+
+        mime = self.get_mime_db().mimeTypeForFile(file_path, QMimeDatabase.MatchMode.MatchDefault).name()
+
+        if key is not None:
+            self.cache.put(key, mime)
+
+        return mime
+
+    def get_stats_message(self):
+        return "MIME resolution: {} by file name, {} sniffed ({}).".format(
+            self.extension_matches, self.cache.hits + self.cache.misses, self.cache.get_stats_message())
+
+MIME_RESOLVER = MimeResolver()
+
+class IconService:
+    """Icons of MIME types as PNG data URIs, web page receives the icon table and looks icons up by name."""
+
+    # Render icons for at most this many seconds per event loop tick.
+    RENDER_TIME_BUDGET = 0.008
+
+    def __init__(self):
+        self.icon_cache_dir = os.path.join(os.path.dirname(__file__), "src", "assets", "icon_cache")
+
+        self.icons = {}
+        self.pending_mimes = collections.OrderedDict()
+        self.rendering = False
+        self.lock = threading.Lock()
+
+        self.listeners = []
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def get_icon_name(self, file_mime):
+        icon_name = "{}.png".format(file_mime)
+
+        if icon_name not in self.icons:
+            self.request_icons([file_mime])
+
+        return icon_name
+
+    def request_icons(self, file_mimes):
+        with self.lock:
+            for file_mime in file_mimes:
+                if "{}.png".format(file_mime) not in self.icons:
+                    self.pending_mimes[file_mime] = None
+
+            if self.rendering or len(self.pending_mimes) == 0:
+                return
+
+            self.rendering = True
+
+        self.schedule_render()
+
+    @PostGui()
+    def schedule_render(self):
+        QTimer.singleShot(0, self.render_pending_icons)
+
+    # QIcon only renders on GUI thread, missing icons are rendered in small batches on idle ticks.
+    def render_pending_icons(self):
+        new_icons = {}
+        start_time = time.perf_counter()
+
+        while time.perf_counter() - start_time < self.RENDER_TIME_BUDGET:
+            with self.lock:
+                if len(self.pending_mimes) == 0:
+                    break
+
+                (file_mime, _) = self.pending_mimes.popitem(last=False)
+
+            icon_name = "{}.png".format(file_mime)
+            if icon_name not in self.icons:
+                try:
+                    self.icons[icon_name] = self.render_icon(file_mime)
+                    new_icons[icon_name] = self.icons[icon_name]
+                except Exception:
+                    import traceback
+                    traceback.print_exc()
+
+        if len(new_icons) > 0:
+            for callback in list(self.listeners):
+                callback(new_icons)
+
+        with self.lock:
+            if len(self.pending_mimes) == 0:
+                self.rendering = False
+                return
+
+        QTimer.singleShot(0, self.render_pending_icons)
+
+    def render_icon(self, file_mime):
+        icon_path = os.path.join(self.icon_cache_dir, "{}.png".format(file_mime))
+
+        if not os.path.exists(icon_path):
+            if file_mime == "directory":
+                icon = QIcon.fromTheme("folder")
+            else:
+                icon = QIcon.fromTheme(file_mime, QIcon("text-plain"))
+
+                # If nothing match, icon size is empty.
+                # Then we use fallback icon.
+                if icon.availableSizes() == []:
+                    icon = QIcon.fromTheme("text-plain")
+
+            os.makedirs(self.icon_cache_dir, exist_ok=True)
+            icon.pixmap(64, 64).save(icon_path)
+
+        with open(icon_path, "rb") as f:
+            return "data:image/png;base64," + base64.b64encode(f.read()).decode("ascii")
+
+ICON_SERVICE = IconService()
+
+# Largest edge of thumbnail flavors of freedesktop thumbnail specification.
+THUMBNAIL_SIZES = {"normal": 128, "large": 256, "x-large": 512, "xx-large": 1024}
+# Image formats web page can show directly, smaller images of these formats are not thumbnailed.
+THUMBNAIL_WEB_FORMATS = [b"png", b"jpeg", b"gif", b"webp", b"bmp"]
+THUMBNAIL_BATCH_SIZE = 8
+
+class ThumbnailService:
+    """Thumbnails of images in freedesktop thumbnail cache, shared with other file managers."""
+
+    def __init__(self, max_size=10000):
+        cache_home = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+        self.cache_dir = os.path.join(cache_home, "thumbnails")
+        self.fail_dir = os.path.join(self.cache_dir, "fail", "eaf-file-manager")
+
+        # (path, flavor) to (mtime, URL) of checked files.
+        self.results = LruCache(max_size)
+
+    def get_thumbnail_url(self, file_path, flavor):
+        """Return URL of thumbnail of file_path for <img>, or "" if file isn't a readable image."""
+        try:
+            file_stat = os.stat(file_path)
+        except OSError:
+            return ""
+
+        key = (file_path, flavor)
+
+        result = self.results.get(key)
+        if result is not None and result[0] == file_stat.st_mtime_ns:
+            return result[1]
+
+        thumbnail_path = self.get_thumbnail(file_path, file_stat, flavor)
+        # mtime in query keeps web page from showing stale thumbnail of its own cache.
+        url = "{}?{}".format(thumbnail_path, file_stat.st_mtime_ns) if thumbnail_path is not None else ""
+
+        self.results.put(key, (file_stat.st_mtime_ns, url))
+
+        return url
+
+    def get_thumbnail(self, file_path, file_stat, flavor):
+        file_path = os.path.abspath(file_path)
+        if file_path.startswith(self.cache_dir + os.path.sep):
+            # Never thumbnail thumbnails.
+            return file_path
+
+        uri = Path(file_path).as_uri()
+        mtime = str(int(file_stat.st_mtime))
+        name = hashlib.md5(uri.encode("utf-8")).hexdigest() + ".png"
+
+        thumbnail_path = os.path.join(self.cache_dir, flavor, name)
+        fail_path = os.path.join(self.fail_dir, name)
+
+        if self.is_valid(thumbnail_path, mtime):
+            return thumbnail_path
+        elif self.is_valid(fail_path, mtime):
+            return None
+
+        reader = QImageReader(file_path)
+        reader.setAutoTransform(True)
+
+        size = reader.size()
+        limit = THUMBNAIL_SIZES[flavor]
+
+        if size.isValid():
+            if size.width() <= limit and size.height() <= limit and bytes(reader.format()) in THUMBNAIL_WEB_FORMATS:
+                return file_path
+
+            # Decoder only produces scaled image, JPEG is decoded at reduced resolution.
+            reader.setScaledSize(size.scaled(limit, limit, Qt.AspectRatioMode.KeepAspectRatio))
+
+        image = reader.read()
+
+        if image.isNull():
+            fail_image = QImage(1, 1, QImage.Format.Format_ARGB32)
+            fail_image.fill(0)
+            self.save(fail_image, fail_path, uri, mtime, file_stat.st_size)
+            return None
+
+        if self.save(image, thumbnail_path, uri, mtime, file_stat.st_size):
+            return thumbnail_path
+        else:
+            return None
+
+    def is_valid(self, thumbnail_path, mtime):
+        # Text chunks are read from PNG header, image data isn't decoded.
+        return os.path.exists(thumbnail_path) and QImageReader(thumbnail_path).text("Thumb::MTime") == mtime
+
+    def save(self, image, thumbnail_path, uri, mtime, size):
+        image.setText("Thumb::URI", uri)
+        image.setText("Thumb::MTime", mtime)
+        image.setText("Thumb::Size", str(size))
+        image.setText("Software", "EAF File Manager")
+
+        try:
+            os.makedirs(os.path.dirname(thumbnail_path), mode=0o700, exist_ok=True)
+
+            # Other programs read the same cache, only publish complete thumbnail.
+            temp_path = "{}.{}.{}.tmp".format(thumbnail_path, os.getpid(), threading.get_ident())
+            if not image.save(temp_path, "PNG"):
+                return False
+            os.chmod(temp_path, 0o600)
+            os.replace(temp_path, thumbnail_path)
+        except OSError:
+            return False
+
+        return True
+
+THUMBNAIL_SERVICE = ThumbnailService()
+
+THUMBNAIL_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=min(4, os.cpu_count() or 1), thread_name_prefix="eaf-file-manager-thumbnail")
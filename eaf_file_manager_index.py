@@ -0,0 +1,592 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2018 Andy Stewart
+#
+# Author:     Andy Stewart <lazycat.manatee@gmail.com>
+# Maintainer: Andy Stewart <lazycat.manatee@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Filename index of search roots, kept current with inotify and saved to disk.
+
+import array
+import bisect
+import ctypes
+import errno
+import hashlib
+import itertools
+import json
+import marshal
+import os
+import queue
+import re
+import selectors
+import struct
+import threading
+import time
+
+from eaf_file_manager_search import compile_glob, scan_search_dir
+
+# Events of inotify(7) that change names in a directory.
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+INOTIFY_EVENT = struct.Struct("iIII")
+
+# Bump it when format of saved index changes, old files are rebuilt.
+INDEX_VERSION = 2
+# Changed directories are listed again once events stop for this many seconds, or after INDEX_UPDATE_MAX_DELAY.
+INDEX_UPDATE_DELAY = 0.2
+INDEX_UPDATE_MAX_DELAY = 1
+# Changed index is saved to disk at most once in this many seconds.
+INDEX_SAVE_INTERVAL = 60
+# Index that is not watched is rescanned by search when it's older than this many seconds.
+INDEX_RESCAN_INTERVAL = 300
+
+def format_age(seconds):
+    for (unit, size) in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= size:
+            return "{}{}".format(int(seconds // size), unit)
+
+    return "{}s".format(int(max(seconds, 0)))
+
+def get_glob_prefix(pattern):
+    return re.split(r"[*?[]", pattern, maxsplit=1)[0]
+
+def is_regular_file(entry):
+    try:
+        return entry.is_file(follow_symlinks=False)
+    except OSError:
+        return False
+
+class InotifyWatcher:
+    """Watch directories with inotify, callback gets relative path of changed directory, or None if events were lost."""
+
+    MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW
+
+    libc = None
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.watches = {}
+        self.lock = threading.Lock()
+        self.closed = False
+
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        (self.wake_read, self.wake_write) = os.pipe()
+
+        threading.Thread(target=self.read_events, name="eaf-file-manager-inotify", daemon=True).start()
+
+    @classmethod
+    def create(cls, callback):
+        # None if platform has no inotify.
+        if cls.libc is None:
+            try:
+                libc = ctypes.CDLL(None, use_errno=True)
+                libc.inotify_init1.argtypes = [ctypes.c_int]
+                libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+                libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+            except (OSError, AttributeError):
+                return None
+
+            cls.libc = libc
+
+        try:
+            return cls(callback)
+        except OSError:
+            return None
+
+    def add(self, path, rel):
+        # Return False if watch limit of user is reached.
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+        if wd < 0:
+            # Other errors are directories removed or unreadable meanwhile.
+            return ctypes.get_errno() != errno.ENOSPC
+
+        with self.lock:
+            self.watches[wd] = rel
+
+        return True
+
+    def read_events(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self.fd, selectors.EVENT_READ)
+        selector.register(self.wake_read, selectors.EVENT_READ)
+
+        try:
+            while not self.closed:
+                selector.select()
+
+                try:
+                    data = os.read(self.fd, 65536)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    break
+
+                offset = 0
+                while offset < len(data):
+                    (wd, mask, _, name_length) = INOTIFY_EVENT.unpack_from(data, offset)
+                    offset += INOTIFY_EVENT.size + name_length
+
+                    if mask & IN_Q_OVERFLOW:
+                        self.callback(None)
+                        continue
+
+                    with self.lock:
+                        rel = self.watches.get(wd)
+
+                        if mask & IN_IGNORED:
+                            self.watches.pop(wd, None)
+                            continue
+
+                    if mask & IN_MOVE_SELF:
+                        # Watch follows moved directory, its events must not be reported with the old path.
+                        self.libc.inotify_rm_watch(self.fd, wd)
+
+                    if rel is not None:
+                        self.callback(rel)
+        finally:
+            selector.close()
+
+            os.close(self.fd)
+            os.close(self.wake_read)
+            os.close(self.wake_write)
+
+    def close(self):
+        self.closed = True
+        os.write(self.wake_write, b"\0")
+
+class FilenameIndex:
+    """Names of files under one search root, built in background and kept current with directory watches."""
+
+    # Every distinct name is kept once in a sorted table, so search matches each name once
+    # and glob with literal prefix only looks at a range of the table.
+    # Saved index answers searches at once, and is marked stale until rescan in background replaces it.
+
+    def __init__(self, root, show_hidden_file, ignore_rules, fallback_watcher=None):
+        self.root = root
+        self.show_hidden_file = show_hidden_file
+        self.ignore_rules = ignore_rules
+        # Called with root and callback to create watcher when inotify is not available.
+        self.fallback_watcher = fallback_watcher
+
+        cache_home = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+        key = json.dumps([root, show_hidden_file, ignore_rules])
+        self.index_path = os.path.join(cache_home, "eaf-file-manager", "index", hashlib.sha1(key.encode("utf-8")).hexdigest() + ".idx")
+
+        # Relative path of directory to names of (children, subdirectories, children that are neither files nor directories),
+        # path of root is "", None until index is loaded or built.
+        self.dirs = None
+        # Ignore rules directory inherits from its ancestors.
+        self.dir_rules = {}
+        # Distinct name to list of directories containing it, and sorted distinct names.
+        self.name_dirs = {}
+        self.names = []
+
+        self.lock = threading.Lock()
+        # Relative paths of changed directories, None asks for a full rescan.
+        self.updates = queue.Queue()
+        self.watcher = None
+        self.watch_failure = None
+
+        self.scanning = True
+        self.stale_reason = None
+        self.scan_time = 0
+        self.changed = False
+        self.save_time = 0
+        self.closed = False
+
+        self.full_scans = 0
+        self.scan_duration = 0
+        self.updated_dirs = 0
+        self.searches = 0
+
+    def start(self):
+        threading.Thread(target=self.run, name="eaf-file-manager-index", daemon=True).start()
+
+    def run(self):
+        self.load()
+        self.updates.put(None)
+
+        while not self.closed:
+            try:
+                dirty = [self.updates.get(timeout=INDEX_SAVE_INTERVAL)]
+            except queue.Empty:
+                dirty = []
+
+            # Coalesce a burst of events, like a checkout touching many directories.
+            deadline = time.monotonic() + INDEX_UPDATE_MAX_DELAY
+            while len(dirty) > 0 and time.monotonic() < deadline:
+                try:
+                    dirty.append(self.updates.get(timeout=INDEX_UPDATE_DELAY))
+                except queue.Empty:
+                    break
+
+            if self.closed:
+                break
+
+            if None in dirty:
+                self.scan()
+            elif len(dirty) > 0:
+                self.update(set(dirty))
+
+            if self.changed and time.time() - self.save_time >= INDEX_SAVE_INTERVAL:
+                self.save()
+
+        if self.watcher is not None:
+            self.watcher.close()
+
+    def close(self):
+        self.closed = True
+        self.updates.put(None)
+
+    def rescan(self):
+        if not self.scanning:
+            self.scanning = True
+            self.updates.put(None)
+
+    def handle_change(self, rel):
+        if rel is None:
+            self.stale_reason = "directory events lost"
+
+        self.updates.put(rel)
+
+    def get_path(self, rel):
+        return os.path.join(self.root, rel) if rel != "" else self.root
+
+    def watch(self, path, rel):
+        if self.watcher is not None and not self.watcher.add(path, rel):
+            self.watcher.close()
+            self.watcher = None
+            self.watch_failure = "too many directories to watch"
+
+    def scan(self):
+        self.scanning = True
+        start_time = time.time()
+
+        if self.watcher is None and self.watch_failure is None:
+            self.watcher = InotifyWatcher.create(self.handle_change)
+
+            if self.watcher is None and self.fallback_watcher is not None:
+                self.watcher = self.fallback_watcher(self.root, self.handle_change)
+
+        (dirs, dir_rules) = self.scan_tree("", ())
+
+        name_dirs = {}
+        for (rel, (names, _, _)) in dirs.items():
+            for name in names:
+                name_dirs.setdefault(name, []).append(rel)
+        names = sorted(name_dirs)
+
+        with self.lock:
+            self.dirs = dirs
+            self.dir_rules = dir_rules
+            self.name_dirs = name_dirs
+            self.names = names
+
+        self.scan_time = start_time
+        self.stale_reason = self.watch_failure
+        self.scanning = False
+        self.full_scans += 1
+        self.scan_duration = time.time() - start_time
+
+        self.save()
+
+    def scan_tree(self, rel, ignore_rules):
+        # List directory rel and all its subdirectories.
+        dirs = {}
+        dir_rules = {}
+        stack = [(rel, ignore_rules)]
+
+        while len(stack) > 0 and not self.closed:
+            (rel, ignore_rules) = stack.pop()
+            path = self.get_path(rel)
+
+            # Watch before listing, so changes after listing are reported.
+            self.watch(path, rel)
+
+            listing = scan_search_dir(path, rel, self.show_hidden_file, self.ignore_rules, ignore_rules)
+            if listing is None:
+                continue
+
+            (child_rules, children) = listing
+            names = []
+            subdirs = []
+            others = []
+
+            for (entry, is_dir, _) in children:
+                names.append(entry.name)
+
+                if is_dir:
+                    subdirs.append(entry.name)
+                    stack.append((rel + "/" + entry.name if rel != "" else entry.name, child_rules))
+                elif not is_regular_file(entry):
+                    others.append(entry.name)
+
+            dirs[rel] = (tuple(names), tuple(subdirs), tuple(others))
+            if self.ignore_rules:
+                dir_rules[rel] = ignore_rules
+
+        return (dirs, dir_rules)
+
+    def update(self, dirty):
+        # Parents first, subtree of removed directory is dropped before its children are listed.
+        for rel in sorted(dirty, key=lambda rel: rel.count("/") + 1 if rel != "" else 0):
+            # Only this thread changes tables, they are locked for writes, not for reads here.
+            if self.dirs is None or rel not in self.dirs:
+                continue
+
+            listing = scan_search_dir(self.get_path(rel), rel, self.show_hidden_file, self.ignore_rules, self.dir_rules.get(rel, ()))
+            if listing is None:
+                with self.lock:
+                    self.remove_tree(rel)
+                self.changed = True
+                continue
+
+            (child_rules, children) = listing
+            names = tuple(entry.name for (entry, _, _) in children)
+            subdirs = tuple(entry.name for (entry, is_dir, _) in children if is_dir)
+            others = tuple(entry.name for (entry, is_dir, _) in children if not is_dir and not is_regular_file(entry))
+
+            (old_names, old_subdirs, old_others) = self.dirs[rel]
+            if names == old_names and subdirs == old_subdirs and others == old_others:
+                continue
+
+            join = lambda name: rel + "/" + name if rel != "" else name
+            trees = [self.scan_tree(join(name), child_rules) for name in set(subdirs) - set(old_subdirs)]
+
+            with self.lock:
+                for name in set(old_subdirs) - set(subdirs):
+                    self.remove_tree(join(name))
+
+                self.remove_names(rel, set(old_names) - set(names))
+                self.add_names(rel, set(names) - set(old_names))
+                self.dirs[rel] = (names, subdirs, others)
+
+                for (dirs, dir_rules) in trees:
+                    for (dir_rel, dir_entry) in dirs.items():
+                        self.dirs[dir_rel] = dir_entry
+                        self.add_names(dir_rel, dir_entry[0])
+                    self.dir_rules.update(dir_rules)
+
+            self.changed = True
+            self.updated_dirs += 1
+
+    def remove_tree(self, rel):
+        prefix = rel + "/"
+
+        for dir_rel in [dir_rel for dir_rel in self.dirs if rel == "" or dir_rel == rel or dir_rel.startswith(prefix)]:
+            self.remove_names(dir_rel, self.dirs.pop(dir_rel)[0])
+            self.dir_rules.pop(dir_rel, None)
+
+    def add_names(self, rel, names):
+        for name in names:
+            dirs = self.name_dirs.get(name)
+
+            if dirs is None:
+                self.name_dirs[name] = [rel]
+                bisect.insort(self.names, name)
+            else:
+                dirs.append(rel)
+
+    def remove_names(self, rel, names):
+        for name in names:
+            dirs = self.name_dirs[name]
+            dirs.remove(rel)
+
+            if len(dirs) == 0:
+                del self.name_dirs[name]
+                del self.names[bisect.bisect_left(self.names, name)]
+
+    def load(self):
+        try:
+            with open(self.index_path, "rb") as f:
+                (version, root, save_time, names, dirs) = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return
+
+        if version != INDEX_VERSION or root != self.root:
+            return
+
+        tables = {}
+        name_dirs = {}
+
+        try:
+            for (rel, *id_tables) in dirs:
+                (dir_names, subdirs, others) = [tuple(names[name_id] for name_id in array.array("I", ids)) for ids in id_tables]
+                tables[rel] = (dir_names, subdirs, others)
+
+                for name in dir_names:
+                    name_dirs.setdefault(name, []).append(rel)
+        except (ValueError, TypeError, IndexError):
+            return
+
+        with self.lock:
+            self.dirs = tables
+            self.name_dirs = name_dirs
+            self.names = sorted(name_dirs)
+
+        self.scan_time = save_time
+        self.save_time = save_time
+        self.stale_reason = "loaded from disk"
+
+    def save(self):
+        with self.lock:
+            if self.dirs is None:
+                return
+
+            # Names are stored once, directories store indexes of their names.
+            names = list(self.names)
+            name_ids = {name: name_id for (name_id, name) in enumerate(names)}
+            dirs = [(rel, *[array.array("I", [name_ids[name] for name in dir_names]).tobytes() for dir_names in dir_tables])
+                    for (rel, dir_tables) in self.dirs.items()]
+
+            self.changed = False
+
+        self.save_time = time.time()
+        data = marshal.dumps((INDEX_VERSION, self.root, self.save_time, names, dirs))
+
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+
+            # Write to temporary file first, other Emacs may load the same index.
+            temp_path = "{}.{}.tmp".format(self.index_path, os.getpid())
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, self.index_path)
+        except OSError:
+            pass
+
+    def is_ready(self):
+        return self.dirs is not None
+
+    def get_staleness(self):
+        # None if index is kept current by directory watches.
+        if self.stale_reason is None and self.watcher is not None:
+            return None
+
+        staleness = "{}, {} old".format(self.stale_reason or "not watched", format_age(time.time() - self.scan_time))
+        if self.scanning:
+            staleness += ", rescanning"
+
+        return staleness
+
+    def search(self, dir, pattern, use_regex, max_results):
+        """Return sorted paths of at most max_results files under dir whose names match pattern."""
+        # Raise re.error for invalid regex. Regex matches like fd --type f, only regular files match,
+        # case insensitive unless it has upper case letter. Glob matches every entry like ParallelWalker.
+        rel = os.path.relpath(dir, self.root).replace(os.sep, "/")
+        rel = "" if rel == "." else rel
+        prefix = rel + "/"
+
+        if use_regex:
+            match = re.compile(pattern, 0 if any(char.isupper() for char in pattern) else re.IGNORECASE).search
+            literal = ""
+        else:
+            match = compile_glob(pattern)
+            # Table is sorted case sensitive, prefix range only works when glob is case sensitive too.
+            literal = get_glob_prefix(pattern) if os.path.normcase("A") != "a" else ""
+
+        # Without watches, search is the only chance to refresh index.
+        if self.watcher is None and not self.scanning and time.time() - self.scan_time > INDEX_RESCAN_INTERVAL:
+            self.rescan()
+
+        paths = []
+
+        with self.lock:
+            self.searches += 1
+
+            start = bisect.bisect_left(self.names, literal) if literal != "" else 0
+            for name in itertools.islice(self.names, start, None):
+                if not name.startswith(literal):
+                    break
+
+                if not match(name):
+                    continue
+
+                for dir_rel in self.name_dirs[name]:
+                    if rel != "" and dir_rel != rel and not dir_rel.startswith(prefix):
+                        continue
+
+                    if use_regex:
+                        (_, subdirs, others) = self.dirs[dir_rel]
+                        if name in subdirs or name in others:
+                            continue
+
+                    paths.append(os.path.join(self.root, dir_rel, name))
+
+        paths.sort()
+        return paths[:max_results]
+
+    def get_stats_message(self):
+        staleness = self.get_staleness()
+        if not self.is_ready():
+            state = "building"
+        elif staleness is not None:
+            state = "stale: {}".format(staleness)
+        else:
+            state = "watched"
+
+        return "Index of {}: {} directories, {} distinct names, {}; {} full scans (last {:.0f}ms), {} directories updated, {} searches.".format(
+            self.root, len(self.dirs or ()), len(self.names), state,
+            self.full_scans, self.scan_duration * 1000, self.updated_dirs, self.searches)
+
+class FilenameIndexService:
+    """Filename indexes of roots in eaf-file-manager-search-index-directories, shared by all buffers."""
+
+    def __init__(self, fallback_watcher=None):
+        self.fallback_watcher = fallback_watcher
+        self.roots = []
+        self.indexes = {}
+        self.lock = threading.Lock()
+
+    def configure(self, roots):
+        # Deepest root first, directory is searched with index of its nearest root.
+        roots = sorted(set(os.path.abspath(os.path.expanduser(root)) for root in roots), key=len, reverse=True)
+
+        with self.lock:
+            self.roots = roots
+
+            for key in [key for key in self.indexes if key[0] not in roots]:
+                self.indexes.pop(key).close()
+
+        return roots
+
+    def get(self, dir, show_hidden_file, ignore_rules):
+        # Index is built in background on first use, None if dir is not under any root.
+        dir = os.path.abspath(os.path.expanduser(dir))
+
+        with self.lock:
+            for root in self.roots:
+                if dir == root or dir.startswith(os.path.join(root, "")):
+                    key = (root, bool(show_hidden_file), bool(ignore_rules))
+                    if key not in self.indexes:
+                        self.indexes[key] = FilenameIndex(*key, self.fallback_watcher)
+                        self.indexes[key].start()
+
+                    return self.indexes[key]
+
+        return None
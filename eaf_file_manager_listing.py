@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2018 Andy Stewart
+#
+# Author:     Andy Stewart <lazycat.manatee@gmail.com>
+# Maintainer: Andy Stewart <lazycat.manatee@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Listing of directories: file info records, their wire format, sorting, marks and caches shared by all buffers.
+
+import bisect
+import os
+import re
+import stat
+
+from eaf_file_manager_lru import LruCache
+
+# Child numbers of directories, shared by all buffers: (path, show_hidden_file) -> (mtime, number)
+DIR_FILE_NUMBER_CACHE = LruCache(max_size=100000)
+
+def get_path_stat(file_path, entry=None):
+    # Symlinks are classified by their target, only dangling symlinks are "symlink".
+    # Cached stat of os.DirEntry is reused if entry is given.
+    try:
+        file_stat = entry.stat() if entry is not None else os.stat(file_path)
+    except OSError:
+        # Target is missing or unreadable, fall back to the link itself.
+        try:
+            file_stat = entry.stat(follow_symlinks=False) if entry is not None else os.lstat(file_path)
+        except OSError:
+            return ("", None)
+
+        return ("symlink" if stat.S_ISLNK(file_stat.st_mode) else "", file_stat)
+
+    if stat.S_ISREG(file_stat.st_mode):
+        return ("file", file_stat)
+    elif stat.S_ISDIR(file_stat.st_mode):
+        return ("directory", file_stat)
+    else:
+        return ("", file_stat)
+
+def count_dir_files(dir, show_hidden_file):
+    try:
+        with os.scandir(dir) as entries:
+            return sum(1 for entry in entries if show_hidden_file or not entry.name.startswith("."))
+    except OSError:
+        return 0
+
+def get_dir_entry_type(entry):
+    # Same type as get_path_stat, but read from directory without stat.
+    try:
+        if entry.is_dir():
+            return "directory"
+        elif entry.is_file():
+            return "file"
+        elif entry.is_symlink():
+            # Only symlinks whose target is missing are "symlink", like get_path_stat.
+            try:
+                entry.stat()
+            except OSError:
+                return "symlink"
+    except OSError:
+        pass
+
+    return ""
+
+def get_cached_dir_file_number(dir, mtime, show_hidden_file):
+    cache = DIR_FILE_NUMBER_CACHE.get((dir, show_hidden_file))
+
+    # Adding or removing children always changes the directory's mtime.
+    if cache is not None and cache[0] == mtime:
+        return cache[1]
+    else:
+        return None
+
+def set_cached_dir_file_number(dir, mtime, show_hidden_file, number):
+    DIR_FILE_NUMBER_CACHE.put((dir, show_hidden_file), (mtime, number))
+
+FILE_TYPES = ["directory", "file", "symlink", ""]
+FILE_TYPE_INDEXES = {file_type: index for (index, file_type) in enumerate(FILE_TYPES)}
+
+def encode_file_infos(file_infos, directory=""):
+    """Encode file infos for web page, format is documented in src/fileInfos.js."""
+    prefix = os.path.join(directory, "") if directory != "" else ""
+    if prefix != "" and not all(file_info["path"].startswith(prefix) for file_info in file_infos):
+        prefix = ""
+    prefix_length = len(prefix)
+
+    icons = {}
+    extensions = {}
+    files = []
+    marks = []
+    lines = []
+
+    for file_info in file_infos:
+        path = file_info["path"][prefix_length:]
+        name = file_info["name"]
+
+        files.append([
+            path,
+            0 if name == path else name,
+            extensions.setdefault(file_info["extension"], len(extensions)),
+            FILE_TYPE_INDEXES[file_info["type"]],
+            file_info["bytes"],
+            file_info["info"],
+            icons.setdefault(file_info["icon"], len(icons)),
+            file_info["mtime"],
+            file_info["ctime"],
+            file_info["atime"]
+        ])
+
+        if file_info.get("mark") == "mark":
+            marks.append(len(files) - 1)
+        if file_info.get("line", "") != "":
+            lines.append([len(files) - 1, file_info["line"]])
+
+    return {
+        "prefix": prefix,
+        "icons": list(icons),
+        "extensions": list(extensions),
+        "types": FILE_TYPES,
+        "files": files,
+        "marks": marks,
+        "lines": lines
+    }
+
+# Fields compared by diff_file_infos, other fields are display state owned by the web page.
+FILE_INFO_DIFF_KEYS = ["type", "bytes", "info", "icon", "mtime", "ctime"]
+
+def get_longest_increasing_indexes(sequence):
+    tail_values = []
+    tail_indexes = []
+    prev_indexes = [-1] * len(sequence)
+
+    for (index, value) in enumerate(sequence):
+        position = bisect.bisect_left(tail_values, value)
+        if position > 0:
+            prev_indexes[index] = tail_indexes[position - 1]
+
+        if position == len(tail_values):
+            tail_values.append(value)
+            tail_indexes.append(index)
+        else:
+            tail_values[position] = value
+            tail_indexes[position] = index
+
+    result = []
+    index = tail_indexes[-1] if len(tail_indexes) > 0 else -1
+    while index != -1:
+        result.append(index)
+        index = prev_indexes[index]
+    result.reverse()
+
+    return result
+
+def diff_file_infos(old_infos, new_infos):
+    # Result is applied in order: remove paths, update files in place, insert [index, file_info] in ascending order.
+    # Moved files are removed and inserted again, appliers carry their marks over.
+    old_index_dict = {file_info["path"]: index for (index, file_info) in enumerate(old_infos)}
+    new_paths = set(file_info["path"] for file_info in new_infos)
+
+    removed_paths = [file_info["path"] for file_info in old_infos if file_info["path"] not in new_paths]
+
+    kept_new_indexes = [index for (index, file_info) in enumerate(new_infos) if file_info["path"] in old_index_dict]
+    kept_old_indexes = [old_index_dict[new_infos[index]["path"]] for index in kept_new_indexes]
+
+    # Files out of the longest run that keeps old relative order have to move.
+    stay_new_indexes = set(kept_new_indexes[index] for index in get_longest_increasing_indexes(kept_old_indexes))
+
+    updated_infos = []
+    inserted_infos = []
+    for (index, file_info) in enumerate(new_infos):
+        if index in stay_new_indexes:
+            old_info = old_infos[old_index_dict[file_info["path"]]]
+            if any(old_info.get(key) != file_info[key] for key in FILE_INFO_DIFF_KEYS):
+                updated_infos.append(file_info)
+        else:
+            if file_info["path"] in old_index_dict:
+                removed_paths.append(file_info["path"])
+            inserted_infos.append([index, file_info])
+
+    return (removed_paths, updated_infos, inserted_infos)
+
+def get_dir_mtime(path):
+    try:
+        return os.stat(os.path.expanduser(path)).st_mtime_ns
+    except OSError:
+        return None
+
+FILE_SORT_KEYS = ["name", "extension", "type", "bytes", "mtime", "ctime", "atime"]
+NATURAL_SORT_PATTERN = re.compile(r"(\d+)")
+
+def get_natural_sort_key(string):
+    # "file2" is ordered before "file10".
+    parts = NATURAL_SORT_PATTERN.split(string)
+    parts[1::2] = map(int, parts[1::2])
+    return tuple(parts)
+
+class FileInfoSorter:
+    """Sort one listing by type and given keys, key columns and permutations are cached per listing."""
+
+    def __init__(self, file_infos, natural=False):
+        self.source_infos = file_infos
+        self.file_infos = list(file_infos)
+        self.natural = natural
+
+        self.columns = {}
+        self.permutations = {}
+        self.inverse_permutations = {}
+        self.path_indexes = None
+
+        self.sorted_infos = None
+        self.sorted_keys = None
+        self.sorted_reverse = False
+
+    def owns(self, file_infos):
+        return file_infos is self.source_infos or file_infos is self.sorted_infos
+
+    def get_column(self, key):
+        if key not in self.columns:
+            if key == "type":
+                column = [FILE_TYPE_INDEXES.get(file_info["type"], len(FILE_TYPES)) for file_info in self.file_infos]
+            elif key == "name" and self.natural:
+                column = [get_natural_sort_key(file_info["name"]) for file_info in self.file_infos]
+            else:
+                column = [file_info[key] for file_info in self.file_infos]
+
+            self.columns[key] = column
+
+        return self.columns[key]
+
+    def invalidate(self, key):
+        self.columns.pop(key, None)
+        self.permutations = {keys: permutation for (keys, permutation) in self.permutations.items() if key not in keys}
+        self.inverse_permutations = {keys: inverse for (keys, inverse) in self.inverse_permutations.items() if keys in self.permutations}
+
+    def get_permutation(self, keys):
+        if keys not in self.permutations:
+            # Name and path break ties, so reversed order is same as sorting in reverse direction.
+            sort_keys = ["type"] + [key for key in keys if key != "type"]
+            sort_keys += [key for key in ["name", "path"] if key not in sort_keys]
+
+            key_tuples = list(zip(*[self.get_column(key) for key in sort_keys]))
+            self.permutations[keys] = sorted(range(len(self.file_infos)), key=key_tuples.__getitem__)
+
+        return self.permutations[keys]
+
+    def sort(self, keys, reverse=False):
+        keys = tuple(keys)
+        permutation = self.get_permutation(keys)
+
+        self.sorted_keys = keys
+        self.sorted_reverse = reverse
+        self.sorted_infos = [self.file_infos[index] for index in (reversed(permutation) if reverse else permutation)]
+
+        return self.sorted_infos
+
+    def get_sorted_index(self, path):
+        if self.sorted_keys is None:
+            return -1
+
+        if self.path_indexes is None:
+            self.path_indexes = {file_info["path"]: index for (index, file_info) in enumerate(self.file_infos)}
+
+        source_index = self.path_indexes.get(path)
+        if source_index is None:
+            return -1
+
+        if self.sorted_keys not in self.inverse_permutations:
+            inverse = [0] * len(self.file_infos)
+            for (sorted_index, index) in enumerate(self.get_permutation(self.sorted_keys)):
+                inverse[index] = sorted_index
+            self.inverse_permutations[self.sorted_keys] = inverse
+
+        sorted_index = self.inverse_permutations[self.sorted_keys][source_index]
+        return len(self.file_infos) - 1 - sorted_index if self.sorted_reverse else sorted_index
+
+def sort_dir_entries(entries, natural=False):
+    # Same order as FileInfoSorter sorting by name, without stat of every file.
+    get_name_key = get_natural_sort_key if natural else str
+    return sorted(entries, key=lambda entry: (FILE_TYPE_INDEXES[get_dir_entry_type(entry)], get_name_key(entry.name), entry.path))
+
+# Flip every byte of mark bitset between 0 and 1.
+MARK_TOGGLE_TABLE = bytes.maketrans(b"\x00\x01", b"\x01\x00")
+
+class FileListState:
+    """Files shown by web page with their marks, web page only reports marks and selection by index."""
+
+    def __init__(self):
+        self.files = []
+        self.marks = bytearray()
+        self.mark_number = 0
+        self.current_index = 0
+
+    def reset(self, file_infos):
+        self.files = list(file_infos)
+        self.marks = bytearray(1 if file_info.get("mark") == "mark" else 0 for file_info in self.files)
+        self.mark_number = self.marks.count(1)
+        self.current_index = 0
+
+    def append(self, file_infos):
+        self.files.extend(file_infos)
+        self.marks.extend(bytes(len(file_infos)))
+
+    def insert(self, index, file_info):
+        self.files.insert(index, file_info)
+        self.marks.insert(index, 0)
+
+    def set_current_index(self, index):
+        self.current_index = index
+
+    def set_marks(self, indexes, mark):
+        value = 1 if mark else 0
+
+        for index in indexes:
+            if 0 <= index < len(self.marks) and self.marks[index] != value:
+                self.marks[index] = value
+                self.mark_number += 1 if mark else -1
+
+    def unmark_all(self, end=None):
+        # Files web page hasn't received yet keep their marks.
+        end = len(self.marks) if end is None else min(end, len(self.marks))
+
+        self.marks[:end] = bytes(end)
+        self.mark_number = self.marks.count(1)
+
+    def toggle_marks(self, end=None):
+        end = len(self.marks) if end is None else min(end, len(self.marks))
+
+        self.marks[:end] = self.marks[:end].translate(MARK_TOGGLE_TABLE)
+        self.mark_number = self.marks.count(1)
+
+    def get_mark_indexes(self, start=0, end=None):
+        indexes = []
+        end = len(self.marks) if end is None else min(end, len(self.marks))
+
+        if self.mark_number > 0:
+            index = self.marks.find(1, start, end)
+            while index >= 0:
+                indexes.append(index)
+                index = self.marks.find(1, index + 1, end)
+
+        return indexes
+
+    def get_mark_files(self):
+        return [self.files[index] for index in self.get_mark_indexes()]
+
+    def get_select_file(self):
+        if 0 <= self.current_index < len(self.files):
+            return dict(self.files[self.current_index])
+        else:
+            return None
+
+    def get_files(self):
+        return [dict(file_info, mark="mark" if mark else "") for (file_info, mark) in zip(self.files, self.marks)]
+
+    def get_file_next_to_last_mark(self):
+        mark_indexes = self.get_mark_indexes()
+        if len(mark_indexes) == 0:
+            return None
+
+        # Select file in the last gap between marked files.
+        for i in range(len(mark_indexes) - 1, 0, -1):
+            if mark_indexes[i] - mark_indexes[i - 1] > 1:
+                return self.files[mark_indexes[i] - 1]
+
+        if mark_indexes[0] > 0:
+            return self.files[mark_indexes[0] - 1]
+        elif mark_indexes[-1] < len(self.files) - 1:
+            return self.files[mark_indexes[-1] + 1]
+        else:
+            return None
+
+    def remove_indexes(self, indexes):
+        remove_indexes = set(indexes)
+
+        self.files = [file_info for (index, file_info) in enumerate(self.files) if index not in remove_indexes]
+        self.marks = bytearray(mark for (index, mark) in enumerate(self.marks) if index not in remove_indexes)
+        self.mark_number = self.marks.count(1)
+
+    def remove_marked_files(self):
+        self.remove_indexes(self.get_mark_indexes())
+
+    def remove_select_file(self):
+        self.remove_indexes([self.current_index])
+
+    def rename(self, old_path, new_path, new_name):
+        for (index, file_info) in enumerate(self.files):
+            if file_info["path"] == old_path:
+                self.files[index] = dict(file_info, path=new_path, name=new_name)
+                break
+
+    def apply_delta(self, removed_paths, updated_infos, inserted_infos):
+        # Same as applyFileDelta of web page.
+        removed_path_set = set(removed_paths)
+        updated_info_dict = {file_info["path"]: file_info for file_info in updated_infos}
+
+        keep_files = []
+        keep_marks = []
+        # Moved files are removed and inserted again, inserted entry takes mark of removed one.
+        removed_mark_dict = {}
+        for (file_info, mark) in zip(self.files, self.marks):
+            if file_info["path"] not in removed_path_set:
+                keep_files.append(updated_info_dict.get(file_info["path"], file_info))
+                keep_marks.append(mark)
+            elif mark:
+                removed_mark_dict[file_info["path"]] = mark
+
+        # Merge inserted files in one pass, insert indexes are ascending.
+        files = []
+        marks = bytearray()
+        keep_index = 0
+        insert_index = 0
+        for index in range(len(keep_files) + len(inserted_infos)):
+            if insert_index < len(inserted_infos) and inserted_infos[insert_index][0] == index:
+                files.append(inserted_infos[insert_index][1])
+                marks.append(removed_mark_dict.get(inserted_infos[insert_index][1]["path"], 0))
+                insert_index += 1
+            else:
+                files.append(keep_files[keep_index])
+                marks.append(keep_marks[keep_index])
+                keep_index += 1
+
+        self.files = files
+        self.marks = marks
+        self.mark_number = self.marks.count(1)
+
+class DirectoryListingCache:
+    """Listings of recently visited directories, validated with mtime of directory by the buffer."""
+
+    # Rough memory cost of one file info dict, path and name strings are counted separately.
+    FILE_INFO_MEMORY = 1024
+
+    def __init__(self, max_size=32, max_memory=256 * 1024 * 1024):
+        self.listings = LruCache(max_size, max_memory, lambda listing: listing["memory"])
+
+    def configure(self, max_size, max_memory):
+        self.listings.configure(max_size, max_memory)
+
+    def get_key(self, path, show_hidden_file):
+        return (os.path.abspath(os.path.expanduser(path)), bool(show_hidden_file))
+
+    def get(self, path, show_hidden_file):
+        key = self.get_key(path, show_hidden_file)
+        listing = self.listings.get(key)
+
+        if listing is not None:
+            # Hand out copies, buffers change file infos in place when sorting.
+            listing = dict(listing)
+            listing["file_infos"] = [dict(file_info) for file_info in listing["file_infos"]]
+
+        return listing
+
+    def put(self, path, show_hidden_file, mtime, file_infos):
+        memory = sum(self.FILE_INFO_MEMORY + len(file_info["path"]) + len(file_info["name"]) for file_info in file_infos)
+
+        self.listings.put(self.get_key(path, show_hidden_file), {
+            "mtime": mtime,
+            "file_infos": [dict(file_info) for file_info in file_infos],
+            "memory": memory,
+            "select_path": "",
+            "scroll_top": -1
+        })
+
+    def remember_position(self, path, show_hidden_file, select_path, scroll_top):
+        listing = self.listings.get(self.get_key(path, show_hidden_file))
+
+        if listing is not None:
+            listing["select_path"] = select_path
+            listing["scroll_top"] = scroll_top
+
+DIRECTORY_LISTING_CACHE = DirectoryListingCache()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2018 Andy Stewart
+#
+# Author:     Andy Stewart <lazycat.manatee@gmail.com>
+# Maintainer: Andy Stewart <lazycat.manatee@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import threading
+
+class LruCache:
+    """Least recently used cache bounded by number of entries and total memory of values, safe to share between threads."""
+
+    def __init__(self, max_size=None, max_memory=None, get_memory=None, on_evict=None):
+        self.max_size = max_size
+        self.max_memory = max_memory
+        # Memory of one value, entries don't count against max_memory without it.
+        self.get_memory = get_memory
+        # Called with key and value of evicted entries, under lock of cache.
+        self.on_evict = on_evict
+
+        self.entries = collections.OrderedDict()
+        self.memory = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def keys(self):
+        with self.lock:
+            return list(self.entries)
+
+    def configure(self, max_size=None, max_memory=None):
+        with self.lock:
+            if max_size is not None:
+                self.max_size = max_size
+            if max_memory is not None:
+                self.max_memory = max_memory
+
+            self.evict()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return self.entries[key][0]
+
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        memory = self.get_memory(value) if self.get_memory is not None else 0
+
+        with self.lock:
+            self.remove(key)
+
+            if self.max_memory is not None and memory > self.max_memory:
+                # Value would evict everything else and then itself.
+                if self.on_evict is not None:
+                    self.on_evict(key, value)
+                return
+
+            self.entries[key] = (value, memory)
+            self.memory += memory
+
+            self.evict()
+
+    def pop(self, key, default=None):
+        with self.lock:
+            entry = self.remove(key)
+            return entry[0] if entry is not None else default
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.memory = 0
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.memory -= entry[1]
+
+        return entry
+
+    def evict(self):
+        while len(self.entries) > 0 and ((self.max_size is not None and len(self.entries) > self.max_size) or
+                                         (self.max_memory is not None and self.memory > self.max_memory)):
+            (key, (value, memory)) = self.entries.popitem(last=False)
+            self.memory -= memory
+
+            if self.on_evict is not None:
+                self.on_evict(key, value)
+
+    def get_stats_message(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            hit_rate = self.hits * 100 / lookups if lookups > 0 else 0
+
+            return "{} entries, {} hits, {} misses, {:.1f}% hit rate".format(len(self.entries), self.hits, self.misses, hit_rate)
@@ -0,0 +1,565 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2018 Andy Stewart
+#
+# Author:     Andy Stewart <lazycat.manatee@gmail.com>
+# Maintainer: Andy Stewart <lazycat.manatee@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Preview of files: directory heads, code highlighting, EXIF of images and the caches and workers behind them.
+
+import concurrent.futures
+import functools
+import hashlib
+import io
+import json
+import os
+import struct
+import threading
+import time
+
+from pygments.formatters import HtmlFormatter
+from pygments.lexers import get_lexer_for_filename, html
+from pygments.token import Token
+from pygments.util import ClassNotFound
+
+from eaf_file_manager_listing import get_dir_entry_type
+from eaf_file_manager_lru import LruCache
+
+# Directory preview only shows head of sorted children, and reads at most SCAN_LIMIT entries before showing it,
+# children of larger directory are counted in background.
+DIRECTORY_PREVIEW_MAX_ENTRIES = 200
+DIRECTORY_PREVIEW_SCAN_LIMIT = 10000
+
+def scan_directory_preview(dir, show_hidden_file, cancelled=None):
+    """Return (name, type) of at most DIRECTORY_PREVIEW_SCAN_LIMIT children of dir, and whether they are all children."""
+    entries = []
+
+    with os.scandir(dir) as dir_entries:
+        for entry in dir_entries:
+            if not show_hidden_file and entry.name.startswith("."):
+                continue
+
+            if len(entries) >= DIRECTORY_PREVIEW_SCAN_LIMIT:
+                return (entries, False)
+
+            if cancelled is not None and len(entries) % 256 == 0 and cancelled():
+                raise PreviewCancelled()
+
+            entries.append((entry.name, get_dir_entry_type(entry)))
+
+    return (entries, True)
+
+# EXIF tags shown in image preview, names are same as keys of exif package.
+EXIF_TAGS = {
+    0x010F: "make",
+    0x0110: "model",
+    0x0112: "orientation",
+    0x0132: "datetime",
+    0x829A: "exposure_time",
+    0x829D: "f_number",
+    0x8827: "photographic_sensitivity",
+    0x9003: "datetime_original",
+    0x920A: "focal_length",
+    0xA002: "pixel_x_dimension",
+    0xA003: "pixel_y_dimension",
+    0xA434: "lens_model",
+}
+EXIF_IFD_POINTER_TAG = 0x8769
+# Size of one value of each TIFF field type.
+EXIF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8}
+# JPEG headers before APP1 are skipped with seek, give up if APP1 isn't found in this many bytes.
+EXIF_MAX_HEADER_SIZE = 256 * 1024
+# TIFF based raw files keep IFD0 at the beginning, values beyond this size are ignored.
+EXIF_MAX_TIFF_SIZE = 64 * 1024
+
+def read_jpeg_exif_segment(f):
+    # Only headers are read, image data is skipped with seek.
+    if f.read(2) != b"\xff\xd8":
+        return None
+
+    while f.tell() < EXIF_MAX_HEADER_SIZE:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+
+        if marker[1] in (0x01, 0xFF) or 0xD0 <= marker[1] <= 0xD8:
+            # Markers without length.
+            continue
+        elif marker[1] in (0xD9, 0xDA):
+            # End of image or start of scan, no more headers.
+            return None
+
+        length = f.read(2)
+        if len(length) < 2:
+            return None
+        length = struct.unpack(">H", length)[0] - 2
+
+        if marker[1] == 0xE1:
+            segment = f.read(length)
+            if segment.startswith(b"Exif\x00\x00"):
+                return segment[6:]
+        else:
+            f.seek(length, os.SEEK_CUR)
+
+    return None
+
+def parse_tiff_exif(data):
+    """Return EXIF_TAGS values of IFD0 and Exif IFD of TIFF data as strings."""
+    if data[:2] == b"II":
+        byte_order = "<"
+    elif data[:2] == b"MM":
+        byte_order = ">"
+    else:
+        return {}
+
+    def read_value(entry):
+        (field_type, count) = struct.unpack(byte_order + "HI", entry[2:8])
+        size = EXIF_TYPE_SIZES.get(field_type, 0) * count
+        if size == 0:
+            return None
+
+        if size <= 4:
+            raw = entry[8:8 + size]
+        else:
+            offset = struct.unpack(byte_order + "I", entry[8:12])[0]
+            raw = data[offset:offset + size]
+            if len(raw) < size:
+                return None
+
+        if field_type == 2:
+            return raw.split(b"\x00", 1)[0].decode("utf-8", "replace").strip()
+        elif field_type == 3:
+            return struct.unpack(byte_order + "H", raw[:2])[0]
+        elif field_type in (4, 9):
+            return struct.unpack(byte_order + ("I" if field_type == 4 else "i"), raw[:4])[0]
+        elif field_type in (5, 10):
+            (numerator, denominator) = struct.unpack(byte_order + ("II" if field_type == 5 else "ii"), raw[:8])
+            return numerator / denominator if denominator != 0 else None
+        else:
+            return None
+
+    exif_info = {}
+    ifd_offsets = [struct.unpack(byte_order + "I", data[4:8])[0]]
+    visited_offsets = set()
+
+    while len(ifd_offsets) > 0:
+        offset = ifd_offsets.pop()
+        if offset in visited_offsets or offset + 2 > len(data):
+            continue
+        visited_offsets.add(offset)
+
+        entry_count = struct.unpack(byte_order + "H", data[offset:offset + 2])[0]
+
+        for index in range(entry_count):
+            entry = data[offset + 2 + index * 12:offset + 14 + index * 12]
+            if len(entry) < 12:
+                break
+
+            tag = struct.unpack(byte_order + "H", entry[:2])[0]
+
+            if tag == EXIF_IFD_POINTER_TAG:
+                value = read_value(entry)
+                if isinstance(value, int):
+                    ifd_offsets.append(value)
+            elif tag in EXIF_TAGS:
+                value = read_value(entry)
+                if value is not None and value != "":
+                    exif_info[EXIF_TAGS[tag]] = str(value)
+
+    return exif_info
+
+def read_file_exif(file_path):
+    with open(file_path, "rb") as f:
+        head = f.read(4)
+        f.seek(0)
+
+        if head in (b"II*\x00", b"MM\x00*"):
+            data = f.read(EXIF_MAX_TIFF_SIZE)
+        else:
+            data = read_jpeg_exif_segment(f)
+
+    if data is None:
+        return {}
+
+    try:
+        return parse_tiff_exif(data)
+    except struct.error:
+        return {}
+
+class ExifReader:
+    """EXIF of images cached by (device, inode, size, mtime), shared by all buffers."""
+
+    def __init__(self, max_size=4096):
+        self.cache = LruCache(max_size)
+
+    def read(self, file_path, file_stat=None):
+        try:
+            if file_stat is None:
+                file_stat = os.stat(file_path)
+            key = (file_stat.st_dev, file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns)
+        except OSError:
+            return {}
+
+        exif_info = self.cache.get(key)
+        if exif_info is not None:
+            return exif_info
+
+        try:
+            exif_info = read_file_exif(file_path)
+        except OSError:
+            return {}
+
+        self.cache.put(key, exif_info)
+
+        return exif_info
+
+EXIF_READER = ExifReader()
+
+# Code preview only reads head of file, and only highlights head that is small enough.
+CODE_PREVIEW_MAX_BYTES = 512 * 1024
+CODE_PREVIEW_MAX_LINES = 5000
+CODE_PREVIEW_HIGHLIGHT_SIZE = 128 * 1024
+CODE_PREVIEW_HIGHLIGHT_TIME = 0.2
+
+CODE_LEXER_CACHE = {}
+
+def read_file_head(file_path, max_bytes, max_lines):
+    with open(file_path, "rb") as f:
+        data = f.read(max_bytes + 1)
+
+    truncated = len(data) > max_bytes
+    data = data[:max_bytes]
+
+    lines = data.split(b"\n", max_lines)
+    if len(lines) > max_lines:
+        truncated = True
+        data = b"\n".join(lines[:max_lines])
+
+    return (data.decode("utf-8", errors="ignore"), truncated)
+
+def get_code_lexer(file_path):
+    # Lexers are cached by extension, None if file name has no lexer.
+    file_name = os.path.basename(file_path)
+    extension = os.path.splitext(file_name)[1].lower()
+    key = extension if extension != "" else file_name
+
+    if key not in CODE_LEXER_CACHE:
+        if extension == ".vue":
+            lexer = html.HtmlLexer(stripnl=False, ensurenl=False)
+        else:
+            try:
+                # Keep leading newlines and don't add trailing one, so length of tokens matches content.
+                lexer = get_lexer_for_filename(file_name, stripnl=False, ensurenl=False)
+            except ClassNotFound:
+                lexer = None
+
+        CODE_LEXER_CACHE[key] = lexer
+
+    return CODE_LEXER_CACHE[key]
+
+def get_code_style_name(theme_mode):
+    # All styles please look: https://pygments.org/styles/
+    return "monokai" if theme_mode == "dark" else "stata-light"
+
+@functools.lru_cache(maxsize=None)
+def get_code_style_defs(style_name):
+    return HtmlFormatter(style=style_name).get_style_defs(".highlight")
+
+class PreviewCache:
+    """Highlighted preview HTML in memory and on disk, keyed by file, lexer and style, shared by all buffers."""
+
+    # Bump it when HTML of highlight_file_head changes, old entries will miss.
+    VERSION = 1
+
+    def __init__(self, max_disk_size=128 * 1024 * 1024, max_memory_size=16 * 1024 * 1024):
+        cache_home = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+        self.cache_dir = os.path.join(cache_home, "eaf-file-manager", "preview")
+
+        self.max_disk_size = max_disk_size
+        self.memory_entries = LruCache(max_memory=max_memory_size, get_memory=len)
+
+        # Name to size of disk entries, loaded from cache directory on first use.
+        self.disk_entries = None
+
+        self.lock = threading.Lock()
+
+    def configure(self, max_disk_size):
+        with self.lock:
+            self.max_disk_size = max_disk_size
+
+            if self.disk_entries is not None:
+                self.disk_entries.configure(max_memory=max_disk_size)
+
+    def get_key(self, file_path, file_stat, lexer_name, theme_mode, style_name):
+        key = json.dumps([self.VERSION, file_path, file_stat.st_size, file_stat.st_mtime_ns, lexer_name, theme_mode, style_name])
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def load_disk_entries(self):
+        if self.disk_entries is not None:
+            return
+
+        entries = []
+        try:
+            with os.scandir(self.cache_dir) as dir_entries:
+                for entry in dir_entries:
+                    if entry.name.endswith(".html"):
+                        entry_stat = entry.stat()
+                        entries.append((entry_stat.st_mtime, entry.name, entry_stat.st_size))
+        except OSError:
+            pass
+
+        # File mtime records last use, so order of entries survives Emacs restarts.
+        self.disk_entries = LruCache(max_memory=self.max_disk_size, get_memory=lambda size: size, on_evict=self.remove_disk_entry)
+        for (_, name, size) in sorted(entries):
+            self.disk_entries.put(name, size)
+
+    def remove_disk_entry(self, name, size):
+        try:
+            os.remove(os.path.join(self.cache_dir, name))
+        except OSError:
+            pass
+
+    def get(self, key):
+        html_content = self.memory_entries.get(key)
+        if html_content is not None:
+            return html_content
+
+        with self.lock:
+            self.load_disk_entries()
+
+            name = key + ".html"
+            if self.disk_entries.get(name) is None:
+                return None
+
+            path = os.path.join(self.cache_dir, name)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    html_content = f.read()
+                os.utime(path)
+            except OSError:
+                self.disk_entries.pop(name)
+                return None
+
+        self.memory_entries.put(key, html_content)
+
+        return html_content
+
+    def put(self, key, html_content):
+        self.memory_entries.put(key, html_content)
+
+        with self.lock:
+            if self.max_disk_size <= 0:
+                return
+
+            self.load_disk_entries()
+
+            name = key + ".html"
+            path = os.path.join(self.cache_dir, name)
+            data = html_content.encode("utf-8")
+
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+
+                # Write to temporary file first, other Emacs may read the same entry.
+                temp_path = "{}.{}.tmp".format(path, os.getpid())
+                with open(temp_path, "wb") as f:
+                    f.write(data)
+                os.replace(temp_path, path)
+            except OSError:
+                return
+
+            self.disk_entries.put(name, len(data))
+
+PREVIEW_CACHE = PreviewCache()
+
+# Previews are computed off GUI thread, shared by all file manager buffers.
+PREVIEW_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="eaf-file-manager-preview")
+
+# Raised inside preview worker when cursor has left the file being previewed.
+class PreviewCancelled(Exception):
+    pass
+
+class PreviewDelay:
+    """Debounce delay of preview, adapted to measured preview cost and key repeat rate."""
+
+    MIN_DELAY = 0.03
+    MAX_DELAY = 0.3
+    SMOOTHING = 0.3
+
+    def __init__(self):
+        self.request_interval = self.MAX_DELAY
+        self.preview_cost = 0
+        self.last_request_time = None
+
+    def record_request(self):
+        now = time.monotonic()
+
+        if self.last_request_time is not None:
+            interval = now - self.last_request_time
+
+            if interval >= self.MAX_DELAY:
+                # Cursor stopped, next move starts a new series.
+                self.request_interval = self.MAX_DELAY
+            else:
+                self.request_interval += self.SMOOTHING * (interval - self.request_interval)
+
+        self.last_request_time = now
+
+    def record_cost(self, cost):
+        self.preview_cost += self.SMOOTHING * (cost - self.preview_cost)
+
+    def get_delay_ms(self):
+        delay = self.MIN_DELAY
+
+        # While a key is held, wait a bit longer than repeat interval, so preview starts when cursor stops.
+        if self.request_interval < self.MAX_DELAY:
+            delay = max(delay, self.request_interval * 1.5)
+
+        delay = min(max(delay, self.preview_cost), self.MAX_DELAY)
+
+        return int(delay * 1000)
+
+def lower_thread_priority():
+    # On Linux nice value is per thread.
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except (AttributeError, OSError):
+        pass
+
+# Speculative previews, single low priority worker so they never delay preview of current file.
+PREFETCH_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix="eaf-file-manager-prefetch", initializer=lower_thread_priority)
+
+class PreviewPrefetcher:
+    """Previews computed ahead of cursor, validated with size and mtime of file when cursor arrives."""
+
+    # Rough memory cost of one file info of directory preview.
+    FILE_INFO_MEMORY = 512
+
+    def __init__(self, max_memory=16 * 1024 * 1024):
+        # Path to [file key, preview, memory, used].
+        self.entries = LruCache(max_memory=max_memory, get_memory=lambda entry: entry[2], on_evict=self.handle_evict)
+
+        self.prefetched = 0
+        self.hits = 0
+        # Previews evicted or invalidated before any use.
+        self.wasted = 0
+
+    @staticmethod
+    def get_file_key(path):
+        try:
+            file_stat = os.stat(path)
+        except OSError:
+            return None
+
+        return (file_stat.st_size, file_stat.st_mtime_ns)
+
+    def get_preview_memory(self, preview):
+        (path, _, _, _, html_content, file_infos, exif, image_url) = preview
+        return len(path) + len(html_content["content"]) + len(file_infos) * self.FILE_INFO_MEMORY + len(exif) * 64 + len(image_url)
+
+    def __contains__(self, path):
+        return path in self.entries
+
+    def get(self, path):
+        """Return setPreview arguments of path, or None if path isn't prefetched or has changed since."""
+        entry = self.entries.get(path)
+        if entry is None:
+            return None
+
+        if self.get_file_key(path) != entry[0]:
+            self.remove(path)
+            return None
+
+        if not entry[3]:
+            entry[3] = True
+            self.hits += 1
+
+        return entry[1]
+
+    def put(self, path, file_key, preview):
+        memory = self.get_preview_memory(preview)
+        if file_key is None or memory > self.entries.max_memory:
+            return
+
+        self.remove(path)
+        self.entries.put(path, [file_key, preview, memory, False])
+        self.prefetched += 1
+
+    def remove(self, path):
+        entry = self.entries.pop(path)
+        if entry is not None:
+            self.handle_evict(path, entry)
+
+    def handle_evict(self, path, entry):
+        if not entry[3]:
+            self.wasted += 1
+
+    def clear(self):
+        for path in self.entries.keys():
+            self.remove(path)
+
+    def get_stats_message(self):
+        return "Preview prefetch: {} prefetched, {} hits, {} wasted, {} cached ({:.1f}MB)".format(
+            self.prefetched, self.hits, self.wasted, len(self.entries), self.entries.memory / 1024 / 1024)
+
+def highlight_file_head(file_path, style_name, cancelled=None):
+    # Highlight at most CODE_PREVIEW_HIGHLIGHT_SIZE characters for at most CODE_PREVIEW_HIGHLIGHT_TIME,
+    # rest of head is shown as plain text.
+    (content, truncated) = read_file_head(file_path, CODE_PREVIEW_MAX_BYTES, CODE_PREVIEW_MAX_LINES)
+    # Same newlines as lexer output, so length of tokens is offset in content.
+    content = content.replace("\r\n", "\n").replace("\r", "\n")
+
+    lexer = get_code_lexer(file_path)
+    tokens = []
+    offset = 0
+
+    if lexer is not None:
+        highlight_end = len(content)
+        if highlight_end > CODE_PREVIEW_HIGHLIGHT_SIZE:
+            # Cut at line end, a head without newline (like minified bundle) is not highlighted at all.
+            highlight_end = content.rfind("\n", 0, CODE_PREVIEW_HIGHLIGHT_SIZE) + 1
+
+        if highlight_end > 0:
+            deadline = time.perf_counter() + CODE_PREVIEW_HIGHLIGHT_TIME
+
+            for (index, (token_type, value)) in enumerate(lexer.get_tokens(content[:highlight_end])):
+                tokens.append((token_type, value))
+                offset += len(value)
+
+                if index % 1000 == 0:
+                    if cancelled is not None and cancelled():
+                        raise PreviewCancelled()
+
+                    if time.perf_counter() > deadline:
+                        break
+            else:
+                # Lexed to the end, rest starts exactly at cut point.
+                offset = highlight_end
+
+    if offset < len(content):
+        tokens.append((Token.Text, content[offset:]))
+
+    output = io.StringIO()
+    HtmlFormatter(style=style_name).format(tokens, output)
+    html_content = output.getvalue()
+
+    if truncated:
+        html_content += '<div class="eaf-file-manager-preview-truncated">File is too large, only show the first {} lines or {}KB.</div>'.format(
+            CODE_PREVIEW_MAX_LINES, CODE_PREVIEW_MAX_BYTES // 1024)
+
+    return html_content
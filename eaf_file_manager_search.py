@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2018 Andy Stewart
+#
+# Author:     Andy Stewart <lazycat.manatee@gmail.com>
+# Maintainer: Andy Stewart <lazycat.manatee@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# File search in Python: .gitignore rules, parallel directory walk and content grep.
+
+import concurrent.futures
+import fnmatch
+import mmap
+import os
+import queue
+import re
+import threading
+import time
+
+# Version control directories, never searched when ignore rules are enabled.
+SEARCH_VCS_DIRS = [".git", ".hg", ".svn", ".bzr", "_darcs", "CVS"]
+SEARCH_IGNORE_FILES = [".gitignore", ".ignore"]
+# Search results are sent to web page when batch is this large, or this many seconds old.
+SEARCH_BATCH_SIZE = 1000
+SEARCH_BATCH_TIME = 0.3
+SEARCH_WORKERS = 8
+# Search stops after this many results, so a search of "." on "/" doesn't run away.
+SEARCH_MAX_RESULTS = 100000
+
+def compile_glob(pattern):
+    # Same as fnmatch.fnmatch, but pattern is translated only once.
+    flags = re.IGNORECASE if os.path.normcase("A") == "a" else 0
+    return re.compile(fnmatch.translate(pattern), flags).match
+
+def translate_ignore_pattern(pattern):
+    # * and ? never match "/", ** matches any number of directories.
+    regex = ""
+    index = 0
+
+    while index < len(pattern):
+        char = pattern[index]
+
+        if pattern.startswith("**/", index):
+            regex += "(?:.*/)?"
+            index += 3
+        elif pattern.startswith("/**", index) and index + 3 == len(pattern):
+            regex += "/.*"
+            index += 3
+        elif char == "*":
+            regex += "[^/]*"
+            index += 1
+        elif char == "?":
+            regex += "[^/]"
+            index += 1
+        elif char == "[" and pattern.find("]", index + 2) > 0:
+            end = pattern.find("]", index + 2)
+            content = pattern[index + 1:end].replace("\\", "\\\\")
+            if content.startswith("!"):
+                content = "^" + content[1:]
+            regex += "[" + content + "]"
+            index = end + 1
+        elif char == "\\" and index + 1 < len(pattern):
+            regex += re.escape(pattern[index + 1])
+            index += 2
+        else:
+            regex += re.escape(char)
+            index += 1
+
+    return regex
+
+class IgnoreRules:
+    """Rules of .gitignore and .ignore files of one directory, base is its path relative to search root."""
+
+    def __init__(self, base):
+        self.base = base
+        self.rules = []
+
+    @classmethod
+    def load(cls, dir, base, names):
+        # None if dir has no ignore file, names are children of dir.
+        ignore_rules = None
+
+        for ignore_file in SEARCH_IGNORE_FILES:
+            if ignore_file in names:
+                try:
+                    with open(os.path.join(dir, ignore_file), "r", encoding="utf-8", errors="replace") as f:
+                        lines = f.read().splitlines()
+                except OSError:
+                    continue
+
+                if ignore_rules is None:
+                    ignore_rules = cls(base)
+
+                for line in lines:
+                    ignore_rules.add(line)
+
+        return ignore_rules
+
+    def add(self, line):
+        if line.startswith("#") or line.strip() == "":
+            return
+
+        if not line.endswith("\\ "):
+            line = line.rstrip()
+
+        negate = line.startswith("!")
+        if negate or line.startswith("\\!") or line.startswith("\\#"):
+            line = line[1:]
+
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        if line == "":
+            return
+
+        # Pattern with slash is anchored to directory of ignore file, otherwise it matches name at any depth.
+        anchored = "/" in line
+        regex = translate_ignore_pattern(line.lstrip("/"))
+        if not anchored:
+            regex = "(?:.*/)?" + regex
+
+        self.rules.append((re.compile(regex, re.DOTALL), negate, dir_only))
+
+    def match(self, path, is_dir):
+        """Return True if path is ignored, False if it's re-included by negated rule, None if no rule matches."""
+        # Later rules override earlier rules.
+        for (regex, negate, dir_only) in reversed(self.rules):
+            if (is_dir or not dir_only) and regex.fullmatch(path):
+                return not negate
+
+        return None
+
+def is_ignored(ignore_rules, path, is_dir):
+    # Rules of deeper directories override rules of their parents.
+    for rules in reversed(ignore_rules):
+        result = rules.match(path[len(rules.base) + 1:] if rules.base != "" else path, is_dir)
+        if result is not None:
+            return result
+
+    return False
+
+def scan_search_dir(dir, path, show_hidden_file, use_ignore_rules, ignore_rules):
+    """Return (ignore_rules, children) of dir, or None if dir can't be read."""
+    # ignore_rules of result add rules of dir to rules of its ancestors,
+    # children are (entry, is_dir, entry_path), entry_path is relative to search root if ignore rules are used.
+    try:
+        with os.scandir(dir) as entries:
+            entries = list(entries)
+    except OSError:
+        return None
+
+    if use_ignore_rules:
+        dir_rules = IgnoreRules.load(dir, path, set(entry.name for entry in entries))
+        if dir_rules is not None:
+            ignore_rules = ignore_rules + (dir_rules,)
+
+    children = []
+
+    for entry in entries:
+        name = entry.name
+
+        if not show_hidden_file and name.startswith("."):
+            continue
+
+        try:
+            is_dir = entry.is_dir(follow_symlinks=False)
+        except OSError:
+            is_dir = False
+
+        # Relative path is only needed to match ignore rules.
+        entry_path = None
+
+        if use_ignore_rules:
+            if is_dir and name in SEARCH_VCS_DIRS:
+                continue
+
+            entry_path = path + "/" + name if path != "" else name
+            if len(ignore_rules) > 0 and is_ignored(ignore_rules, entry_path, is_dir):
+                continue
+
+        children.append((entry, is_dir, entry_path))
+
+    return (ignore_rules, children)
+
+class ParallelWalker:
+    """Yield batches of os.DirEntry under root whose names match glob pattern, directories are scanned by a pool of threads."""
+
+    # Every directory is one task, so large subtrees are split across the pool,
+    # scandir releases GIL while reading directories.
+
+    def __init__(self, root, pattern, show_hidden_file=True, ignore_rules=False, workers=SEARCH_WORKERS):
+        self.root = root
+        self.match = compile_glob(pattern)
+        self.show_hidden_file = show_hidden_file
+        self.ignore_rules = ignore_rules
+        self.workers = workers
+
+        self.tasks = queue.Queue()
+        self.results = queue.Queue()
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.stopped = False
+
+    def walk(self):
+        self.add_task(self.root, "", ())
+
+        for _ in range(self.workers):
+            threading.Thread(target=self.work, name="eaf-file-manager-search", daemon=True).start()
+
+        batch = []
+        batch_time = time.monotonic()
+
+        try:
+            while True:
+                try:
+                    entries = self.results.get(timeout=SEARCH_BATCH_TIME)
+                except queue.Empty:
+                    entries = []
+
+                if entries is None or self.stopped:
+                    break
+
+                batch.extend(entries)
+
+                now = time.monotonic()
+                if len(batch) >= SEARCH_BATCH_SIZE or (len(batch) > 0 and now - batch_time >= SEARCH_BATCH_TIME):
+                    yield batch
+
+                    batch = []
+                    batch_time = now
+
+            if len(batch) > 0:
+                yield batch
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.stopped = True
+        self.stop_workers()
+
+    def stop_workers(self):
+        for _ in range(self.workers):
+            self.tasks.put(None)
+
+    def add_task(self, dir, path, ignore_rules):
+        with self.lock:
+            self.pending += 1
+
+        self.tasks.put((dir, path, ignore_rules))
+
+    def work(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                return
+
+            if not self.stopped:
+                self.scan(*task)
+
+            with self.lock:
+                self.pending -= 1
+                finished = self.pending == 0
+
+            if finished:
+                # Walk is complete, not stopped, results still queued must be yielded.
+                self.results.put(None)
+                self.stop_workers()
+
+    def scan(self, dir, path, ignore_rules):
+        listing = scan_search_dir(dir, path, self.show_hidden_file, self.ignore_rules, ignore_rules)
+        if listing is None:
+            return
+
+        (ignore_rules, children) = listing
+        matches = []
+
+        for (entry, is_dir, entry_path) in children:
+            if self.match(entry.name):
+                matches.append(entry)
+
+            if is_dir:
+                self.add_task(entry.path, entry_path, ignore_rules)
+
+        if len(matches) > 0:
+            self.results.put(matches)
+
+# Files larger than this are not searched for content.
+GREP_MAX_FILE_SIZE = 16 * 1024 * 1024
+# File with NUL byte in its head is binary, same heuristic as grep and git.
+GREP_BINARY_CHECK_SIZE = 8192
+# Smaller files are read at once instead of mapped.
+GREP_MMAP_MIN_SIZE = 64 * 1024
+GREP_PREVIEW_LENGTH = 80
+GREP_CHUNK_SIZE = 32
+GREP_WORKERS = min(8, os.cpu_count() or 1)
+
+GREP_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=GREP_WORKERS, thread_name_prefix="eaf-file-manager-grep")
+
+def compile_grep_regex(pattern):
+    # Case insensitive unless pattern has upper case letter, like rg --smart-case.
+    flags = re.MULTILINE if any(char.isupper() for char in pattern) else re.MULTILINE | re.IGNORECASE
+    return re.compile(pattern.encode("utf-8"), flags)
+
+def format_grep_preview(line_number, line):
+    text = " ".join(line.decode("utf-8", "replace").split())
+    if len(text) > GREP_PREVIEW_LENGTH:
+        text = text[:GREP_PREVIEW_LENGTH - 1] + "…"
+
+    return "{}: {}".format(line_number, text)
+
+def grep_file(file_path, regex):
+    """Return (line number, line) of first match of regex in file, None for empty, large or binary files."""
+    try:
+        with open(file_path, "rb") as f:
+            file_size = os.fstat(f.fileno()).st_size
+            if file_size == 0 or file_size > GREP_MAX_FILE_SIZE:
+                return None
+
+            head = f.read(GREP_BINARY_CHECK_SIZE)
+            if b"\0" in head:
+                return None
+
+            if file_size < GREP_MMAP_MIN_SIZE:
+                data = head + f.read()
+            else:
+                # Pages are read by kernel as regex scans them, no copy of whole file in Python.
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+            try:
+                match = regex.search(data)
+                if match is None:
+                    return None
+
+                line_start = data.rfind(b"\n", 0, match.start()) + 1
+                line_end = data.find(b"\n", match.start())
+                if line_end < 0:
+                    line_end = len(data)
+
+                line_number = data[:line_start].count(b"\n") + 1
+                return (line_number, data[line_start:min(line_end, line_start + GREP_PREVIEW_LENGTH * 4)])
+            finally:
+                if isinstance(data, mmap.mmap):
+                    data.close()
+    except (OSError, ValueError):
+        return None
+
+def grep_entries(entries, regex, cancelled):
+    # Run in GREP_EXECUTOR.
+    matches = []
+
+    for entry in entries:
+        if cancelled():
+            break
+
+        match = grep_file(entry.path, regex)
+        if match is not None:
+            matches.append((entry, format_grep_preview(*match)))
+
+    return matches
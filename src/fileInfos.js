@@ -0,0 +1,137 @@
+/* Decoder of compact file infos payload, which is encoded by encode_file_infos in eaf_file_manager_listing.py.
+ *
+ * Payload is {prefix, icons, extensions, types, files, marks, lines}, every file is an array of
+ * [path, name, extension, type, bytes, info, icon, mtime, ctime, atime]:
+ * path is relative to prefix, name is 0 when it's same as relative path,
+ * extension, type and icon are indexes of the interned tables.
+ * Marks are indexes of marked files, lines are [index, line] of files with matched line of content search.
+ */
+
+const FILE_PATH = 0;
+const FILE_NAME = 1;
+const FILE_EXTENSION = 2;
+const FILE_TYPE = 3;
+const FILE_BYTES = 4;
+const FILE_INFO = 5;
+const FILE_ICON = 6;
+const FILE_MTIME = 7;
+const FILE_CTIME = 8;
+const FILE_ATIME = 9;
+
+/* Fields are decoded lazily from the frozen row, Vue only observe row, table and display states. */
+class FileRow {
+  constructor(table, row) {
+    this.table = table;
+    this.row = row;
+    this.mark = "";
+    this.changed = "";
+    this.match = "";
+    this.line = "";
+  }
+
+  get path() { return this.table.prefix + this.row[FILE_PATH] }
+  set path(value) {
+    var row = this.row.slice();
+
+    if (row[FILE_NAME] === 0) {
+      row[FILE_NAME] = row[FILE_PATH];
+    }
+
+    if (value.startsWith(this.table.prefix)) {
+      row[FILE_PATH] = value.substring(this.table.prefix.length);
+    } else {
+      this.table = Object.freeze(Object.assign({}, this.table, { prefix: "" }));
+      row[FILE_PATH] = value;
+    }
+
+    this.row = Object.freeze(row);
+  }
+
+  get name() { return this.row[FILE_NAME] === 0 ? this.row[FILE_PATH] : this.row[FILE_NAME] }
+  set name(value) { this.setColumn(FILE_NAME, value) }
+
+  get extension() { return this.table.extensions[this.row[FILE_EXTENSION]] }
+  set extension(value) { this.setColumn(FILE_EXTENSION, this.internValue("extensions", value)) }
+
+  get type() { return this.table.types[this.row[FILE_TYPE]] }
+  set type(value) { this.setColumn(FILE_TYPE, this.internValue("types", value)) }
+
+  get icon() { return this.table.icons[this.row[FILE_ICON]] }
+  set icon(value) { this.setColumn(FILE_ICON, this.internValue("icons", value)) }
+
+  get bytes() { return this.row[FILE_BYTES] }
+  set bytes(value) { this.setColumn(FILE_BYTES, value) }
+
+  get info() { return this.row[FILE_INFO] }
+  set info(value) { this.setColumn(FILE_INFO, value) }
+
+  get mtime() { return this.row[FILE_MTIME] }
+  set mtime(value) { this.setColumn(FILE_MTIME, value) }
+
+  get ctime() { return this.row[FILE_CTIME] }
+  set ctime(value) { this.setColumn(FILE_CTIME, value) }
+
+  get atime() { return this.row[FILE_ATIME] }
+  set atime(value) { this.setColumn(FILE_ATIME, value) }
+
+  setColumn(column, value) {
+    var row = this.row.slice();
+    row[column] = value;
+    this.row = Object.freeze(row);
+  }
+
+  internValue(tableKey, value) {
+    var index = this.table[tableKey].indexOf(value);
+
+    if (index < 0) {
+      var table = Object.assign({}, this.table);
+      table[tableKey] = this.table[tableKey].concat([value]);
+      this.table = Object.freeze(table);
+
+      index = table[tableKey].length - 1;
+    }
+
+    return index;
+  }
+
+  /* Take file fields of other row, keep display states. */
+  update(file) {
+    this.table = file.table;
+    this.row = file.row;
+  }
+
+  toJSON() {
+    return {
+      "path": this.path,
+      "name": this.name,
+      "extension": this.extension,
+      "type": this.type,
+      "bytes": this.bytes,
+      "info": this.info,
+      "mark": this.mark,
+      "changed": this.changed,
+      "match": this.match,
+      "line": this.line,
+      "icon": this.icon,
+      "mtime": this.mtime,
+      "ctime": this.ctime,
+      "atime": this.atime
+    };
+  }
+}
+
+export function decodeFiles(payload) {
+  var table = Object.freeze({
+    prefix: payload.prefix,
+    icons: payload.icons,
+    extensions: payload.extensions,
+    types: payload.types
+  });
+
+  var files = payload.files.map(row => new FileRow(table, Object.freeze(row)));
+
+  (payload.marks || []).forEach(index => { files[index].mark = "mark" });
+  (payload.lines || []).forEach(([index, line]) => { files[index].line = line });
+
+  return files;
+}
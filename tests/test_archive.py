@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Tests of eaf_file_manager_archive.py.
+#
+# Run them from the file-manager directory:
+#
+#     python3 -m pytest tests
+
+import io
+import os
+import sys
+import tarfile
+import zipfile
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from eaf_file_manager_archive import read_tar_entries, read_zip_entries
+from eaf_file_manager_preview import PreviewCancelled
+
+def write_zip(file_path, prefix=b""):
+    with open(file_path, "wb") as f:
+        f.write(prefix)
+        with zipfile.ZipFile(f, "w") as archive:
+            archive.writestr("dir/", b"")
+            archive.writestr("dir/a.txt", b"a" * 100)
+            archive.writestr("文件.txt", b"b")
+
+            link = zipfile.ZipInfo("link")
+            link.create_system = 3
+            link.external_attr = (0o120777 << 16)
+            archive.writestr(link, b"dir/a.txt")
+
+def write_tar(file_path, mode):
+    with tarfile.open(file_path, mode) as archive:
+        directory = tarfile.TarInfo("dir")
+        directory.type = tarfile.DIRTYPE
+        archive.addfile(directory)
+
+        member = tarfile.TarInfo("dir/a.txt")
+        member.size = 100
+        archive.addfile(member, io.BytesIO(b"a" * 100))
+
+        link = tarfile.TarInfo("link")
+        link.type = tarfile.SYMTYPE
+        link.linkname = "dir/a.txt"
+        archive.addfile(link)
+
+def test_zip_entries(tmp_path):
+    file_path = str(tmp_path / "a.zip")
+    write_zip(file_path)
+
+    assert read_zip_entries(file_path, 100) == (
+        [("dir/", "directory", 0), ("dir/a.txt", "file", 100), ("文件.txt", "file", 1), ("link", "symlink", 9)], 4)
+
+def test_zip_entries_are_limited(tmp_path):
+    file_path = str(tmp_path / "a.zip")
+    write_zip(file_path)
+
+    assert read_zip_entries(file_path, 2) == ([("dir/", "directory", 0), ("dir/a.txt", "file", 100)], 4)
+
+def test_zip_with_prepended_data(tmp_path):
+    # Self-extracting archives have a stub before the zip data.
+    file_path = str(tmp_path / "a.exe")
+    write_zip(file_path, b"MZ" + b"\x00" * 1000)
+
+    (entries, number) = read_zip_entries(file_path, 100)
+
+    assert number == 4
+    assert entries[1] == ("dir/a.txt", "file", 100)
+
+def test_zip64_entries(tmp_path, monkeypatch):
+    # Lower limits of zipfile, so small archive has zip64 end record and zip64 sizes.
+    monkeypatch.setattr(zipfile, "ZIP64_LIMIT", 5)
+    monkeypatch.setattr(zipfile, "ZIP_FILECOUNT_LIMIT", 0)
+
+    file_path = str(tmp_path / "a.zip")
+    with zipfile.ZipFile(file_path, "w") as archive:
+        archive.writestr("big.bin", b"x" * 10)
+
+    with open(file_path, "rb") as f:
+        data = f.read()
+    assert b"PK\x06\x06" in data and b"\xff\xff\xff\xff" in data
+
+    assert read_zip_entries(file_path, 100) == ([("big.bin", "file", 10)], 1)
+
+def test_invalid_zip(tmp_path):
+    file_path = tmp_path / "a.zip"
+    file_path.write_bytes(b"not a zip file")
+
+    with pytest.raises(zipfile.BadZipFile):
+        read_zip_entries(str(file_path), 100)
+
+def test_cancelled_zip(tmp_path):
+    file_path = str(tmp_path / "a.zip")
+    write_zip(file_path)
+
+    with pytest.raises(PreviewCancelled):
+        read_zip_entries(file_path, 100, lambda: True)
+
+@pytest.mark.parametrize("mode", ["w", "w:gz", "w:bz2", "w:xz"])
+def test_tar_entries(tmp_path, mode):
+    file_path = str(tmp_path / "a.tar")
+    write_tar(file_path, mode)
+
+    assert read_tar_entries(file_path, 100) == (
+        [("dir/", "directory", 0), ("dir/a.txt", "file", 100), ("link", "symlink", 0)], 3)
+
+def test_tar_entries_are_limited_but_counted(tmp_path):
+    file_path = str(tmp_path / "a.tar")
+    write_tar(file_path, "w")
+
+    assert read_tar_entries(file_path, 1) == ([("dir/", "directory", 0)], 3)
+
+def test_invalid_tar(tmp_path):
+    file_path = tmp_path / "a.tar"
+    file_path.write_bytes(b"not a tar file")
+
+    with pytest.raises(tarfile.ReadError):
+        read_tar_entries(str(file_path), 100)
+
+def test_cancelled_tar(tmp_path):
+    file_path = str(tmp_path / "a.tar")
+    write_tar(file_path, "w")
+
+    with pytest.raises(PreviewCancelled):
+        read_tar_entries(file_path, 100, lambda: True)
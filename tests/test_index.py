@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Tests of eaf_file_manager_index.py.
+#
+# Run them from the file-manager directory:
+#
+#     python3 -m pytest tests
+
+import os
+import queue
+import re
+import sys
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+import eaf_file_manager_index
+from eaf_file_manager_index import FilenameIndex
+
+@pytest.fixture
+def root(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+
+    root = tmp_path / "root"
+    (root / "sub" / "deep").mkdir(parents=True)
+    (root / "pydir").mkdir()
+    (root / "ignored").mkdir()
+    for path in ["a.py", "b.txt", ".hidden.py", "sub/c.py", "sub/deep/d.PY", "ignored/e.py"]:
+        (root / path).write_text(path)
+    (root / "link.py").symlink_to("a.py")
+    (root / ".gitignore").write_text("ignored/\n")
+
+    return str(root)
+
+@pytest.fixture
+def make_index():
+    indexes = []
+
+    def make_index(root, show_hidden_file=False, ignore_rules=True):
+        index = FilenameIndex(root, show_hidden_file, ignore_rules)
+        indexes.append(index)
+        return index
+
+    yield make_index
+
+    for index in indexes:
+        if index.watcher is not None:
+            index.watcher.close()
+
+def relative_paths(root, paths):
+    return [os.path.relpath(path, root) for path in paths]
+
+def test_regex_matches_regular_files_like_fd(root, make_index):
+    index = make_index(root)
+    index.scan()
+
+    # Symlink and directory are not files for fd --type f, lower case pattern is case insensitive.
+    assert relative_paths(root, index.search(root, "py", True, 100)) == ["a.py", "sub/c.py", "sub/deep/d.PY"]
+    assert relative_paths(root, index.search(root, "PY", True, 100)) == ["sub/deep/d.PY"]
+
+def test_glob_matches_every_entry(root, make_index):
+    index = make_index(root)
+    index.scan()
+
+    assert relative_paths(root, index.search(root, "*.py", False, 100)) == ["a.py", "link.py", "sub/c.py"]
+    assert relative_paths(root, index.search(root, "py*", False, 100)) == ["pydir"]
+
+def test_search_is_limited_to_dir_and_max_results(root, make_index):
+    index = make_index(root)
+    index.scan()
+
+    assert relative_paths(root, index.search(os.path.join(root, "sub"), "*", False, 100)) == ["sub/c.py", "sub/deep", "sub/deep/d.PY"]
+    assert len(index.search(root, "*", False, 2)) == 2
+
+def test_hidden_and_ignored_files(root, make_index):
+    index = make_index(root, show_hidden_file=True, ignore_rules=False)
+    index.scan()
+
+    assert relative_paths(root, index.search(root, r"\.py$", True, 100)) == [".hidden.py", "a.py", "ignored/e.py", "sub/c.py", "sub/deep/d.PY"]
+
+def test_invalid_regex_raises(root, make_index):
+    index = make_index(root)
+    index.scan()
+
+    with pytest.raises(re.error):
+        index.search(root, "(", True, 100)
+
+def test_saved_index_is_loaded(root, make_index):
+    index = make_index(root)
+    index.scan()
+
+    loaded_index = make_index(root)
+    loaded_index.load()
+
+    assert loaded_index.dirs == index.dirs
+    assert loaded_index.names == index.names
+    assert loaded_index.stale_reason == "loaded from disk"
+    assert loaded_index.search(root, "py", True, 100) == index.search(root, "py", True, 100)
+
+def test_saved_index_of_other_version_is_ignored(root, make_index, monkeypatch):
+    make_index(root).scan()
+
+    monkeypatch.setattr(eaf_file_manager_index, "INDEX_VERSION", eaf_file_manager_index.INDEX_VERSION + 1)
+    loaded_index = make_index(root)
+    loaded_index.load()
+
+    assert not loaded_index.is_ready()
+
+def test_corrupted_saved_index_is_ignored(root, make_index):
+    index = make_index(root)
+    index.scan()
+
+    with open(index.index_path, "wb") as f:
+        f.write(b"garbage")
+
+    loaded_index = make_index(root)
+    loaded_index.load()
+
+    assert not loaded_index.is_ready()
+
+def test_update_changed_directories(root, make_index):
+    index = make_index(root)
+    index.scan()
+
+    os.remove(os.path.join(root, "sub", "c.py"))
+    os.mkdir(os.path.join(root, "sub", "new"))
+    with open(os.path.join(root, "sub", "new", "f.py"), "w") as f:
+        f.write("f")
+    os.rename(os.path.join(root, "sub", "deep"), os.path.join(root, "moved"))
+    # File replaced by symlink is no longer found by regex.
+    os.remove(os.path.join(root, "a.py"))
+    os.symlink("b.txt", os.path.join(root, "a.py"))
+
+    index.update({"", "sub"})
+
+    assert relative_paths(root, index.search(root, "py", True, 100)) == ["moved/d.PY", "sub/new/f.py"]
+    assert relative_paths(root, index.search(root, "*.py", False, 100)) == ["a.py", "link.py", "sub/new/f.py"]
+    assert "sub/deep" not in index.dirs
+
+def test_watcher_reports_changed_directory(root, make_index):
+    index = make_index(root)
+    index.scan()
+
+    if not isinstance(index.watcher, eaf_file_manager_index.InotifyWatcher):
+        pytest.skip("inotify is not available")
+
+    with open(os.path.join(root, "sub", "deep", "g.py"), "w") as f:
+        f.write("g")
+
+    changed_dirs = set()
+    try:
+        while "sub/deep" not in changed_dirs:
+            changed_dirs.add(index.updates.get(timeout=5))
+    except queue.Empty:
+        pass
+
+    assert "sub/deep" in changed_dirs
+
+    index.update(changed_dirs)
+
+    assert relative_paths(root, index.search(root, "g.py", True, 100)) == ["sub/deep/g.py"]
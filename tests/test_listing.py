@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Tests of eaf_file_manager_listing.py.
+#
+# Run them from the file-manager directory:
+#
+#     python3 -m pytest tests
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from eaf_file_manager_listing import FileInfoSorter, FileListState, diff_file_infos, encode_file_infos
+
+NODE_DECODE_SCRIPT = """
+import fs from "fs";
+import { decodeFiles } from "%s";
+
+const payload = JSON.parse(fs.readFileSync(0, "utf8"));
+console.log(JSON.stringify(decodeFiles(payload)));
+"""
+
+def make_file_info(name, mtime):
+    return {"path": "/tmp/" + name, "name": name, "type": "file", "bytes": 0, "info": "",
+            "icon": "", "mtime": mtime, "ctime": mtime}
+
+def make_state(file_infos, marked_indexes=()):
+    state = FileListState()
+    state.reset(file_infos)
+    state.set_marks(list(marked_indexes), True)
+    return state
+
+def apply_diff(state, new_infos):
+    state.apply_delta(*diff_file_infos(state.files, new_infos))
+    return [file_info["name"] for file_info in state.files]
+
+def test_diff_of_same_listing_is_empty():
+    file_infos = [make_file_info(name, 1) for name in "abc"]
+
+    assert diff_file_infos(file_infos, [dict(file_info) for file_info in file_infos]) == ([], [], [])
+
+def test_diff_updates_changed_file_in_place():
+    state = make_state([make_file_info(name, 1) for name in "abc"], [1])
+    new_infos = [make_file_info("a", 1), dict(make_file_info("b", 1), bytes=10), make_file_info("c", 1)]
+
+    (removed_paths, updated_infos, inserted_infos) = diff_file_infos(state.files, new_infos)
+    assert (removed_paths, updated_infos, inserted_infos) == ([], [new_infos[1]], [])
+
+    state.apply_delta(removed_paths, updated_infos, inserted_infos)
+    assert state.files[1]["bytes"] == 10
+    assert [file_info["name"] for file_info in state.get_mark_files()] == ["b"]
+
+def test_diff_removes_and_inserts_files():
+    state = make_state([make_file_info(name, 1) for name in "abcd"], [0, 2])
+    new_infos = [make_file_info(name, 1) for name in "xaceyz"]
+
+    (removed_paths, updated_infos, inserted_infos) = diff_file_infos(state.files, new_infos)
+    assert removed_paths == ["/tmp/b", "/tmp/d"]
+    assert [index for (index, _) in inserted_infos] == [0, 3, 4, 5]
+
+    state.apply_delta(removed_paths, updated_infos, inserted_infos)
+    assert [file_info["name"] for file_info in state.files] == list("xaceyz")
+    assert [file_info["name"] for file_info in state.get_mark_files()] == ["a", "c"]
+    assert state.mark_number == 2
+
+def test_diff_of_reversed_listing_keeps_marks():
+    state = make_state([make_file_info(name, 1) for name in "abcde"], [0, 3])
+
+    assert apply_diff(state, [make_file_info(name, 1) for name in "edcba"]) == list("edcba")
+    assert [file_info["name"] for file_info in state.get_mark_files()] == ["d", "a"]
+
+def test_diff_to_empty_listing_and_back():
+    file_infos = [make_file_info(name, 1) for name in "abc"]
+    state = make_state(file_infos, [2])
+
+    assert apply_diff(state, []) == []
+    assert state.mark_number == 0
+    assert apply_diff(state, file_infos) == list("abc")
+
+def test_refresh_delta_keeps_mark_of_moved_file():
+    old_infos = FileInfoSorter([make_file_info(name, mtime) for (name, mtime) in
+                                [("a", 1), ("b", 2), ("c", 3), ("d", 4)]]).sort(("mtime",))
+    state = FileListState()
+    state.reset(old_infos)
+    state.set_marks([1], True)
+
+    # File "b" is modified, mtime sort moves it to end of list.
+    new_infos = FileInfoSorter([make_file_info(name, mtime) for (name, mtime) in
+                                [("a", 1), ("b", 5), ("c", 3), ("d", 4)]]).sort(("mtime",))
+    (removed_paths, updated_infos, inserted_infos) = diff_file_infos(state.files, new_infos)
+    assert "/tmp/b" in removed_paths
+
+    state.apply_delta(removed_paths, updated_infos, inserted_infos)
+
+    assert [file_info["name"] for file_info in state.files] == ["a", "c", "d", "b"]
+    assert [file_info["name"] for file_info in state.get_mark_files()] == ["b"]
+    assert state.mark_number == 1
+
+def test_encoded_file_infos_are_decoded_by_web_page():
+    node = shutil.which("node")
+    if node is None:
+        pytest.skip("node is not installed")
+
+    file_infos = [
+        dict(make_file_info("a.py", 1.5), path="/tmp/dir/a.py", extension="py", icon="python.svg", atime=2.5),
+        dict(make_file_info("sub", 3), path="/tmp/dir/sub", type="directory", extension="", icon="directory.svg", atime=4),
+        dict(make_file_info("b.py", 5), path="/tmp/dir/sub/b.py", extension="py", icon="python.svg", atime=6,
+             bytes=1024, info="1.0KB", mark="mark", line="12: def main():"),
+        dict(make_file_info("link", 7), path="/tmp/dir/link", type="symlink", extension="", icon="symlink.svg", atime=8),
+    ]
+    payload = encode_file_infos(file_infos, "/tmp/dir")
+    assert payload["prefix"] == "/tmp/dir/"
+
+    script = NODE_DECODE_SCRIPT % os.path.join(APP_DIR, "src", "fileInfos.js")
+    output = subprocess.run([node, "--input-type=module", "-e", script], input=json.dumps(payload),
+                            check=True, capture_output=True, text=True).stdout
+
+    keys = ["path", "name", "extension", "type", "bytes", "info", "icon", "mtime", "ctime", "atime"]
+    for (decoded_info, file_info) in zip(json.loads(output), file_infos):
+        assert {key: decoded_info[key] for key in keys} == {key: file_info[key] for key in keys}
+        assert decoded_info["mark"] == file_info.get("mark", "")
+        assert decoded_info["line"] == file_info.get("line", "")
+
+def test_encoded_file_infos_outside_directory_have_no_prefix():
+    file_infos = [dict(make_file_info("a", 1), extension="", atime=1), dict(make_file_info("b", 1), path="/other/b", extension="", atime=1)]
+
+    payload = encode_file_infos(file_infos, "/tmp")
+
+    assert payload["prefix"] == ""
+    assert [row[0] for row in payload["files"]] == ["/tmp/a", "/other/b"]
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Tests of eaf_file_manager_preview.py.
+#
+# Run them from the file-manager directory:
+#
+#     python3 -m pytest tests
+
+import html
+import os
+import re
+import struct
+import sys
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+import eaf_file_manager_preview as preview
+
+def html_text(html_content):
+    return html.unescape(re.sub("<[^>]+>", "", html_content))
+
+def make_tiff(byte_order):
+    # IFD0 has make, model and orientation, Exif IFD has exposure time and ISO.
+    header_format = byte_order + "2sHI"
+    order_mark = b"II" if byte_order == "<" else b"MM"
+
+    def make_ifd(entries, data_offset):
+        # Entry is (tag, type, count, value), bytes values longer than 4 bytes are stored after IFD.
+        ifd = struct.pack(byte_order + "H", len(entries))
+        data = b""
+        for (tag, field_type, count, value) in entries:
+            if isinstance(value, bytes) and len(value) > 4:
+                ifd += struct.pack(byte_order + "HHII", tag, field_type, count, data_offset + len(data))
+                data += value
+            elif isinstance(value, bytes):
+                ifd += struct.pack(byte_order + "HHI", tag, field_type, count) + value.ljust(4, b"\x00")
+            elif field_type == 3:
+                ifd += struct.pack(byte_order + "HHIHH", tag, field_type, count, value, 0)
+            else:
+                ifd += struct.pack(byte_order + "HHII", tag, field_type, count, value)
+        return ifd + struct.pack(byte_order + "I", 0) + data
+
+    ifd0_offset = 8
+    ifd0_size = 2 + 4 * 12 + 4
+    exif_offset = 256
+    ifd0 = make_ifd([
+        (0x010F, 2, 6, b"Canon\x00"),
+        (0x0110, 2, 4, b"EOS\x00"),
+        (0x0112, 3, 1, 6),
+        (0x8769, 4, 1, exif_offset),
+    ], ifd0_offset + ifd0_size)
+
+    exif_ifd_size = 2 + 2 * 12 + 4
+    exif_ifd = make_ifd([
+        (0x829A, 5, 1, struct.pack(byte_order + "II", 1, 250)),
+        (0x8827, 3, 1, 400),
+    ], exif_offset + exif_ifd_size)
+
+    tiff = struct.pack(header_format, order_mark, 42, ifd0_offset) + ifd0
+    return tiff.ljust(exif_offset, b"\x00") + exif_ifd
+
+def make_jpeg(tiff):
+    app0 = b"JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00"
+    app1 = b"Exif\x00\x00" + tiff
+    return (b"\xff\xd8" +
+            b"\xff\xe0" + struct.pack(">H", len(app0) + 2) + app0 +
+            b"\xff\xe1" + struct.pack(">H", len(app1) + 2) + app1 +
+            b"\xff\xda\x00\x02" + b"\x00" * 100 + b"\xff\xd9")
+
+EXIF_INFO = {"make": "Canon", "model": "EOS", "orientation": "6", "exposure_time": "0.004", "photographic_sensitivity": "400"}
+
+@pytest.mark.parametrize("byte_order", ["<", ">"])
+def test_parse_tiff_exif(byte_order):
+    assert preview.parse_tiff_exif(make_tiff(byte_order)) == EXIF_INFO
+
+def test_parse_tiff_exif_with_ifd_loop():
+    # Exif IFD pointer points back to IFD0.
+    tiff = bytearray(make_tiff("<"))
+    pointer_offset = 8 + 2 + 3 * 12 + 8
+    tiff[pointer_offset:pointer_offset + 4] = struct.pack("<I", 8)
+
+    assert preview.parse_tiff_exif(bytes(tiff)) == {"make": "Canon", "model": "EOS", "orientation": "6"}
+
+def test_parse_truncated_tiff_exif():
+    # Only two entries of IFD0 are left, value of make is cut off.
+    assert preview.parse_tiff_exif(make_tiff("<")[:40]) == {"model": "EOS"}
+    assert preview.parse_tiff_exif(b"not tiff") == {}
+
+def test_read_jpeg_exif(tmp_path):
+    file_path = tmp_path / "a.jpg"
+    file_path.write_bytes(make_jpeg(make_tiff(">")))
+
+    assert preview.read_file_exif(str(file_path)) == EXIF_INFO
+
+def test_read_tiff_exif(tmp_path):
+    file_path = tmp_path / "a.tif"
+    file_path.write_bytes(make_tiff("<"))
+
+    assert preview.read_file_exif(str(file_path)) == EXIF_INFO
+
+def test_read_jpeg_without_exif(tmp_path):
+    file_path = tmp_path / "a.jpg"
+    file_path.write_bytes(b"\xff\xd8\xff\xda\x00\x02" + b"\x00" * 100 + b"\xff\xd9")
+
+    assert preview.read_file_exif(str(file_path)) == {}
+
+def test_highlight_single_line_head_larger_than_highlight_size(tmp_path):
+    # Minified bundle, no newline in highlighted window.
+    content = "ABCDEF" + "x" * (preview.CODE_PREVIEW_HIGHLIGHT_SIZE + 1024)
+    file_path = tmp_path / "bundle.min.js"
+    file_path.write_text(content)
+
+    text = html_text(preview.highlight_file_head(str(file_path), "monokai"))
+
+    assert text.startswith("ABCDEF")
+    assert content in text
+
+def test_highlight_keeps_content_across_cut_point(tmp_path):
+    # Long lines, so highlighted window ends before line limit of head.
+    line = "value = '{}'\n".format("x" * 100)
+    content = "\n\n" + line * (preview.CODE_PREVIEW_HIGHLIGHT_SIZE // len(line) * 2)
+    file_path = tmp_path / "values.py"
+    file_path.write_text(content)
+
+    text = html_text(preview.highlight_file_head(str(file_path), "monokai"))
+
+    assert text.startswith(content)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Tests of eaf_file_manager_search.py.
+#
+# Run them from the file-manager directory:
+#
+#     python3 -m pytest tests
+
+import os
+import sys
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from eaf_file_manager_search import IgnoreRules, ParallelWalker, is_ignored
+
+def make_rules(lines, base=""):
+    ignore_rules = IgnoreRules(base)
+    for line in lines:
+        ignore_rules.add(line)
+    return ignore_rules
+
+@pytest.mark.parametrize(("lines", "path", "is_dir", "result"), [
+    (["*.log"], "a.log", False, True),
+    (["*.log"], "sub/deep/a.log", False, True),
+    (["*.log"], "a.log.txt", False, None),
+    (["build/"], "build", True, True),
+    (["build/"], "build", False, None),
+    (["/build"], "sub/build", True, None),
+    (["doc/*.txt"], "doc/a.txt", False, True),
+    (["doc/*.txt"], "doc/sub/a.txt", False, None),
+    (["**/cache"], "a/b/cache", True, True),
+    (["logs/**"], "logs/a/b.log", False, True),
+    (["a?.txt"], "ab.txt", False, True),
+    (["a?.txt"], "a/.txt", False, None),
+    (["[!a]b"], "cb", False, True),
+    (["[!a]b"], "ab", False, None),
+    (["*.log", "!keep.log"], "keep.log", False, False),
+    (["!keep.log", "*.log"], "keep.log", False, True),
+    (["\\#notes"], "#notes", False, True),
+    (["# comment", "", "   "], "# comment", False, None),
+    (["name.txt   "], "name.txt", False, True),
+])
+def test_ignore_rules(lines, path, is_dir, result):
+    assert make_rules(lines).match(path, is_dir) == result
+
+def test_deeper_ignore_rules_override_parent_rules():
+    ignore_rules = (make_rules(["*.log"]), make_rules(["!keep.log"], "sub"))
+
+    assert is_ignored(ignore_rules, "sub/keep.log", False) is False
+    assert is_ignored(ignore_rules, "keep.log", False) is True
+    assert is_ignored(ignore_rules, "sub/a.txt", False) is False
+
+def test_load_ignore_files(tmp_path):
+    (tmp_path / ".gitignore").write_text("*.log\n")
+    (tmp_path / ".ignore").write_text("!keep.log\n")
+
+    ignore_rules = IgnoreRules.load(str(tmp_path), "", {".gitignore", ".ignore"})
+
+    assert ignore_rules.match("a.log", False) is True
+    assert ignore_rules.match("keep.log", False) is False
+    assert IgnoreRules.load(str(tmp_path), "", {"a.txt"}) is None
+
+@pytest.fixture
+def root(tmp_path):
+    for path in ["a.py", "b.txt", ".hidden.py", "sub/c.py", "sub/deep/d.py", "build/e.py", ".git/f.py"]:
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text(path)
+    (tmp_path / ".gitignore").write_text("build/\n")
+    (tmp_path / "sub" / ".gitignore").write_text("deep/\n")
+
+    return tmp_path
+
+def walk_paths(root, pattern, **options):
+    paths = []
+    for batch in ParallelWalker(str(root), pattern, **options).walk():
+        paths.extend(os.path.relpath(entry.path, root) for entry in batch)
+    return sorted(paths)
+
+def test_walker_matches_glob_in_all_directories(root):
+    assert walk_paths(root, "*.py") == [".git/f.py", ".hidden.py", "a.py", "build/e.py", "sub/c.py", "sub/deep/d.py"]
+    assert walk_paths(root, "sub") == ["sub"]
+
+def test_walker_skips_hidden_and_ignored_files(root):
+    assert walk_paths(root, "*.py", show_hidden_file=False, ignore_rules=True) == ["a.py", "sub/c.py"]
+    assert walk_paths(root, "*.py", show_hidden_file=True, ignore_rules=True) == [".hidden.py", "a.py", "sub/c.py"]
+
+def test_walker_with_one_worker(root):
+    assert walk_paths(root, "*.txt", workers=1) == ["b.txt"]
+
+def test_stopped_walker_finishes(root):
+    walker = ParallelWalker(str(root), "*")
+    for _ in walker.walk():
+        walker.stop()
+
+    assert walker.stopped